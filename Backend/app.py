@@ -1,22 +1,76 @@
-from flask import Flask, request, redirect, url_for, jsonify, session
+from flask import (
+    Flask,
+    Response,
+    g,
+    has_request_context,
+    request,
+    url_for,
+    jsonify,
+    session,
+    stream_with_context,
+)
 from flask_cors import CORS
-import numpy as np
-import tensorflow as tf
-import cv2
 import os
 import json
-from pymongo import MongoClient
 from bson import ObjectId
-import bcrypt
-from tensorflow.keras.applications.efficientnet import (
-    preprocess_input as efficientnet_preprocess,
-)
+from pymongo.errors import DuplicateKeyError
 from werkzeug.utils import secure_filename
 import base64
+import io
+import contextlib
 import traceback
 import datetime
 import time
-import hashlib
+from urllib.parse import unquote, urlsplit
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from database import (
+    DATABASE_NAME,
+    MONGO_URI,
+    ensure_indexes,
+    get_db,
+    pool_metrics,
+    verify_index_usage,
+)
+from identity import identity_cache, resolve_user_id, session_user_dict
+from metrics import histogram_samples, metrics
+from model_registry import BackendUnavailable, ModelRegistry
+from overlays import (
+    OVERLAY_CACHE_MAX_AGE,
+    OVERLAY_DEFAULT_SIZE,
+    OVERLAY_FORMATS,
+    OverlayCache,
+    overlay_etag,
+    pack_heatmap,
+    parse_overlay_request,
+    unpack_heatmap,
+    render_overlay,
+    sign_result_id,
+    verify_result_signature,
+)
+from passwords import PasswordHasher, PasswordQueueFull, hash_password
+from pagination import (
+    RESULTS_SORT,
+    InvalidQuery,
+    build_results_query,
+    encode_cursor,
+)
+from inference import InferenceBatcher
+from preprocessing import preprocess_chest_xray_for_efficientnet
+from profiling import SERVER_TIMING_ENABLED, RequestTimings, SamplingProfiler
+from result_cache import ResultCache, content_hash
+from result_writer import RESULT_WRITE_READ_WAIT, ResultWriter
+from uploads import (
+    ANALYSIS_DECODE_SIZE,
+    MAX_UPLOAD_BYTES,
+    UploadRejected,
+    UploadStore,
+    UploadWriter,
+    decode_file,
+    decode_image,
+    read_upload,
+    upload_metadata,
+)
 
 app = Flask(__name__)
 app.secret_key = os.environ.get("SECRET_KEY", "supersecretkey")
@@ -27,7 +81,7 @@ CORS(
     resources={r"/api/*": {"origins": "*"}},  # Allow all origins for debugging
     supports_credentials=True,
     allow_headers=["Content-Type", "Authorization"],
-    expose_headers=["Content-Type", "Authorization"],
+    expose_headers=["Content-Type", "Authorization", "Server-Timing"],
     methods=["GET", "POST", "OPTIONS", "PUT", "DELETE"],
 )
 
@@ -39,18 +93,120 @@ UPLOAD_FOLDER = "static/uploads"
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+# Uploads are decoded from memory and written to disk in the background,
+# named after their content so identical files are stored once
+upload_writer = UploadWriter()
+upload_store = UploadStore(UPLOAD_FOLDER, upload_writer)
+
+# Rendered Grad-CAM overlays, kept outside static/ so access is checked
+overlay_cache = OverlayCache()
+
+# ----------------------------
+# Metrics
+# ----------------------------
+HTTP_REQUEST_SECONDS = metrics.histogram(
+    "http_request_duration_seconds",
+    "Time to produce a response (streamed bodies excluded)",
+    ["endpoint", "method"],
+)
+HTTP_REQUESTS = metrics.counter(
+    "http_requests",
+    "Responses by endpoint and status",
+    ["endpoint", "method", "status"],
+)
+HTTP_ERRORS = metrics.counter(
+    "http_errors", "4xx and 5xx responses by endpoint", ["endpoint", "kind"]
+)
+UPLOAD_STAGE_SECONDS = metrics.histogram(
+    "upload_stage_seconds", "Time spent in each stage of the upload pipeline", ["stage"]
+)
+
+
+# Stage breakdown sent to clients in a Server-Timing header, and optional
+# sampled profiles of whole requests
+request_profiler = SamplingProfiler()
+
+
+def is_api_request():
+    return request.path.startswith("/api/")
+
+
+@contextlib.contextmanager
+def timed_stage(stage):
+    """Time an upload pipeline stage for /metrics and the Server-Timing header"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        UPLOAD_STAGE_SECONDS.observe(elapsed, stage=stage)
+        # Batch files are analyzed on worker threads, outside the request
+        if has_request_context():
+            timings = g.get("request_timings")
+            if timings is not None:
+                timings.add(stage, elapsed)
+
+
+@app.before_request
+def start_request_timer():
+    api_request = is_api_request()
+    if metrics.enabled or (api_request and SERVER_TIMING_ENABLED):
+        g.request_started = time.perf_counter()
+    if api_request and SERVER_TIMING_ENABLED:
+        g.request_timings = RequestTimings()
+    if api_request and request_profiler.enabled:
+        g.request_profile = request_profiler.start()
+        if g.request_profile is not None:
+            g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop("request_started", None)
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+
+    profile = g.pop("request_profile", None)
+    if profile is not None:
+        path = request_profiler.finish(profile, elapsed, f"{request.method} {endpoint}")
+        if path is not None:
+            print(f"Saved profile of {request.method} {request.path} to {path}")
+
+    timings = g.pop("request_timings", None)
+    if timings is not None:
+        response.headers["Server-Timing"] = timings.header(elapsed)
+
+    if metrics.enabled:
+        HTTP_REQUEST_SECONDS.observe(elapsed, endpoint=endpoint, method=request.method)
+        HTTP_REQUESTS.inc(
+            endpoint=endpoint, method=request.method, status=response.status_code
+        )
+        if response.status_code >= 400:
+            kind = "server" if response.status_code >= 500 else "client"
+            HTTP_ERRORS.inc(endpoint=endpoint, kind=kind)
+    return response
+
+
+@app.teardown_request
+def stop_request_profile(exc):
+    # after_request is skipped when a response could not be produced at all;
+    # the profiler must still be released for the next request
+    profile = g.pop("request_profile", None)
+    if profile is not None:
+        elapsed = time.perf_counter() - g.get("request_started", time.perf_counter())
+        request_profiler.finish(profile, elapsed, f"{request.method} aborted")
+
+
 # ----------------------------
 # MongoDB Database Setup
 # ----------------------------
-MONGO_URI = os.environ.get("MONGO_URI", "mongodb://localhost:27017/")
-DATABASE_NAME = os.environ.get("DATABASE_NAME", "mediscan")
 
 
 def get_db_connection():
-    """Get a connection to the MongoDB database"""
-    client = MongoClient(MONGO_URI)
-    db = client[DATABASE_NAME]
-    return db
+    """Get the MongoDB database from the shared, pooled client"""
+    return get_db()
 
 
 def init_db():
@@ -73,12 +229,26 @@ def init_db():
         else:
             print("Results collection already exists")
 
+        # Make sure login and result history lookups never scan collections
+        ensure_indexes(db)
+        try:
+            for query, check in verify_index_usage(db).items():
+                if check["ok"]:
+                    print(f"Query '{query}' uses index {check['indexes']}")
+                else:
+                    print(
+                        f"WARNING: query '{query}' is not index-backed: "
+                        f"{check['stages']}"
+                    )
+        except Exception as e:
+            print(f"Could not verify query plans: {str(e)}")
+
         # Check if test user exists
         test_user = db.users.find_one({"email": "test@gmail.com"})
 
         if not test_user:
             # Hash the password
-            hashed_password = bcrypt.hashpw("test".encode("utf-8"), bcrypt.gensalt())
+            hashed_password = hash_password("test")
 
             # Add test user with hashed password
             db.users.insert_one(
@@ -109,83 +279,291 @@ def init_db():
 init_db()
 
 # ----------------------------
-# Utility Functions
+# Model Setup
 # ----------------------------
+model_registry = ModelRegistry()
 
+try:
+    model_registry.load()
+except Exception as e:
+    print(f"Model loading error: {str(e)}")
+    traceback.print_exc()
 
-def preprocess_chest_xray_for_efficientnet(image):
-    if len(image.shape) == 3 and image.shape[2] == 3:
-        image_gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-    else:
-        image_gray = image
+model_registry.start_watcher()
 
-    image_norm = image_gray.astype("float32")
-    image_norm = (image_norm - np.min(image_norm)) / (
-        np.max(image_norm) - np.min(image_norm) + 1e-8
-    )
-    image_uint8 = (image_norm * 255).astype("uint8")
+inference_batcher = InferenceBatcher(model_registry)
 
-    denoised = cv2.GaussianBlur(image_uint8, (3, 3), 0)
-    denoised = cv2.medianBlur(denoised, 3)
-    clahe = cv2.createCLAHE(clipLimit=0.03, tileGridSize=(8, 8))
-    contrast_enhanced = clahe.apply(denoised)
+# Results of identical images are reused until the model changes
+result_cache = ResultCache(get_db_connection)
 
-    gamma = 0.7
-    contrast_float = contrast_enhanced.astype("float32") / 255.0
-    gamma_corrected = np.power(contrast_float, gamma)
-    final_image = (gamma_corrected * 255).astype(np.uint8)
+# Results are stored in batches from a background thread; their ids are
+# assigned up front so requests don't wait for MongoDB
+result_writer = ResultWriter(get_db_connection)
+
+# ----------------------------
+# Batch Upload Settings
+# ----------------------------
+# Shared pool for decoding and preprocessing the files of batch uploads
+BATCH_UPLOAD_WORKERS = int(os.environ.get("BATCH_UPLOAD_WORKERS", os.cpu_count() or 4))
+# Files accepted in one /api/upload/batch request
+BATCH_UPLOAD_MAX_FILES = int(os.environ.get("BATCH_UPLOAD_MAX_FILES", "32"))
+# Largest /api/upload/batch request body
+BATCH_UPLOAD_MAX_BYTES = int(
+    os.environ.get("BATCH_UPLOAD_MAX_BYTES", str(200 * 1024 * 1024))
+)
+# Files of one batch read into memory and queued on the pool at once
+BATCH_UPLOAD_IN_FLIGHT = int(
+    os.environ.get("BATCH_UPLOAD_IN_FLIGHT", str(2 * BATCH_UPLOAD_WORKERS))
+)
+batch_executor = ThreadPoolExecutor(
+    max_workers=BATCH_UPLOAD_WORKERS, thread_name_prefix="batch-upload"
+)
+
+# ----------------------------
+# Utility Functions
+# ----------------------------
 
-    final_image_rgb = np.stack((final_image,) * 3, axis=-1)
-    final_image_rgb = cv2.resize(final_image_rgb, (224, 224))
-    efficientnet_ready = efficientnet_preprocess(final_image_rgb.astype("float32"))
 
-    return efficientnet_ready, final_image_rgb
+def analyze_image(image, use_gradcam, backend=None):
+    """Preprocess a decoded image and run it through the inference batcher
+
+    Returns the prediction, the predicted class, the packed low-resolution
+    Grad-CAM heatmap (or None when Grad-CAM was not requested) and the
+    version of the model used.
+    """
+    with timed_stage("preprocess"):
+        preprocessed_input, _ = preprocess_chest_xray_for_efficientnet(image)
+    # Queue wait plus the batched model call, which includes Grad-CAM
+    with timed_stage("gradcam" if use_gradcam else "predict"):
+        prediction, heatmap, model_version = inference_batcher.predict(
+            preprocessed_input, with_gradcam=use_gradcam, backend=backend
+        )
+    packed_heatmap = pack_heatmap(heatmap) if heatmap is not None else None
 
+    predicted_class = "PNEUMONIA" if prediction > 0.5 else "NORMAL"
+    return prediction, predicted_class, packed_heatmap, model_version
+
+
+def analyze_upload(data, use_gradcam, backend=None):
+    """Analyze uploaded bytes, reusing a cached result for identical images
+
+    Returns a dict with the image hash, prediction, predicted class, packed
+    Grad-CAM heatmap (None unless requested), model version, whether the
+    result came from the cache, the grayscale image it was analysed at
+    (None on a cache hit) and the header fields of a DICOM upload.
+    Raises UploadRejected if the bytes are not an image.
+    """
+    dicom = upload_metadata(data)
+    with timed_stage("hash"):
+        image_hash = content_hash(data)
+    model_version = model_registry.get().for_backend(backend).version
+    with timed_stage("cache_lookup"):
+        cached = result_cache.get(image_hash, model_version, with_gradcam=use_gradcam)
+    if cached is not None:
+        return {
+            "image_hash": image_hash,
+            "prediction": cached["prediction"],
+            "predicted_class": cached["predicted_class"],
+            "heatmap": cached["heatmap"] if use_gradcam else None,
+            "model_version": model_version,
+            "cache_hit": True,
+            "image": None,
+            "dicom": dicom,
+        }
 
-def make_gradcam_heatmap(img_array, model, last_conv_layer_name="top_conv"):
-    grad_model = tf.keras.models.Model(
-        [model.inputs], [model.get_layer(last_conv_layer_name).output, model.output]
+    with timed_stage("decode"):
+        image = decode_image(data, target_size=ANALYSIS_DECODE_SIZE, grayscale=True)
+    prediction, predicted_class, heatmap, model_version = analyze_image(
+        image, use_gradcam, backend
+    )
+    with timed_stage("cache_store"):
+        result_cache.put(
+            image_hash, model_version, prediction, predicted_class, heatmap
+        )
+    return {
+        "image_hash": image_hash,
+        "prediction": prediction,
+        "predicted_class": predicted_class,
+        "heatmap": heatmap,
+        "model_version": model_version,
+        "cache_hit": False,
+        "image": image,
+        "dicom": dicom,
+    }
+
+
+def overlay_url(result_id, **params):
+    """Signed URL of a result's Grad-CAM overlay
+
+    The signature lets the browser load the image directly from Flask, where
+    it has no session cookie.
+    """
+    return url_for(
+        "get_result_overlay",
+        result_id=str(result_id),
+        sig=sign_result_id(app.secret_key, result_id),
+        _external=True,
+        **params,
     )
-    with tf.GradientTape() as tape:
-        last_conv_layer_output, preds = grad_model(img_array)
-        pred_output = preds[0]
 
-    grads = tape.gradient(pred_output, last_conv_layer_output)
-    pooled_grads = tf.reduce_mean(grads, axis=(0, 1, 2))
-    last_conv_layer_output = last_conv_layer_output[0]
-    heatmap = last_conv_layer_output @ pooled_grads[..., tf.newaxis]
-    heatmap = tf.squeeze(heatmap)
-    heatmap = tf.maximum(heatmap, 0) / tf.math.reduce_max(heatmap)
-    return heatmap.numpy()
 
+def gradcam_request_url(result_id):
+    """Signed URL of the endpoint that computes a result's Grad-CAM on demand
 
-def overlay_heatmap_on_image(heatmap, original_img):
-    heatmap = cv2.resize(heatmap, (original_img.shape[1], original_img.shape[0]))
-    heatmap_uint8 = np.uint8(255 * heatmap)
-    heatmap_colored = cv2.applyColorMap(heatmap_uint8, cv2.COLORMAP_JET)
-    superimposed_img = cv2.addWeighted(original_img, 0.6, heatmap_colored, 0.4, 0)
-    return superimposed_img
+    Results uploaded without a session are only reachable through it.
+    """
+    return url_for(
+        "get_result_gradcam",
+        result_id=str(result_id),
+        sig=sign_result_id(app.secret_key, result_id),
+        _external=True,
+    )
+
+
+def upload_url(storage_key):
+    return url_for("static", filename=f"uploads/{storage_key}", _external=True)
+
+
+def thumbnail_urls(storage_key):
+    """{size: URL} of the WebP previews of an upload"""
+    return {
+        str(size): upload_url(key)
+        for size, key in upload_store.thumbnail_keys(storage_key).items()
+    }
+
+
+def store_upload(data, analysis):
+    """Store uploaded bytes and their thumbnails; return the storage key"""
+    storage_key = upload_store.put(data, analysis["image_hash"])
+    if upload_store.missing_thumbnails(storage_key):
+        thumbnail_size = max(upload_store.thumbnail_sizes)
+        image = analysis["image"]
+        if image is None or thumbnail_size > ANALYSIS_DECODE_SIZE:
+            # A cached result skipped the decode; only needed once per image
+            with timed_stage("decode"):
+                image = decode_image(data, target_size=thumbnail_size, grayscale=True)
+        upload_store.put_thumbnails_async(storage_key, image)
+    return storage_key
+
+
+def result_image_path(result):
+    if result.get("storage_key"):
+        return upload_store.path(result["storage_key"])
+    # Stored flat under the original name before scripts/migrate_uploads.py;
+    # the oldest results only record that name at the end of image_path
+    filename = result.get("filename")
+    if not filename and result.get("image_path"):
+        filename = unquote(urlsplit(result["image_path"]).path.rsplit("/", 1)[-1])
+    if not filename:
+        return None
+    upload_folder = app.config["UPLOAD_FOLDER"]
+    path = os.path.join(upload_folder, filename)
+    # The name comes from the database, so it may not lead out of the folder
+    if os.path.dirname(os.path.realpath(path)) != os.path.realpath(upload_folder):
+        return None
+    return path
+
+
+def load_result_image(result, target_size, grayscale=False):
+    """Decode a result's upload shrunk to ``target_size``, or None if it is gone"""
+    filepath = result_image_path(result)
+    if filepath is None:
+        return None
+    try:
+        data = upload_writer.pending(filepath)
+        if data is not None:
+            return decode_image(data, target_size=target_size, grayscale=grayscale)
+        # Stored DICOM pixel data is memory-mapped rather than read whole
+        return decode_file(filepath, target_size=target_size, grayscale=grayscale)
+    except (OSError, UploadRejected):
+        return None
+
+
+def ensure_result_heatmap(db, result):
+    """Return the result's packed heatmap, computing and storing it if missing
+
+    Returns None when the original image is no longer available.
+    """
+    packed = result.get("gradcam_heatmap")
+    if packed is not None:
+        return packed
+
+    image = load_result_image(result, ANALYSIS_DECODE_SIZE, grayscale=True)
+    if image is None:
+        return None
+
+    preprocessed_input, _ = preprocess_chest_xray_for_efficientnet(image)
+    heatmap = inference_batcher.predict(preprocessed_input, with_gradcam=True).heatmap
+    packed = pack_heatmap(heatmap)
+    # The result may still be queued; the database copy is updated too in
+    # case it is being inserted right now
+    result_writer.update_pending(result["_id"], {"gradcam_heatmap": packed})
+    db.results.update_one({"_id": result["_id"]}, {"$set": {"gradcam_heatmap": packed}})
+    result["gradcam_heatmap"] = packed
+    return packed
+
+
+def find_result(db, result_oid):
+    """Return a result document, including one still waiting to be stored"""
+    pending = result_writer.get(result_oid)
+    if pending is not None:
+        return dict(pending)
+    return db.results.find_one({"_id": result_oid})
+
+
+def check_result_access(db, result, signature=None):
+    """Return an error response if the caller may not see this result"""
+    # Whoever holds a URL signed for a result may see it
+    if verify_result_signature(app.secret_key, result["_id"], signature):
+        return None
+    # Results uploaded without a session have no owner to check against, and
+    # their ids are guessable; they look missing rather than forbidden
+    if result.get("user_id") is None:
+        return jsonify({"success": False, "message": "Result not found"}), 404
+    # Otherwise only the owner may see it
+    if not session.get("user"):
+        return jsonify({"success": False, "message": "Not authenticated"}), 401
+    if resolve_user_id(session, db) != result["user_id"]:
+        return jsonify({"success": False, "message": "Result not found"}), 404
+    return None
+
+
+def get_overlay_bytes(db, result, size, fmt):
+    """Return (bytes, etag) of a rendered overlay, using the disk cache"""
+    packed = ensure_result_heatmap(db, result)
+    if packed is None:
+        return None, None
+
+    etag = overlay_etag(result["_id"], packed, size, fmt)
+    data = overlay_cache.get(result["_id"], etag, fmt)
+    if data is None:
+        # Decoded straight at the requested display size
+        with timed_stage("decode"):
+            image_rgb = load_result_image(result, size)
+        if image_rgb is None:
+            return None, None
+        with timed_stage("overlay_render"):
+            data = render_overlay(unpack_heatmap(packed), image_rgb, size, fmt)
+        overlay_cache.put(result["_id"], etag, fmt, data)
+    return data, etag
 
 
 # ----------------------------
 # Password Management Functions
 # ----------------------------
 
+# bcrypt runs on its own bounded pool so a login burst can't take every core
+password_hasher = PasswordHasher()
 
-def hash_password(password):
-    """Hash a password using bcrypt"""
-    if isinstance(password, str):
-        password = password.encode("utf-8")
-    return bcrypt.hashpw(password, bcrypt.gensalt())
 
-
-def check_password(password, hashed_password):
-    """Verify a password against a hash"""
-    if isinstance(password, str):
-        password = password.encode("utf-8")
-    if isinstance(hashed_password, bytes):
-        return bcrypt.checkpw(password, hashed_password)
-    return False
+def password_busy_response():
+    """503 returned when the password pool is saturated"""
+    response = jsonify(
+        {"success": False, "message": "Server busy, please try again shortly"}
+    )
+    response.status_code = 503
+    response.headers["Retry-After"] = "1"
+    return response
 
 
 # ----------------------------
@@ -209,6 +587,8 @@ def health_check():
                 "database_type": "MongoDB",
                 "database_uri": MONGO_URI,
                 "database_name": DATABASE_NAME,
+                "model": model_registry.info(),
+                "connection_pool": pool_metrics.snapshot(),
             }
         )
     except Exception as e:
@@ -220,75 +600,519 @@ def health_check():
         )
 
 
+@app.route("/api/db/writer", methods=["GET"])
+def result_writer_stats():
+    return jsonify(result_writer.stats())
+
+
+@app.route("/api/db/pool", methods=["GET"])
+def db_pool_stats():
+    return jsonify(pool_metrics.snapshot())
+
+
+@app.route("/api/model", methods=["GET"])
+def model_info():
+    return jsonify(model_registry.info())
+
+
+@app.route("/api/inference/stats", methods=["GET"])
+def inference_stats():
+    return jsonify(inference_batcher.stats())
+
+
+@app.route("/api/auth/stats", methods=["GET"])
+def auth_stats():
+    return jsonify(password_hasher.stats())
+
+
+@app.route("/api/profiling/stats", methods=["GET"])
+def profiling_stats():
+    return jsonify(request_profiler.stats())
+
+
+@app.route("/api/cache/stats", methods=["GET"])
+def cache_stats():
+    return jsonify(result_cache.stats())
+
+
+def collect_component_metrics():
+    """Metrics read from the components' own statistics at scrape time"""
+    cache = result_cache.stats()
+    inference = inference_batcher.stats()
+    passwords = password_hasher.stats()
+    pool = pool_metrics.snapshot()
+    writer = result_writer.stats()
+    batch_sizes = {int(size): n for size, n in inference["batch_sizes"].items()}
+    return [
+        (
+            "result_cache_lookups",
+            "counter",
+            "Result cache lookups by outcome",
+            [
+                ("_total", {"result": "memory_hit"}, cache["hits"] - cache["db_hits"]),
+                ("_total", {"result": "db_hit"}, cache["db_hits"]),
+                ("_total", {"result": "miss"}, cache["misses"]),
+            ],
+        ),
+        (
+            "result_cache_memory_bytes",
+            "gauge",
+            "Bytes held by the in-process result cache",
+            [("", {}, cache["memory"]["bytes"])],
+        ),
+        (
+            "inference_requests",
+            "counter",
+            "Images run through the inference batcher",
+            [("_total", {}, inference["requests"])],
+        ),
+        (
+            "inference_batch_size",
+            "histogram",
+            "Images per batched model call",
+            histogram_samples(batch_sizes, (1, 2, 4, 8, 16, 32, 64)),
+        ),
+        (
+            "inference_queue_depth",
+            "gauge",
+            "Images waiting for a batch",
+            [("", {}, inference["queue_depth"])],
+        ),
+        (
+            "password_hash_queue_depth",
+            "gauge",
+            "bcrypt operations waiting for a worker",
+            [("", {}, passwords["queue_depth"])],
+        ),
+        (
+            "password_hash_operations",
+            "counter",
+            "bcrypt operations by outcome",
+            [
+                ("_total", {"result": "completed"}, passwords["completed"]),
+                ("_total", {"result": "rejected"}, passwords["rejected"]),
+            ],
+        ),
+        (
+            "result_writes_pending",
+            "gauge",
+            "Results waiting to be stored in MongoDB",
+            [("", {}, writer["queue_depth"])],
+        ),
+        (
+            "result_write_oldest_pending_seconds",
+            "gauge",
+            "Age of the oldest result not yet stored",
+            [("", {}, writer["oldest_pending_ms"] / 1000.0)],
+        ),
+        (
+            "result_writes",
+            "counter",
+            "Results by write outcome",
+            [
+                ("_total", {"result": "stored"}, writer["written"]),
+                ("_total", {"result": "dropped"}, writer["dropped"]),
+                ("_total", {"result": "rejected"}, writer["rejected"]),
+            ],
+        ),
+        (
+            "result_write_retries",
+            "counter",
+            "insert_many attempts retried after a transient error",
+            [("_total", {}, writer["retries"])],
+        ),
+        (
+            "overlay_cache_bytes",
+            "gauge",
+            "Bytes of rendered overlays cached on disk",
+            [("", {}, overlay_cache.stats()["bytes"])],
+        ),
+        (
+            "upload_writes_pending",
+            "gauge",
+            "Uploads waiting to be written to disk",
+            [("", {}, upload_writer.pending_count())],
+        ),
+        (
+            "upload_deduplicated",
+            "counter",
+            "Uploads whose bytes were already stored",
+            [("_total", {}, upload_store.deduplicated)],
+        ),
+        (
+            "mongo_connections",
+            "gauge",
+            "MongoDB pool connections by state",
+            [
+                ("", {"state": "open"}, pool["connections_open"]),
+                ("", {"state": "checked_out"}, pool["checked_out"]),
+            ],
+        ),
+        (
+            "mongo_checkout_failures",
+            "counter",
+            "MongoDB pool checkouts that failed or timed out",
+            [("_total", {}, pool["checkout_failures"])],
+        ),
+    ]
+
+
+metrics.add_collector(collect_component_metrics)
+
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    if not metrics.enabled:
+        return jsonify({"error": "Metrics are disabled"}), 404
+    return Response(
+        metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
 @app.route("/api/upload", methods=["POST"])
 def index():
+    # Refuse oversized bodies before the multipart data is even parsed
+    if request.content_length and request.content_length > MAX_UPLOAD_BYTES + 65536:
+        return jsonify({"error": "File is too large"}), 413
+
     file = request.files.get("xray")
     if not file:
         return jsonify({"error": "No file uploaded"}), 400
 
     filename = secure_filename(file.filename)
-    filepath = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-    file.save(filepath)
-
-    image = cv2.imread(filepath)
-    image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-    preprocessed_input, _ = preprocess_chest_xray_for_efficientnet(image_rgb)
-    img_input = np.expand_dims(preprocessed_input, axis=0).astype(np.float32)
 
     use_gradcam = request.form.get("use_gradcam") == "true"
 
-    tf_model = tf.keras.models.load_model("pneumonia_detection.keras")
-    prediction = float(tf_model.predict(img_input)[0][0])
-    base_model = tf_model.layers[0]
-    heatmap = make_gradcam_heatmap(img_input, base_model)
-    gradcam_img = overlay_heatmap_on_image(heatmap, image_rgb)
-    _, buffer = cv2.imencode(".jpg", gradcam_img)
-    gradcam_base64 = base64.b64encode(buffer).decode("utf-8")
+    # Optional inference backend override, e.g. "tflite-int8"
+    backend = request.form.get("backend") or None
+    try:
+        model_registry.get().for_backend(backend)
+    except BackendUnavailable as e:
+        return jsonify({"error": str(e)}), 400
 
-    predicted_class = "PNEUMONIA" if prediction > 0.5 else "NORMAL"
+    # Triage only needs the score; without use_gradcam the heatmap can be
+    # requested later from /api/results/<id>/gradcam.
+    try:
+        with timed_stage("read"):
+            data = read_upload(file)
+        analysis = analyze_upload(data, use_gradcam, backend)
+    except UploadRejected as e:
+        return jsonify({"error": e.message}), e.status_code
+
+    prediction = analysis["prediction"]
+    predicted_class = analysis["predicted_class"]
+    model_version = analysis["model_version"]
+
+    # The result no longer depends on the file, so the disk write happens
+    # off the request path.
+    storage_key = store_upload(data, analysis)
+    image_path = upload_url(storage_key)
 
     # Store the result in MongoDB
     try:
         db = get_db_connection()
 
-        user_id = None
-        if "user" in session and "email" in session["user"]:
-            user = db.users.find_one({"email": session["user"]["email"]})
-            if user:
-                user_id = user["_id"]
+        user_id = resolve_user_id(session, db)
 
-        result = db.results.insert_one(
-            {
-                "user_id": user_id,
-                "prediction": prediction,
-                "predicted_class": predicted_class,
-                "image_path": url_for(
-                    "static", filename=f"uploads/{filename}", _external=True
-                ),
-                "created_at": datetime.datetime.utcnow(),
-            }
-        )
+        with timed_stage("db_enqueue"):
+            result_id = result_writer.write(
+                {
+                    "user_id": user_id,
+                    "prediction": prediction,
+                    "predicted_class": predicted_class,
+                    "image_path": image_path,
+                    "filename": filename,
+                    "storage_key": storage_key,
+                    "image_hash": analysis["image_hash"],
+                    "gradcam_heatmap": analysis["heatmap"],
+                    "model_version": model_version,
+                    "dicom": analysis["dicom"],
+                    "created_at": datetime.datetime.utcnow(),
+                }
+            )
 
-        result_id = str(result.inserted_id)
+        result_id = str(result_id)
 
     except Exception as e:
         print(f"Error storing result: {str(e)}")
         traceback.print_exc()
         result_id = None
 
+    # The overlay is rendered on demand from the stored heatmap; without
+    # one, the heatmap can be computed later through gradcam_request_url
+    gradcam_url = gradcam_request = None
+    if result_id and analysis["heatmap"] is not None:
+        gradcam_url = overlay_url(result_id)
+    elif result_id:
+        gradcam_request = gradcam_request_url(result_id)
+
     return jsonify(
         {
             "prediction": prediction,
             "predicted_class": predicted_class,
-            "image_path": url_for(
-                "static", filename=f"uploads/{filename}", _external=True
-            ),
-            "gradcam_image": gradcam_base64,
+            "image_path": image_path,
+            "thumbnails": thumbnail_urls(storage_key),
+            "gradcam_url": gradcam_url,
+            "gradcam_request_url": gradcam_request,
             "result_id": result_id,
+            "model_version": model_version,
+            "cache_hit": analysis["cache_hit"],
+            "dicom": analysis["dicom"],
         }
     )
 
 
+def process_batch_file(data, use_gradcam, backend=None):
+    """Decode, preprocess and classify one file of a batch upload"""
+    analysis = analyze_upload(data, use_gradcam, backend)
+    analysis["storage_key"] = store_upload(data, analysis)
+    # The pixels are no longer needed once the thumbnails are queued
+    analysis["image"] = None
+
+    analysis["result_id"] = ObjectId()
+    return analysis
+
+
+@app.route("/api/upload/batch", methods=["POST"])
+def upload_batch():
+    # Refuse oversized bodies before the multipart data is even parsed
+    if request.content_length and request.content_length > BATCH_UPLOAD_MAX_BYTES:
+        return jsonify({"error": "Batch is too large"}), 413
+
+    files = [f for f in request.files.getlist("xray") if f and f.filename]
+    if not files:
+        return jsonify({"error": "No files uploaded"}), 400
+    if len(files) > BATCH_UPLOAD_MAX_FILES:
+        return (
+            jsonify({"error": f"At most {BATCH_UPLOAD_MAX_FILES} files per batch"}),
+            413,
+        )
+
+    use_gradcam = request.form.get("use_gradcam") == "true"
+
+    backend = request.form.get("backend") or None
+    try:
+        model_registry.get().for_backend(backend)
+    except BackendUnavailable as e:
+        return jsonify({"error": str(e)}), 400
+
+    user_id = None
+    try:
+        db = get_db_connection()
+        user_id = resolve_user_id(session, db)
+    except Exception as e:
+        print(f"Error resolving user for batch upload: {str(e)}")
+        traceback.print_exc()
+
+    # Request.close() closes the parsed files when this view returns, which
+    # can be before the response is streamed; the streams are taken over so
+    # they can still be read one at a time, and are closed at the end
+    uploads = []
+    for file in files:
+        uploads.append((secure_filename(file.filename), file.stream))
+        file.stream = io.BytesIO()
+
+    def submit(stream):
+        try:
+            data = read_upload(stream)
+        except UploadRejected as e:
+            future = Future()
+            future.set_exception(e)
+            return future
+        return batch_executor.submit(process_batch_file, data, use_gradcam, backend)
+
+    def completed():
+        """Yield (future, index, filename) as the files finish
+
+        A file is only read once a slot frees up, so each request holds at
+        most BATCH_UPLOAD_IN_FLIGHT uploads in memory or on the shared pool's
+        queue.
+        """
+        queued = iter(enumerate(uploads))
+        in_flight = {}
+        try:
+            while True:
+                for index, (filename, stream) in queued:
+                    in_flight[submit(stream)] = (index, filename)
+                    stream.close()
+                    if len(in_flight) >= BATCH_UPLOAD_IN_FLIGHT:
+                        break
+                if not in_flight:
+                    return
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, filename = in_flight.pop(future)
+                    yield future, index, filename
+        finally:
+            # The client went away; skip the files it will never read
+            for future in in_flight:
+                future.cancel()
+            for _, stream in queued:
+                stream.close()
+
+    def generate():
+        succeeded = stored = 0
+        for future, index, filename in completed():
+            try:
+                analysis = future.result()
+            except Exception as e:
+                print(f"Error processing batch file {filename}: {str(e)}")
+                line = {
+                    "index": index,
+                    "filename": filename,
+                    "success": False,
+                    "error": str(e),
+                }
+                yield json.dumps(line) + "\n"
+                continue
+
+            succeeded += 1
+            image_path = upload_url(analysis["storage_key"])
+            try:
+                result_writer.write(
+                    {
+                        "_id": analysis["result_id"],
+                        "user_id": user_id,
+                        "prediction": analysis["prediction"],
+                        "predicted_class": analysis["predicted_class"],
+                        "image_path": image_path,
+                        "filename": filename,
+                        "storage_key": analysis["storage_key"],
+                        "image_hash": analysis["image_hash"],
+                        "gradcam_heatmap": analysis["heatmap"],
+                        "model_version": analysis["model_version"],
+                        "dicom": analysis["dicom"],
+                        "created_at": datetime.datetime.utcnow(),
+                    }
+                )
+                stored += 1
+            except Exception as e:
+                print(f"Error storing batch result {filename}: {str(e)}")
+                traceback.print_exc()
+
+            gradcam_url = gradcam_request = None
+            if analysis["heatmap"] is not None:
+                gradcam_url = overlay_url(analysis["result_id"])
+            else:
+                gradcam_request = gradcam_request_url(analysis["result_id"])
+            line = {
+                "index": index,
+                "filename": filename,
+                "success": True,
+                "prediction": analysis["prediction"],
+                "predicted_class": analysis["predicted_class"],
+                "image_path": image_path,
+                "thumbnails": thumbnail_urls(analysis["storage_key"]),
+                "gradcam_url": gradcam_url,
+                "gradcam_request_url": gradcam_request,
+                "result_id": str(analysis["result_id"]),
+                "model_version": analysis["model_version"],
+                "cache_hit": analysis["cache_hit"],
+                "dicom": analysis["dicom"],
+            }
+            yield json.dumps(line) + "\n"
+
+        summary = {
+            "summary": True,
+            "total": len(files),
+            "succeeded": succeeded,
+            "failed": len(files) - succeeded,
+            "stored": stored == succeeded,
+        }
+        yield json.dumps(summary) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
+@app.route("/api/results/<result_id>/gradcam", methods=["GET"])
+def get_result_gradcam(result_id):
+    try:
+        result_oid = ObjectId(result_id)
+    except Exception:
+        return jsonify({"success": False, "message": "Invalid result id"}), 400
+
+    try:
+        db = get_db_connection()
+        result = find_result(db, result_oid)
+        if not result:
+            return jsonify({"success": False, "message": "Result not found"}), 404
+
+        denied = check_result_access(db, result, request.args.get("sig"))
+        if denied:
+            return denied
+
+        gradcam_jpeg, _ = get_overlay_bytes(db, result, OVERLAY_DEFAULT_SIZE, "jpeg")
+        if gradcam_jpeg is None:
+            return (
+                jsonify({"success": False, "message": "Original image not available"}),
+                404,
+            )
+
+        return jsonify(
+            {
+                "success": True,
+                "result_id": result_id,
+                "gradcam_image": base64.b64encode(gradcam_jpeg).decode("utf-8"),
+                "gradcam_url": overlay_url(result_id),
+                "model_version": result.get("model_version"),
+            }
+        )
+    except Exception as e:
+        print(f"Error generating Grad-CAM: {str(e)}")
+        traceback.print_exc()
+        return jsonify({"success": False, "message": f"Server error: {str(e)}"}), 500
+
+
+@app.route("/api/results/<result_id>/overlay", methods=["GET"])
+def get_result_overlay(result_id):
+    try:
+        result_oid = ObjectId(result_id)
+    except Exception:
+        return jsonify({"success": False, "message": "Invalid result id"}), 400
+
+    try:
+        size, fmt = parse_overlay_request(request.args)
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+
+    try:
+        db = get_db_connection()
+        result = find_result(db, result_oid)
+        if not result:
+            return jsonify({"success": False, "message": "Result not found"}), 404
+
+        denied = check_result_access(db, result, request.args.get("sig"))
+        if denied:
+            return denied
+
+        # A stored heatmap never changes, so the ETag can be checked before
+        # anything is rendered or read from disk
+        packed = result.get("gradcam_heatmap")
+        if packed is not None:
+            etag = overlay_etag(result["_id"], packed, size, fmt)
+            if request.if_none_match.contains(etag):
+                response = Response(status=304)
+                response.set_etag(etag)
+                return response
+
+        data, etag = get_overlay_bytes(db, result, size, fmt)
+        if data is None:
+            return (
+                jsonify({"success": False, "message": "Original image not available"}),
+                404,
+            )
+
+        response = Response(data, mimetype=OVERLAY_FORMATS[fmt][1])
+        response.set_etag(etag)
+        response.cache_control.private = True
+        response.cache_control.max_age = OVERLAY_CACHE_MAX_AGE
+        return response
+    except Exception as e:
+        print(f"Error rendering overlay: {str(e)}")
+        traceback.print_exc()
+        return jsonify({"success": False, "message": f"Server error: {str(e)}"}), 500
+
+
 @app.route("/api/register", methods=["POST"])
 def register():
     try:
@@ -313,21 +1137,21 @@ def register():
                 400,
             )
 
-        # Check if user already exists
-        db = get_db_connection()
-        existing_user = db.users.find_one({"email": email})
+        # Hash the password
+        try:
+            hashed_password = password_hasher.hash(password)
+        except (PasswordQueueFull, FutureTimeoutError):
+            print(f"Password pool busy, rejecting registration for {email}")
+            return password_busy_response()
 
-        if existing_user:
-            print(f"User already exists: {email}")
-            return jsonify({"success": False, "message": "User already exists"}), 400
+        db = get_db_connection()
 
         # Insert new user with hashed password
         try:
             print(f"Inserting new user: {email}")
 
-            # Hash the password
-            hashed_password = hash_password(password)
-
+            # The unique email index rejects existing users, so registration
+            # is a single round trip.
             user_id = db.users.insert_one(
                 {
                     "email": email,
@@ -336,33 +1160,9 @@ def register():
                     "created_at": datetime.datetime.utcnow(),
                 }
             ).inserted_id
-
-            # Verify the user was created
-            user = db.users.find_one({"_id": user_id})
-
-            if user:
-                print(f"User registered successfully: {email} (ID: {user_id})")
-
-                # Auto-login the user
-                user_dict = {"email": user["email"], "name": user["name"]}
-                session["user"] = user_dict
-
-                return (
-                    jsonify(
-                        {
-                            "success": True,
-                            "message": "User registered successfully",
-                            "user": user_dict,
-                        }
-                    ),
-                    201,
-                )
-            else:
-                print(f"Failed to verify user creation: {email}")
-                return (
-                    jsonify({"success": False, "message": "Failed to create user"}),
-                    500,
-                )
+        except DuplicateKeyError:
+            print(f"User already exists: {email}")
+            return jsonify({"success": False, "message": "User already exists"}), 400
         except Exception as db_error:
             print(f"Database error: {str(db_error)}")
             traceback.print_exc()
@@ -373,6 +1173,25 @@ def register():
                 500,
             )
 
+        print(f"User registered successfully: {email} (ID: {user_id})")
+
+        # Auto-login the user; the _id is kept in the session so later
+        # requests don't have to look it up
+        identity_cache.invalidate(email)
+        user_dict = session_user_dict({"_id": user_id, "email": email, "name": name})
+        session["user"] = user_dict
+
+        return (
+            jsonify(
+                {
+                    "success": True,
+                    "message": "User registered successfully",
+                    "user": user_dict,
+                }
+            ),
+            201,
+        )
+
     except Exception as e:
         print(f"Registration error: {str(e)}")
         traceback.print_exc()
@@ -406,12 +1225,29 @@ def login():
             return jsonify({"success": False, "message": "User not found"}), 401
 
         # Check if the password matches using bcrypt
-        if not check_password(password, user["password"]):
+        try:
+            password_ok = password_hasher.check(password, user["password"])
+        except (PasswordQueueFull, FutureTimeoutError):
+            print(f"Password pool busy, rejecting login for {email}")
+            return password_busy_response()
+        if not password_ok:
             print(f"Invalid password for user: {email}")
             return jsonify({"success": False, "message": "Invalid password"}), 401
 
+        # Bring hashes made with an older cost factor up to date. The filter
+        # on the old hash keeps a concurrent password change from being
+        # overwritten.
+        password_hasher.rehash_in_background(
+            password,
+            user["password"],
+            lambda old_hash, new_hash: db.users.update_one(
+                {"_id": user["_id"], "password": old_hash},
+                {"$set": {"password": new_hash}},
+            ),
+        )
+
         # Create user dict for session
-        user_dict = {"email": user["email"], "name": user["name"]}
+        user_dict = session_user_dict(user)
         session["user"] = user_dict
 
         print(f"Login successful for {email}")
@@ -429,6 +1265,9 @@ def login():
 def logout():
     try:
         # Clear the session
+        user = session.get("user")
+        if user and "email" in user:
+            identity_cache.invalidate(user["email"])
         session.clear()
 
         # Set an explicit response with cookie clearing
@@ -458,6 +1297,64 @@ def get_user():
     return jsonify({"user": None})
 
 
+RESULT_FIELDS = {
+    "prediction": 1,
+    "predicted_class": 1,
+    "image_path": 1,
+    "storage_key": 1,
+    "dicom": 1,
+    "created_at": 1,
+}
+
+
+def serialize_result(result):
+    """Convert a result document into its JSON-ready API form"""
+    item = {
+        "result_id": str(result["_id"]),
+        "prediction": result.get("prediction"),
+        "predicted_class": result.get("predicted_class"),
+        "image_path": result.get("image_path"),
+        # Small WebP previews; results not yet moved out of the flat upload
+        # directory have none
+        "thumbnails": (
+            thumbnail_urls(result["storage_key"]) if result.get("storage_key") else None
+        ),
+        # Rendered on demand, so available even for results uploaded
+        # without Grad-CAM
+        "gradcam_url": overlay_url(result["_id"]),
+        # Header fields of DICOM uploads, None for other images
+        "dicom": result.get("dicom"),
+        "created_at": result.get("created_at"),
+    }
+    if isinstance(item["created_at"], datetime.datetime):
+        item["created_at"] = item["created_at"].isoformat()
+    return item
+
+
+def stream_results(cursor, limit):
+    """Yield a results page as JSON text while the cursor is iterated
+
+    One document is held back so we know whether another page exists
+    without ever materializing the page in memory.
+    """
+    yield '{"success": true, "results": ['
+    previous = None
+    count = 0
+    has_more = False
+    for result in cursor:
+        if count == limit:
+            has_more = True
+            break
+        if previous is not None:
+            yield ("," if count > 1 else "") + json.dumps(serialize_result(previous))
+        previous = result
+        count += 1
+    if previous is not None:
+        yield ("," if count > 1 else "") + json.dumps(serialize_result(previous))
+    next_token = encode_cursor(previous) if has_more else None
+    yield "], " + f'"next": {json.dumps(next_token)}}}'
+
+
 @app.route("/api/results", methods=["GET"])
 def get_results():
     user = session.get("user")
@@ -467,36 +1364,44 @@ def get_results():
     try:
         db = get_db_connection()
 
-        # Get user ID
-        user_doc = db.users.find_one({"email": user["email"]})
+        # Get user ID, normally straight from the session
+        user_id = resolve_user_id(session, db)
 
-        if not user_doc:
+        if user_id is None:
             return jsonify({"success": False, "message": "User not found"}), 404
 
-        user_id = user_doc["_id"]
+        try:
+            query, limit = build_results_query(user_id, request.args)
+        except InvalidQuery as e:
+            return jsonify({"success": False, "message": str(e)}), 400
+
+        # Let the history include scans the user just uploaded
+        result_writer.wait_for_user(user_id, RESULT_WRITE_READ_WAIT)
+
+        # One extra document tells us whether there is a next page
+        results_cursor = (
+            db.results.find(query, RESULT_FIELDS)
+            .sort(RESULTS_SORT)
+            .limit(limit + 1)
+            .batch_size(min(limit + 1, 100))
+        )
 
-        # Get results for this user
-        results_cursor = db.results.find(
-            {"user_id": user_id},
-            {
-                "_id": 0,
-                "prediction": 1,
-                "predicted_class": 1,
-                "image_path": 1,
-                "created_at": 1,
-            },
-        ).sort("created_at", -1)
+        if request.args.get("stream") == "true":
+            return Response(
+                stream_with_context(stream_results(results_cursor, limit)),
+                mimetype="application/json",
+            )
 
         results = list(results_cursor)
+        next_token = encode_cursor(results[limit - 1]) if len(results) > limit else None
 
-        # Convert datetime objects to strings for JSON serialization
-        for result in results:
-            if "created_at" in result and isinstance(
-                result["created_at"], datetime.datetime
-            ):
-                result["created_at"] = result["created_at"].isoformat()
-
-        return jsonify({"success": True, "results": results})
+        return jsonify(
+            {
+                "success": True,
+                "results": [serialize_result(result) for result in results[:limit]],
+                "next": next_token,
+            }
+        )
     except Exception as e:
         print(f"Error fetching results: {str(e)}")
         traceback.print_exc()
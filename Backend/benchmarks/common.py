@@ -0,0 +1,219 @@
+"""Shared helpers for the benchmark scripts: synthetic images, latency
+statistics, peak memory sampling, JSON reports and a stand-in MongoDB"""
+
+import datetime
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+import cv2
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The JSON report is the only thing written here; see load_app
+REPORT_STREAM = sys.stdout
+
+
+def synthetic_radiograph(size, seed):
+    """Build an RGB uint8 image with the rough structure of a chest X-ray
+
+    ``size`` is the side length, or a (height, width) pair.
+    """
+    height, width = (size, size) if np.isscalar(size) else size
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    y /= height
+    x /= width
+    # Bright mediastinum, two darker lung fields and some rib-like banding
+    image = 0.55 + 0.35 * np.exp(-((x - 0.5) ** 2) / 0.01)
+    for cx in (0.3, 0.7):
+        image -= 0.3 * np.exp(-((x - cx) ** 2 / 0.02 + (y - 0.5) ** 2 / 0.08))
+    image += 0.05 * np.sin(y * 60.0)
+    image += rng.normal(0, 0.03, size=(height, width)).astype(np.float32)
+    gray = np.clip(image * 200 + 20, 0, 255).astype(np.uint8)
+    return cv2.cvtColor(gray, cv2.COLOR_GRAY2RGB)
+
+
+def encode_image(image_rgb, ext=".jpg"):
+    """Encode an RGB image as an upload would arrive"""
+    ok, buffer = cv2.imencode(ext, cv2.cvtColor(image_rgb, cv2.COLOR_RGB2BGR))
+    if not ok:
+        raise ValueError(f"Could not encode image as {ext}")
+    return buffer.tobytes()
+
+
+def latency_summary(timings, wall_seconds=None):
+    """Throughput and latency percentiles (ms) of a list of durations in seconds"""
+    if not timings:
+        return {"count": 0}
+    ms = np.asarray(timings, dtype=np.float64) * 1000.0
+    wall = wall_seconds if wall_seconds is not None else float(np.sum(timings))
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {
+        "count": len(timings),
+        "wall_seconds": round(wall, 4),
+        "throughput_per_second": round(len(timings) / wall, 3) if wall else None,
+        "latency_ms": {
+            "mean": round(float(ms.mean()), 3),
+            "min": round(float(ms.min()), 3),
+            "p50": round(float(p50), 3),
+            "p95": round(float(p95), 3),
+            "p99": round(float(p99), 3),
+            "max": round(float(ms.max()), 3),
+        },
+    }
+
+
+def _current_rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def _max_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class RssSampler:
+    """Tracks the peak resident set size while a block runs
+
+    Samples /proc/self/statm from a background thread so each benchmark gets
+    its own peak; where /proc is unavailable the process-lifetime peak from
+    getrusage is reported instead.
+    """
+
+    def __init__(self, interval=0.02):
+        self.interval = interval
+        self.peak_bytes = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.peak_bytes = _current_rss_bytes() or 0
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            rss = _current_rss_bytes()
+            if rss is None:
+                return
+            self.peak_bytes = max(self.peak_bytes, rss)
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        rss = _current_rss_bytes()
+        if rss is None:
+            self.peak_bytes = _max_rss_bytes()
+        else:
+            self.peak_bytes = max(self.peak_bytes, rss)
+        return False
+
+    @property
+    def peak_mb(self):
+        return round(self.peak_bytes / (1024 * 1024), 1)
+
+
+def environment_info():
+    """What a result depends on, so runs are only compared like for like"""
+    import tensorflow as tf
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BACKEND_DIR,
+            capture_output=True,
+            text=True,
+            timeout=5,
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "git_commit": commit or None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "tensorflow": tf.__version__,
+    }
+
+
+def write_report(name, config, results, output=None):
+    """Print the JSON report to stdout and optionally write it to ``output``"""
+    report = {
+        "benchmark": name,
+        "started_at": datetime.datetime.utcnow().isoformat(),
+        "environment": environment_info(),
+        "config": config,
+        "results": results,
+        "peak_rss_mb": round(_max_rss_bytes() / (1024 * 1024), 1),
+    }
+    text = json.dumps(report, indent=2, default=str)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+        print(f"Wrote {output}", file=sys.stderr)
+    print(text, file=REPORT_STREAM, flush=True)
+    return report
+
+
+def load_app(workdir, mongo_uri=None):
+    """Import the Flask app against a real MongoDB or an in-memory stand-in
+
+    With ``mongo_uri`` the app connects there (e.g. a throwaway local
+    mongod); otherwise pymongo is replaced by mongomock before the app is
+    imported, which needs ``pip install -r benchmarks/requirements.txt``.
+    The app runs in ``workdir`` so its uploads and caches stay out of the tree.
+    Everything printed from here on, including the app's startup and exit
+    logs, goes to stderr so stdout holds nothing but the JSON report.
+    """
+    sys.stdout = sys.stderr
+    # Relative model paths are resolved against the Backend directory
+    for name, default in (
+        ("MODEL_PATH", "pneumonia_detection.keras"),
+        ("TFLITE_DIR", "models/tflite"),
+    ):
+        os.environ[name] = os.path.join(BACKEND_DIR, os.environ.get(name, default))
+    # Reloading the model mid-run would distort the measurements
+    os.environ["MODEL_RELOAD_INTERVAL"] = "0"
+    if mongo_uri:
+        os.environ["MONGO_URI"] = mongo_uri
+    else:
+        import mongomock
+        import pymongo
+
+        client = mongomock.MongoClient()
+        pymongo.MongoClient = lambda *args, **kwargs: client
+
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    import app
+
+    return app
+
+
+def timed(fn, repeat, warmup=1):
+    """Call ``fn`` ``warmup`` times untimed, then return ``repeat`` durations"""
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return timings
@@ -0,0 +1,73 @@
+"""Compare two benchmark JSON reports of the same kind
+
+Prints throughput and p50/p95/p99 latency side by side with the change, for
+every case present in both reports.
+
+Usage (from the Backend directory):
+    python benchmarks/compare.py baseline.json candidate.json
+"""
+
+import argparse
+import json
+import sys
+
+
+def iter_cases(results, prefix=()):
+    """Yield (path, summary) for every latency summary in a results tree"""
+    for key, value in results.items():
+        if not isinstance(value, dict):
+            continue
+        if "latency_ms" in value:
+            yield prefix + (key,), value
+        else:
+            yield from iter_cases(value, prefix + (key,))
+
+
+def change(before, after):
+    if not before or after is None:
+        return "n/a"
+    return f"{(after - before) / before * 100:+.1f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    if baseline["benchmark"] != candidate["benchmark"]:
+        print("Reports come from different benchmarks")
+        return 1
+    if baseline["environment"] != candidate["environment"]:
+        print("Note: the environments differ (see the 'environment' sections)")
+
+    before = dict(iter_cases(baseline["results"]))
+    for path, after in iter_cases(candidate["results"]):
+        if path not in before:
+            continue
+        old = before[path]
+        print(" / ".join(path))
+        rows = [
+            (
+                "throughput/s",
+                old.get("throughput_per_second"),
+                after.get("throughput_per_second"),
+            )
+        ] + [
+            (f"{p} ms", old["latency_ms"][p], after["latency_ms"][p])
+            for p in ("p50", "p95", "p99")
+        ]
+        for label, old_value, new_value in rows:
+            print(
+                f"  {label:<13} {old_value:>12} -> {new_value:<12} "
+                f"{change(old_value, new_value)}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
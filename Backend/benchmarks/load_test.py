@@ -0,0 +1,217 @@
+"""Drive /api/upload, /api/login and /api/results concurrently end to end
+
+Requests go through the real Flask app (via its WSGI test client, so no
+network stack is measured) backed by an in-memory stand-in MongoDB, or a
+real one with --mongo-uri. Each scenario reports throughput, p50/p95/p99
+latency, errors and peak RSS as JSON (see common.write_report).
+
+Usage (from the Backend directory):
+    python benchmarks/load_test.py [--concurrency 8] [--requests 200]
+        [--scenarios upload login results] [--output load.json]
+"""
+
+import argparse
+import collections
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import (  # noqa: E402
+    RssSampler,
+    encode_image,
+    latency_summary,
+    load_app,
+    synthetic_radiograph,
+    write_report,
+)
+
+BENCHMARK_EMAIL = "benchmark@mediscan.local"
+BENCHMARK_PASSWORD = "benchmark-password"
+SCENARIOS = ("upload", "login", "results")
+
+
+class Scenario:
+    """One endpoint, called ``total`` times spread over ``concurrency`` clients"""
+
+    def __init__(self, name, send):
+        self.name = name
+        self.send = send
+        self.timings = []
+        self.statuses = collections.Counter()
+        self.cache_hits = 0
+        self._lock = threading.Lock()
+
+    def _worker(self, client, indices):
+        for i in indices:
+            started = time.perf_counter()
+            try:
+                response = self.send(client, i)
+                # Consume streamed bodies so the whole response is timed
+                response.get_data()
+                status = response.status_code
+            except Exception as e:
+                response = None
+                status = type(e).__name__
+            elapsed = time.perf_counter() - started
+            cache_hit = (
+                response is not None
+                and response.is_json
+                and bool((response.get_json() or {}).get("cache_hit"))
+            )
+            with self._lock:
+                self.timings.append(elapsed)
+                self.statuses[status] += 1
+                self.cache_hits += cache_hit
+
+    def run(self, clients, total):
+        concurrency = len(clients)
+        threads = [
+            threading.Thread(
+                target=self._worker,
+                args=(client, range(k, total, concurrency)),
+            )
+            for k, client in enumerate(clients)
+        ]
+        with RssSampler() as rss:
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            wall = time.perf_counter() - started
+
+        summary = latency_summary(self.timings, wall)
+        errors = sum(
+            n for status, n in self.statuses.items() if not str(status).startswith("2")
+        )
+        summary.update(
+            {
+                "concurrency": concurrency,
+                "errors": errors,
+                "statuses": {str(k): v for k, v in self.statuses.items()},
+                "peak_rss_mb": rss.peak_mb,
+            }
+        )
+        if self.name == "upload":
+            summary["cache_hits"] = self.cache_hits
+        return summary
+
+
+def logged_in_client(app):
+    client = app.app.test_client()
+    response = client.post(
+        "/api/login", json={"email": BENCHMARK_EMAIL, "password": BENCHMARK_PASSWORD}
+    )
+    if response.status_code != 200:
+        raise RuntimeError(f"Benchmark login failed: {response.get_json()}")
+    return client
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200, help="Per scenario")
+    parser.add_argument(
+        "--warmup", type=int, default=8, help="Untimed requests per scenario"
+    )
+    parser.add_argument("--image-size", type=int, default=1024)
+    parser.add_argument(
+        "--distinct-images",
+        type=int,
+        default=64,
+        help="Uploads cycle through this many images; later rounds hit the cache",
+    )
+    parser.add_argument("--no-gradcam", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Also write the JSON report here")
+    parser.add_argument(
+        "--mongo-uri", help="Use this MongoDB instead of the in-memory stand-in"
+    )
+    parser.add_argument(
+        "--workdir",
+        default=os.path.join(tempfile.gettempdir(), "mediscan-benchmark"),
+        help="Where the app writes uploads and caches",
+    )
+    args = parser.parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+
+    app = load_app(args.workdir, args.mongo_uri)
+    setup = app.app.test_client()
+    setup.post(
+        "/api/register",
+        json={
+            "email": BENCHMARK_EMAIL,
+            "password": BENCHMARK_PASSWORD,
+            "name": "Benchmark User",
+        },
+    )
+    clients = [logged_in_client(app) for _ in range(args.concurrency)]
+
+    print(f"Generating {args.distinct_images} synthetic images...", file=sys.stderr)
+    uploads = [
+        encode_image(synthetic_radiograph(args.image_size, args.seed + i))
+        for i in range(args.distinct_images)
+    ]
+    # Warm-up images use other seeds, so timed uploads start as cache misses
+    warmup_uploads = [
+        encode_image(
+            synthetic_radiograph(args.image_size, args.seed + args.distinct_images + i)
+        )
+        for i in range(min(args.warmup, 4))
+    ]
+    use_gradcam = "false" if args.no_gradcam else "true"
+
+    def send_upload(client, i, images=uploads):
+        return client.post(
+            "/api/upload",
+            data={
+                "xray": (io.BytesIO(images[i % len(images)]), f"benchmark-{i}.jpg"),
+                "use_gradcam": use_gradcam,
+            },
+            content_type="multipart/form-data",
+        )
+
+    def send_login(client, i):
+        return client.post(
+            "/api/login",
+            json={"email": BENCHMARK_EMAIL, "password": BENCHMARK_PASSWORD},
+        )
+
+    def send_results(client, i):
+        return client.get("/api/results?limit=20")
+
+    senders = {"upload": send_upload, "login": send_login, "results": send_results}
+    results = {}
+    for name in args.scenarios:
+        send = senders[name]
+        if args.warmup:
+            if name == "upload":
+                warm = Scenario(
+                    name, lambda c, i: send_upload(c, i, images=warmup_uploads)
+                )
+            else:
+                warm = Scenario(name, send)
+            warm.run(clients, args.warmup)
+        print(f"Running {name}: {args.requests} requests...", file=sys.stderr)
+        results[name] = Scenario(name, send).run(clients, args.requests)
+
+    loaded = app.model_registry.get()
+    config = dict(
+        vars(args),
+        model_version=loaded.version,
+        backend=loaded.backend,
+        mongo="stand-in" if not args.mongo_uri else "external",
+    )
+    write_report("load", config, results, output)
+    app.upload_writer.flush()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+"""Time decoding, preprocessing, Grad-CAM and overlay rendering in isolation
+
+Each stage runs on synthetic chest X-rays at several resolutions and the
+results are reported as JSON (see common.write_report) for comparison
+between runs.
+
+Usage (from the Backend directory):
+    python benchmarks/micro_benchmark.py [--sizes 512 1024 2048] [--repeat 20]
+        [--output micro.json] [--mongo-uri mongodb://localhost:27017/]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import (  # noqa: E402
+    RssSampler,
+    encode_image,
+    latency_summary,
+    load_app,
+    synthetic_radiograph,
+    timed,
+    write_report,
+)
+
+
+def make_gradcam_heatmap(img_array, model, last_conv_layer_name="top_conv"):
+    """Single-image Grad-CAM as app.py computed it before the fused pass
+
+    Kept as the baseline the batched predict_with_gradcam is compared with.
+    """
+    import tensorflow as tf
+
+    grad_model = tf.keras.models.Model(
+        [model.inputs], [model.get_layer(last_conv_layer_name).output, model.output]
+    )
+    with tf.GradientTape() as tape:
+        last_conv_layer_output, preds = grad_model(img_array)
+        pred_output = preds[0]
+
+    grads = tape.gradient(pred_output, last_conv_layer_output)
+    pooled_grads = tf.reduce_mean(grads, axis=(0, 1, 2))
+    last_conv_layer_output = last_conv_layer_output[0]
+    heatmap = last_conv_layer_output @ pooled_grads[..., tf.newaxis]
+    heatmap = tf.squeeze(heatmap)
+    heatmap = tf.maximum(heatmap, 0) / tf.math.reduce_max(heatmap)
+    return heatmap.numpy()
+
+
+def run_case(fn, repeat, warmup):
+    with RssSampler() as rss:
+        timings = timed(fn, repeat, warmup)
+    summary = latency_summary(timings)
+    summary["peak_rss_mb"] = rss.peak_mb
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[512, 1024, 2048])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Also write the JSON report here")
+    parser.add_argument(
+        "--mongo-uri", help="Use this MongoDB instead of the in-memory stand-in"
+    )
+    parser.add_argument(
+        "--workdir",
+        default=os.path.join(tempfile.gettempdir(), "mediscan-benchmark"),
+        help="Where the app writes uploads and caches",
+    )
+    args = parser.parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+
+    # The model is loaded the way the app loads it
+    app = load_app(args.workdir, args.mongo_uri)
+    from overlays import overlay_heatmap_on_image
+    from preprocessing import preprocess_chest_xray_for_efficientnet
+    from uploads import ANALYSIS_DECODE_SIZE, decode_image
+
+    loaded = app.model_registry.get()
+    images = {size: synthetic_radiograph(size, args.seed + size) for size in args.sizes}
+    results = {
+        "decode_image": {},
+        "decode_image_for_analysis": {},
+        "preprocess_chest_xray_for_efficientnet": {},
+        "overlay_heatmap_on_image": {},
+    }
+
+    # The model input is always 224x224, so Grad-CAM is timed once
+    ready, _ = preprocess_chest_xray_for_efficientnet(images[args.sizes[0]])
+    batch = ready[np.newaxis]
+    # The original single-image helper looks the layer up by name, so it gets
+    # the backbone the classifier wraps
+    results["make_gradcam_heatmap"] = run_case(
+        lambda: make_gradcam_heatmap(batch, loaded.base_model, loaded.gradcam_layer),
+        args.repeat,
+        args.warmup,
+    )
+    # The bucketed graph the inference batcher actually uses, for comparison
+    results["batched_predict_with_gradcam"] = run_case(
+        lambda: loaded.predict_with_gradcam(batch), args.repeat, args.warmup
+    )
+    heatmap = loaded.predict_with_gradcam(batch)[1][0]
+
+    for size, image in images.items():
+        key = f"{size}x{size}"
+        # Full-resolution RGB, as before, against the reduced grayscale
+        # decode uploads are analysed with
+        data = encode_image(image)
+        results["decode_image"][key] = run_case(
+            lambda: decode_image(data), args.repeat, args.warmup
+        )
+        results["decode_image_for_analysis"][key] = run_case(
+            lambda: decode_image(
+                data, target_size=ANALYSIS_DECODE_SIZE, grayscale=True
+            ),
+            args.repeat,
+            args.warmup,
+        )
+        results["preprocess_chest_xray_for_efficientnet"][key] = run_case(
+            lambda: preprocess_chest_xray_for_efficientnet(image),
+            args.repeat,
+            args.warmup,
+        )
+        results["overlay_heatmap_on_image"][key] = run_case(
+            lambda: overlay_heatmap_on_image(heatmap, image), args.repeat, args.warmup
+        )
+        print(f"Finished {key}", file=sys.stderr)
+
+    config = dict(vars(args), model_version=loaded.version, backend=loaded.backend)
+    write_report("micro", config, results, output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
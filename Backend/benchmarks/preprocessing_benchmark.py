@@ -0,0 +1,107 @@
+"""Compare the batched preprocessing engine against the original per-image code
+
+Usage (from the Backend directory):
+    python benchmarks/preprocessing_benchmark.py [--sizes 1024 2048 3000] [--repeat 5]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import synthetic_radiograph  # noqa: E402
+from preprocessing import preprocess_chest_xray_batch  # noqa: E402
+from tensorflow.keras.applications.efficientnet import (  # noqa: E402
+    preprocess_input as efficientnet_preprocess,
+)
+
+
+def legacy_preprocess(image):
+    """The preprocessing as originally written in app.py, kept as reference"""
+    if len(image.shape) == 3 and image.shape[2] == 3:
+        image_gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    else:
+        image_gray = image
+
+    image_norm = image_gray.astype("float32")
+    image_norm = (image_norm - np.min(image_norm)) / (
+        np.max(image_norm) - np.min(image_norm) + 1e-8
+    )
+    image_uint8 = (image_norm * 255).astype("uint8")
+
+    denoised = cv2.GaussianBlur(image_uint8, (3, 3), 0)
+    denoised = cv2.medianBlur(denoised, 3)
+    clahe = cv2.createCLAHE(clipLimit=0.03, tileGridSize=(8, 8))
+    contrast_enhanced = clahe.apply(denoised)
+
+    gamma = 0.7
+    contrast_float = contrast_enhanced.astype("float32") / 255.0
+    gamma_corrected = np.power(contrast_float, gamma)
+    final_image = (gamma_corrected * 255).astype(np.uint8)
+
+    final_image_rgb = np.stack((final_image,) * 3, axis=-1)
+    final_image_rgb = cv2.resize(final_image_rgb, (224, 224))
+    efficientnet_ready = efficientnet_preprocess(final_image_rgb.astype("float32"))
+
+    return efficientnet_ready, final_image_rgb
+
+
+def time_call(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1024, 2048, 3000])
+    parser.add_argument("--batch", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--tolerance", type=float, default=1.0)
+    args = parser.parse_args()
+
+    failed = False
+    for size in args.sizes:
+        images = [synthetic_radiograph(size, seed) for seed in range(args.batch)]
+
+        batch, display_images = preprocess_chest_xray_batch(images)
+        max_diff = 0.0
+        for image, ready, display in zip(images, batch, display_images):
+            expected_ready, expected_display = legacy_preprocess(image)
+            max_diff = max(
+                max_diff,
+                float(np.max(np.abs(ready - expected_ready))),
+                float(np.max(np.abs(display.astype(np.int16) - expected_display))),
+            )
+
+        legacy_time = time_call(
+            lambda: [legacy_preprocess(image) for image in images], args.repeat
+        )
+        batched_time = time_call(
+            lambda: preprocess_chest_xray_batch(images), args.repeat
+        )
+
+        ok = max_diff <= args.tolerance
+        failed = failed or not ok
+        print(
+            f"{size}x{size} x{args.batch}: "
+            f"legacy {legacy_time / args.batch * 1000:.1f} ms/image, "
+            f"batched {batched_time / args.batch * 1000:.1f} ms/image, "
+            f"speedup {legacy_time / batched_time:.2f}x, "
+            f"max diff {max_diff:.3f} ({'ok' if ok else 'MISMATCH'})"
+        )
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
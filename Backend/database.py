@@ -0,0 +1,284 @@
+import os
+import threading
+import time
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, MongoClient, monitoring
+
+# ----------------------------
+# MongoDB Connection Settings
+# ----------------------------
+MONGO_URI = os.environ.get("MONGO_URI", "mongodb://localhost:27017/")
+DATABASE_NAME = os.environ.get("DATABASE_NAME", "mediscan")
+
+MONGO_MAX_POOL_SIZE = int(os.environ.get("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.environ.get("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_TIME_MS = int(os.environ.get("MONGO_MAX_IDLE_TIME_MS", "300000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(
+    os.environ.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000")
+)
+MONGO_SOCKET_TIMEOUT_MS = int(os.environ.get("MONGO_SOCKET_TIMEOUT_MS", "30000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(
+    os.environ.get("MONGO_WAIT_QUEUE_TIMEOUT_MS", "10000")
+)
+MONGO_WRITE_CONCERN = os.environ.get("MONGO_WRITE_CONCERN", "1")
+MONGO_READ_CONCERN = os.environ.get("MONGO_READ_CONCERN", "local")
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """Tracks connection pool usage from pymongo's CMAP events"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checkout_started = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.connections_open = 0
+            self.checked_out = 0
+            self.max_checked_out = 0
+            self.checkouts = 0
+            self.checkout_failures = 0
+            self.wait_time_total = 0.0
+            self.wait_time_max = 0.0
+
+    def _wait_time(self):
+        started = getattr(self._checkout_started, "value", None)
+        self._checkout_started.value = None
+        return time.perf_counter() - started if started is not None else 0.0
+
+    def connection_check_out_started(self, event):
+        self._checkout_started.value = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        waited = self._wait_time()
+        with self._lock:
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+            self.checkouts += 1
+            self.wait_time_total += waited
+            self.wait_time_max = max(self.wait_time_max, waited)
+
+    def connection_check_out_failed(self, event):
+        waited = self._wait_time()
+        with self._lock:
+            self.checkout_failures += 1
+            self.wait_time_total += waited
+            self.wait_time_max = max(self.wait_time_max, waited)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out = max(0, self.checked_out - 1)
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections_open += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections_open = max(0, self.connections_open - 1)
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def snapshot(self):
+        with self._lock:
+            attempts = self.checkouts + self.checkout_failures
+            return {
+                "max_pool_size": MONGO_MAX_POOL_SIZE,
+                "connections_open": self.connections_open,
+                "checked_out": self.checked_out,
+                "max_checked_out": self.max_checked_out,
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "average_wait_ms": (
+                    self.wait_time_total / attempts * 1000.0 if attempts else 0.0
+                ),
+                "max_wait_ms": self.wait_time_max * 1000.0,
+            }
+
+
+pool_metrics = PoolMetrics()
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def _create_client():
+    return MongoClient(
+        MONGO_URI,
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+        connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+        serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS or None,
+        waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS or None,
+        w=(
+            int(MONGO_WRITE_CONCERN)
+            if MONGO_WRITE_CONCERN.isdigit()
+            else MONGO_WRITE_CONCERN
+        ),
+        readConcernLevel=MONGO_READ_CONCERN,
+        event_listeners=[pool_metrics],
+    )
+
+
+def get_client():
+    """Return the process-wide MongoClient, creating it on first use
+
+    MongoClient is not fork-safe, so a process that inherited a client from
+    its parent (e.g. a pre-forked gunicorn worker) gets a fresh one.
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+    with _client_lock:
+        if _client is None or _client_pid != pid:
+            _client = _create_client()
+            _client_pid = pid
+        return _client
+
+
+def get_db():
+    """Get the application database from the shared client"""
+    return get_client()[DATABASE_NAME]
+
+
+def close_client():
+    """Close the shared client; the next get_client() call opens a new one"""
+    global _client, _client_pid
+    with _client_lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = None
+        _client_pid = None
+
+
+def _reset_after_fork():
+    # Sockets and monitor threads belong to the parent; just drop the reference
+    global _client, _client_pid, _client_lock
+    _client = None
+    _client_pid = None
+    _client_lock = threading.Lock()
+    pool_metrics._lock = threading.Lock()
+    pool_metrics.reset()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+# ----------------------------
+# Indexes
+# ----------------------------
+# Every query on a hot path must be covered by one of these
+INDEXES = {
+    "users": [
+        ([("email", ASCENDING)], {"name": "email_unique", "unique": True}),
+    ],
+    "results": [
+        # _id breaks created_at ties for keyset pagination
+        (
+            [("user_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+            {"name": "user_id_created_at_id"},
+        ),
+    ],
+}
+
+# Indexes replaced by a definition above, dropped so they don't cost writes.
+# user_id_1 and created_at_1 were created by the original init_mongodb.py;
+# the compound index serves both queries.
+SUPERSEDED_INDEXES = {
+    "results": ["user_id_created_at", "user_id_1", "created_at_1"],
+}
+
+
+def _has_equivalent_index(existing, keys, options):
+    """Whether an index with these keys and uniqueness exists under any name
+
+    MongoDB refuses to create the same index again under another name, e.g.
+    the email_1 index of databases set up by the original init_mongodb.py.
+    """
+    wanted = [(field, int(direction)) for field, direction in keys]
+    for info in existing.values():
+        if [(field, int(direction)) for field, direction in info["key"]] == wanted:
+            if info.get("unique", False) == options.get("unique", False):
+                return True
+    return False
+
+
+def ensure_indexes(db=None):
+    """Create the indexes the application relies on (a no-op if they exist)"""
+    db = db if db is not None else get_db()
+    for collection, indexes in INDEXES.items():
+        existing = db[collection].index_information()
+        for keys, options in indexes:
+            if not _has_equivalent_index(existing, keys, options):
+                db[collection].create_index(keys, **options)
+    for collection, names in SUPERSEDED_INDEXES.items():
+        existing = db[collection].index_information()
+        for name in names:
+            if name in existing:
+                db[collection].drop_index(name)
+
+
+def _plan_stages(plan):
+    """Yield (stage, index name) for every stage of an explain() plan tree"""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"], plan.get("indexName")
+        for value in plan.values():
+            yield from _plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _plan_stages(item)
+
+
+def verify_index_usage(db=None):
+    """Explain the hot-path queries and check they are served by an index
+
+    Returns a dict mapping each query to whether it passed and the plan
+    stages the server chose.
+    """
+    db = db if db is not None else get_db()
+    queries = {
+        "users by email": db.users.find({"email": "index-check@example.com"}),
+        "results by user, newest first": db.results.find({"user_id": ObjectId()}).sort(
+            [("created_at", DESCENDING), ("_id", DESCENDING)]
+        ),
+    }
+
+    report = {}
+    for name, cursor in queries.items():
+        explained = cursor.explain()
+        winning_plan = explained.get("queryPlanner", {}).get("winningPlan", {})
+        stages = list(_plan_stages(winning_plan))
+        stage_names = [stage for stage, _ in stages]
+        uses_index = any(
+            "IXSCAN" in stage or stage == "IDHACK" for stage in stage_names
+        )
+        # A blocking SORT means the index did not provide the order
+        ok = uses_index and "COLLSCAN" not in stage_names and "SORT" not in stage_names
+        report[name] = {
+            "ok": ok,
+            "stages": stage_names,
+            "indexes": [index for _, index in stages if index],
+        }
+    return report
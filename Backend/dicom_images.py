@@ -0,0 +1,264 @@
+import io
+import os
+import struct
+
+import cv2
+import numpy as np
+
+# pydicom is only needed for DICOM uploads; without it they are refused
+try:
+    import pydicom
+    from pydicom.pixels import (
+        apply_modality_lut,
+        apply_voi_lut,
+        convert_color_space,
+        pixel_array,
+    )
+    from pydicom.errors import InvalidDicomError
+except ImportError:
+    pydicom = None
+
+DICOM_SUPPORTED = pydicom is not None
+
+# ----------------------------
+# DICOM Settings
+# ----------------------------
+# Frame analysed in multi-frame objects; negative values count from the end
+DICOM_FRAME = int(os.environ.get("DICOM_FRAME", "0"))
+# Rows of output produced per pass when shrinking pixel data, which bounds
+# the memory used however large the frame is
+DICOM_STRIP_ROWS = int(os.environ.get("DICOM_STRIP_ROWS", "64"))
+
+DICOM_PREAMBLE_LENGTH = 128
+DICOM_MAGIC = b"DICM"
+PIXEL_DATA_TAG = (0x7FE0, 0x0010)
+UNDEFINED_LENGTH = 0xFFFFFFFF
+# Explicit VRs whose length is stored in 4 bytes after 2 reserved ones
+LONG_LENGTH_VRS = {b"OB", b"OW", b"OF", b"OD", b"OL", b"OV", b"UN"}
+
+# Header fields returned with a result; nothing that identifies the patient
+METADATA_FIELDS = (
+    ("Modality", "modality"),
+    ("BodyPartExamined", "body_part"),
+    ("ViewPosition", "view_position"),
+    ("PhotometricInterpretation", "photometric_interpretation"),
+    ("Rows", "rows"),
+    ("Columns", "columns"),
+    ("BitsStored", "bits_stored"),
+)
+
+
+class DicomError(Exception):
+    """Raised when a DICOM file can't be read"""
+
+
+def is_dicom(data):
+    return data[DICOM_PREAMBLE_LENGTH : DICOM_PREAMBLE_LENGTH + 4] == DICOM_MAGIC
+
+
+def read_header(source):
+    """Parse everything before the pixel data of a DICOM file
+
+    ``source`` is bytes or a path. Returns the dataset and the offset of the
+    Pixel Data element, which is where parsing stopped.
+    """
+    if not DICOM_SUPPORTED:
+        raise DicomError("DICOM support needs pydicom installed")
+    try:
+        with _open(source) as f:
+            header = pydicom.dcmread(f, stop_before_pixels=True)
+            return header, f.tell()
+    except InvalidDicomError as e:
+        raise DicomError(f"File is not valid DICOM: {str(e)}")
+    except (OSError, ValueError, struct.error) as e:
+        raise DicomError(f"Could not read DICOM header: {str(e)}")
+
+
+def _open(source):
+    if isinstance(source, (str, os.PathLike)):
+        return open(source, "rb")
+    # BytesIO shares the upload's bytes instead of copying them
+    return io.BytesIO(source)
+
+
+def frame_count(header):
+    return int(header.get("NumberOfFrames", 1) or 1)
+
+
+def selected_frame(header, frame=DICOM_FRAME):
+    """Index of the frame to analyse, clamped to the frames present"""
+    frames = frame_count(header)
+    index = frame if frame >= 0 else frames + frame
+    return min(max(index, 0), frames - 1)
+
+
+def dicom_metadata(source, frame=DICOM_FRAME):
+    """Non-identifying header fields of a DICOM file, without its pixels"""
+    header, _ = read_header(source)
+    metadata = {}
+    for keyword, name in METADATA_FIELDS:
+        value = header.get(keyword)
+        if value not in (None, ""):
+            metadata[name] = value if isinstance(value, int) else str(value)
+    metadata["frames"] = frame_count(header)
+    metadata["frame"] = selected_frame(header, frame)
+    return metadata
+
+
+def _pixel_data_location(source, header, offset):
+    """Offset and length of the Pixel Data value; length is None if encapsulated"""
+    syntax = header.file_meta.TransferSyntaxUID
+    with _open(source) as f:
+        f.seek(offset)
+        element = f.read(12)
+    order = "<" if syntax.is_little_endian else ">"
+    if len(element) < 8 or struct.unpack(f"{order}HH", element[:4]) != PIXEL_DATA_TAG:
+        raise DicomError("DICOM file has no pixel data")
+    if syntax.is_implicit_VR:
+        length = struct.unpack(f"{order}I", element[4:8])[0]
+        start = offset + 8
+    elif element[4:6] in LONG_LENGTH_VRS:
+        length = struct.unpack(f"{order}I", element[8:12])[0]
+        start = offset + 12
+    else:
+        length = struct.unpack(f"{order}H", element[6:8])[0]
+        start = offset + 8
+    return start, None if length == UNDEFINED_LENGTH else length
+
+
+def _pixel_dtype(header):
+    bits = header.BitsAllocated
+    if bits not in (8, 16, 32):
+        raise DicomError(f"{bits}-bit DICOM pixel data is not supported")
+    kind = "i" if header.get("PixelRepresentation", 0) == 1 else "u"
+    order = "<" if header.file_meta.TransferSyntaxUID.is_little_endian else ">"
+    return np.dtype(f"{order}{kind}{bits // 8}")
+
+
+def _native_frame(source, header, start, length, index):
+    """One frame of uncompressed pixel data, memory-mapped rather than read
+
+    Returns (rows, columns) or (rows, columns, samples); nothing is copied.
+    """
+    dtype = _pixel_dtype(header)
+    rows, columns = header.Rows, header.Columns
+    samples = header.get("SamplesPerPixel", 1)
+    frames = frame_count(header)
+    frame_shape = (rows, columns, samples)
+    if header.get("PlanarConfiguration", 0) == 1:
+        frame_shape = (samples, rows, columns)
+    frame_size = rows * columns * samples * dtype.itemsize
+    if length < frame_size * frames:
+        raise DicomError("DICOM pixel data is shorter than its header says")
+
+    frame_offset = start + frame_size * index
+    if isinstance(source, (str, os.PathLike)):
+        # np.memmap would fail with a bare ValueError on a short file
+        if os.path.getsize(source) < frame_offset + frame_size:
+            raise DicomError("DICOM file is truncated")
+        try:
+            frame = np.memmap(
+                source, dtype=dtype, mode="r", offset=frame_offset, shape=frame_shape
+            )
+        except (OSError, ValueError) as e:
+            raise DicomError(f"Could not map DICOM pixel data: {str(e)}")
+    else:
+        if len(source) < frame_offset + frame_size:
+            raise DicomError("DICOM file is truncated")
+        frame = np.frombuffer(
+            source, dtype=dtype, count=rows * columns * samples, offset=frame_offset
+        ).reshape(frame_shape)
+    if frame_shape[0] == samples and samples > 1:
+        frame = frame.transpose(1, 2, 0)
+    return frame[:, :, 0] if samples == 1 else frame
+
+
+def _shrink_frame(frame, target_size, header):
+    """Average the frame down by a whole factor, a strip of rows at a time
+
+    Only one strip is converted to float at once, so memory stays bounded
+    for any frame size. Returns float32 stored values.
+    """
+    rows, columns = frame.shape[:2]
+    if not rows or not columns:
+        raise DicomError("DICOM frame is empty")
+    factor = max(1, max(rows, columns) // target_size) if target_size else 1
+    # A factor larger than the short side would leave nothing of a very
+    # narrow frame; shrink_to_fit finishes the resize instead
+    factor = min(factor, rows, columns)
+    out_rows, out_columns = rows // factor, columns // factor
+    # Bits above BitsStored may hold overlay data in unsigned images
+    mask = None
+    if frame.dtype.kind == "u" and header.BitsStored < header.BitsAllocated:
+        mask = (1 << header.BitsStored) - 1
+
+    strip = factor * DICOM_STRIP_ROWS
+    parts = []
+    for top in range(0, out_rows * factor, strip):
+        block = np.array(frame[top : min(top + strip, out_rows * factor)])
+        block = block[:, : out_columns * factor]
+        if mask is not None:
+            block &= mask
+        block = block.astype(np.float32)
+        if factor > 1:
+            block = cv2.resize(
+                block,
+                (out_columns, block.shape[0] // factor),
+                interpolation=cv2.INTER_AREA,
+            )
+        parts.append(block)
+    return np.concatenate(parts)
+
+
+def _to_uint8(image):
+    """Min-max stretch the windowed values to the full uint8 range"""
+    image = np.asarray(image, dtype=np.float32)
+    min_val, max_val = float(image.min()), float(image.max())
+    image = (image - min_val) * (255.0 / (max_val - min_val + 1e-8))
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def decode_dicom(source, target_size=None, grayscale=False, frame=DICOM_FRAME):
+    """Decode one frame of a DICOM file into a uint8 image
+
+    Returns RGB, or a 2-D array with ``grayscale``. Uncompressed pixel data
+    is memory-mapped (or viewed in place for bytes) and averaged down to
+    about ``target_size`` before the modality and VOI LUTs or windowing are
+    applied, so a large study is never copied whole into memory. Compressed
+    transfer syntaxes decode only the selected frame.
+    """
+    header, offset = read_header(source)
+    if "Rows" not in header or "Columns" not in header:
+        raise DicomError("DICOM file has no image")
+    index = selected_frame(header, frame)
+    photometric = str(header.get("PhotometricInterpretation", "MONOCHROME2"))
+
+    start, length = _pixel_data_location(source, header, offset)
+    if length is not None:
+        pixels = _native_frame(source, header, start, length, index)
+    else:
+        try:
+            with _open(source) as f:
+                pixels = pixel_array(f, index=index)
+        except Exception as e:
+            syntax = header.file_meta.TransferSyntaxUID
+            raise DicomError(f"Could not decode {syntax.name} pixel data: {str(e)}")
+        # Color data comes back already converted to RGB
+        if pixels.ndim == 3:
+            photometric = "RGB"
+    image = _shrink_frame(pixels, target_size, header)
+
+    if image.ndim == 3:
+        if photometric.startswith("YBR"):
+            image = convert_color_space(image.astype(np.uint8), photometric, "RGB")
+        image = _to_uint8(image)
+        return cv2.cvtColor(image, cv2.COLOR_RGB2GRAY) if grayscale else image
+
+    # The LUTs are defined on stored integer values
+    image = np.rint(image).astype(pixels.dtype.newbyteorder("="))
+    image = apply_voi_lut(apply_modality_lut(image, header), header)
+    if photometric == "MONOCHROME1":
+        # Higher values are darker; flip so lungs look as they do in PNGs
+        image = -np.asarray(image, dtype=np.float32)
+    image = _to_uint8(image)
+    return image if grayscale else cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
@@ -0,0 +1,99 @@
+import os
+import threading
+import time
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+# ----------------------------
+# Identity Cache Settings
+# ----------------------------
+IDENTITY_CACHE_TTL = float(os.environ.get("IDENTITY_CACHE_TTL", "300"))
+IDENTITY_CACHE_MAX_ENTRIES = int(os.environ.get("IDENTITY_CACHE_MAX_ENTRIES", "10000"))
+
+
+class IdentityCache:
+    """Maps user emails to their _id for a bounded time
+
+    Only used for sessions created before the _id was stored in the session
+    cookie. Entries expire after ``ttl`` seconds and can be dropped explicitly
+    when an account changes.
+    """
+
+    def __init__(self, ttl=IDENTITY_CACHE_TTL, max_entries=IDENTITY_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, email):
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is None:
+                return None
+            user_id, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[email]
+                return None
+            return user_id
+
+    def put(self, email, user_id):
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._evict_expired()
+                if len(self._entries) >= self.max_entries:
+                    # Drop the entry closest to expiry
+                    oldest = min(self._entries, key=lambda k: self._entries[k][1])
+                    del self._entries[oldest]
+            self._entries[email] = (user_id, time.monotonic() + self.ttl)
+
+    def invalidate(self, email):
+        with self._lock:
+            self._entries.pop(email, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        for email in [k for k, (_, exp) in self._entries.items() if exp < now]:
+            del self._entries[email]
+
+
+identity_cache = IdentityCache()
+
+
+def session_user_dict(user):
+    """Build the session representation of a user document"""
+    return {"email": user["email"], "name": user["name"], "id": str(user["_id"])}
+
+
+def resolve_user_id(session, db):
+    """Return the ObjectId of the logged-in user, or None
+
+    Sessions carry the _id since login, so this normally makes no database
+    query. Older sessions that only hold the email are resolved once through
+    the identity cache and upgraded in place.
+    """
+    user = session.get("user")
+    if not user or "email" not in user:
+        return None
+
+    if user.get("id"):
+        try:
+            return ObjectId(user["id"])
+        except (InvalidId, TypeError):
+            pass
+
+    email = user["email"]
+    user_id = identity_cache.get(email)
+    if user_id is None:
+        user_doc = db.users.find_one({"email": email}, {"_id": 1})
+        if not user_doc:
+            return None
+        user_id = user_doc["_id"]
+        identity_cache.put(email, user_id)
+
+    session["user"] = dict(user, id=str(user_id))
+    return user_id
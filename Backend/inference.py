@@ -0,0 +1,186 @@
+import collections
+import os
+import queue
+import threading
+import time
+import traceback
+from concurrent.futures import Future
+
+import numpy as np
+
+from metrics import metrics
+
+# ----------------------------
+# Inference Scheduler Settings
+# ----------------------------
+INFERENCE_MAX_BATCH_SIZE = int(os.environ.get("INFERENCE_MAX_BATCH_SIZE", "16"))
+INFERENCE_MAX_WAIT_MS = float(os.environ.get("INFERENCE_MAX_WAIT_MS", "5"))
+
+INFERENCE_MODEL_SECONDS = metrics.histogram(
+    "inference_model_seconds",
+    "Duration of one batched model call",
+    ["backend", "kind"],
+)
+INFERENCE_QUEUE_WAIT_SECONDS = metrics.histogram(
+    "inference_queue_wait_seconds",
+    "Time a request waited before its batch started",
+)
+
+InferenceResult = collections.namedtuple(
+    "InferenceResult", ["prediction", "heatmap", "model_version"]
+)
+
+
+class InferenceRequest:
+    """A single preprocessed image waiting to be batched"""
+
+    __slots__ = ("image", "with_gradcam", "backend", "future", "enqueued_at")
+
+    def __init__(self, image, with_gradcam, backend=None):
+        self.image = image
+        self.with_gradcam = with_gradcam
+        self.backend = backend
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+
+
+class InferenceBatcher:
+    """Collects images from concurrent requests and runs them as one batch
+
+    A single scheduler thread takes the first queued request, then keeps
+    collecting until either ``max_batch_size`` requests are waiting or
+    ``max_wait_ms`` has passed, and runs the whole batch through the active
+    model in one call. Each caller gets its own row back through a Future.
+    """
+
+    def __init__(
+        self,
+        registry,
+        max_batch_size=INFERENCE_MAX_BATCH_SIZE,
+        max_wait_ms=INFERENCE_MAX_WAIT_MS,
+    ):
+        self.registry = registry
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self._requests = 0
+        self._batches = 0
+        self._batch_sizes = collections.Counter()
+        self._queue_wait_total = 0.0
+
+    def start(self):
+        """Start the scheduler thread if it is not already running"""
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="inference-batcher", daemon=True
+                )
+                self._thread.start()
+
+    def submit(self, image, with_gradcam=False, backend=None):
+        """Queue a preprocessed (224, 224, 3) image and return a Future
+
+        The Future resolves to an InferenceResult whose ``heatmap`` is None
+        unless Grad-CAM was requested. ``backend`` selects a model variant
+        (see LoadedModel.for_backend); None uses the default one.
+        """
+        # Started lazily so the thread is created in the serving process
+        # rather than in a parent that later forks.
+        if self._thread is None or not self._thread.is_alive():
+            self.start()
+        request = InferenceRequest(image, with_gradcam, backend)
+        self._queue.put(request)
+        return request.future
+
+    def predict(self, image, with_gradcam=False, timeout=None, backend=None):
+        """Submit an image and wait for its result"""
+        return self.submit(image, with_gradcam, backend).result(timeout=timeout)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                self._process(batch)
+            except Exception as e:
+                print(f"Inference batch failed: {str(e)}")
+                traceback.print_exc()
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+
+    def _process(self, batch):
+        started = time.monotonic()
+        # The whole batch runs on one model even if a reload happens meanwhile
+        loaded_model = self.registry.get()
+
+        groups = collections.defaultdict(list)
+        for request in batch:
+            groups[(request.backend, request.with_gradcam)].append(request)
+
+        for (backend, with_gradcam), requests in groups.items():
+            try:
+                model = loaded_model.for_backend(backend)
+            except Exception as e:
+                for request in requests:
+                    request.future.set_exception(e)
+                continue
+
+            images = np.stack([r.image for r in requests]).astype(np.float32)
+            kind = "gradcam" if with_gradcam else "predict"
+            with INFERENCE_MODEL_SECONDS.time(backend=model.backend, kind=kind):
+                if with_gradcam:
+                    scores, heatmaps = model.predict_with_gradcam(images)
+                else:
+                    scores, heatmaps = model.predict(images), [None] * len(requests)
+            for request, score, heatmap in zip(requests, scores, heatmaps):
+                request.future.set_result(
+                    InferenceResult(float(score), heatmap, model.version)
+                )
+
+        for request in batch:
+            INFERENCE_QUEUE_WAIT_SECONDS.observe(started - request.enqueued_at)
+        with self._stats_lock:
+            self._requests += len(batch)
+            self._batches += 1
+            self._batch_sizes[len(batch)] += 1
+            self._queue_wait_total += sum(started - r.enqueued_at for r in batch)
+
+    def stats(self):
+        """Return queue depth and batch-size statistics"""
+        with self._stats_lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "requests": self._requests,
+                "batches": self._batches,
+                "average_batch_size": (
+                    self._requests / self._batches if self._batches else 0.0
+                ),
+                "average_queue_wait_ms": (
+                    self._queue_wait_total / self._requests * 1000.0
+                    if self._requests
+                    else 0.0
+                ),
+                "batch_sizes": {
+                    str(size): count
+                    for size, count in sorted(self._batch_sizes.items())
+                },
+            }
@@ -0,0 +1,225 @@
+import bisect
+import contextlib
+import math
+import os
+import threading
+import time
+import traceback
+
+# ----------------------------
+# Metrics Settings
+# ----------------------------
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "true") == "true"
+METRICS_PREFIX = os.environ.get("METRICS_PREFIX", "mediscan")
+
+# Seconds; covers sub-millisecond cache lookups up to slow Grad-CAM batches
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+_NULL_CONTEXT = contextlib.nullcontext()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def histogram_samples(counts, buckets, labels=None):
+    """Collector samples for a histogram built from {value: occurrences}"""
+    labels = dict(labels or {})
+    samples = []
+    for bound in buckets:
+        cumulative = sum(n for value, n in counts.items() if value <= bound)
+        samples.append(("_bucket", dict(labels, le=_format_value(bound)), cumulative))
+    total = sum(counts.values())
+    samples.append(("_bucket", dict(labels, le="+Inf"), total))
+    samples.append(("_sum", labels, sum(value * n for value, n in counts.items())))
+    samples.append(("_count", labels, total))
+    return samples
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """A monotonically increasing count per label set"""
+
+    type = "counter"
+
+    def __init__(self, registry, name, help_text, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        if not self.registry.enabled:
+            return
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name + "_total", tuple(zip(self.labelnames, key)), value
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label set, as Prometheus expects"""
+
+    type = "histogram"
+
+    def __init__(self, registry, name, help_text, labelnames=(), buckets=None):
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets or DEFAULT_BUCKETS))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        if not self.registry.enabled:
+            return
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, **labels):
+        """Context manager observing the duration of its block in seconds"""
+        if not self.registry.enabled:
+            return _NULL_CONTEXT
+        return _Timer(self, labels)
+
+    def samples(self):
+        with self._lock:
+            items = [(key, (list(s[0]), s[1], s[2])) for key, s in self._series.items()]
+        for key, (counts, total, count) in items:
+            labels = tuple(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                bucket_labels = labels + (("le", _format_value(bound)),)
+                yield self.name + "_bucket", bucket_labels, cumulative
+            yield self.name + "_bucket", labels + (("le", "+Inf"),), count
+            yield self.name + "_sum", labels, total
+            yield self.name + "_count", labels, count
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+class MetricsRegistry:
+    """Holds the application's metrics and renders them for /metrics
+
+    Besides counters and histograms updated on the request path, components
+    that already keep their own statistics register a collector that is only
+    called when /metrics is scraped. With ``enabled`` off every update is a
+    single attribute check.
+    """
+
+    def __init__(self, prefix=METRICS_PREFIX, enabled=METRICS_ENABLED):
+        self.prefix = prefix
+        self.enabled = enabled
+        self._metrics = []
+        self._collectors = []
+
+    def _name(self, name):
+        return f"{self.prefix}_{name}" if self.prefix else name
+
+    def counter(self, name, help_text, labelnames=()):
+        metric = Counter(self, self._name(name), help_text, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labelnames=(), buckets=None):
+        metric = Histogram(self, self._name(name), help_text, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collect):
+        """Register ``collect()``, returning [(name, type, help, samples)]
+
+        ``samples`` is a list of (suffix, labels dict, value), the suffix
+        being e.g. "_total" or "_bucket"; names get the registry prefix.
+        """
+        self._collectors.append(collect)
+
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        for collect in self._collectors:
+            try:
+                families = collect()
+            except Exception as e:
+                print(f"Error collecting metrics: {str(e)}")
+                traceback.print_exc()
+                continue
+            for name, metric_type, help_text, samples in families:
+                name = self._name(name)
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for suffix, labels, value in samples:
+                    lines.append(
+                        f"{name}{suffix}{_format_labels(list(labels.items()))} "
+                        f"{_format_value(value)}"
+                    )
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,407 @@
+import datetime
+import hashlib
+import os
+import threading
+import traceback
+
+import numpy as np
+import tensorflow as tf
+
+# ----------------------------
+# Model Registry Settings
+# ----------------------------
+MODEL_PATH = os.environ.get("MODEL_PATH", "pneumonia_detection.keras")
+MODEL_RELOAD_INTERVAL = float(os.environ.get("MODEL_RELOAD_INTERVAL", "5"))
+MODEL_INPUT_SHAPE = (224, 224, 3)
+GRADCAM_LAYER = os.environ.get("GRADCAM_LAYER", "top_conv")
+# "keras", "tflite-float16" or "tflite-int8"; requests may override it
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "keras")
+# Batches are padded up to one of these sizes so that every call hits a
+# function that was traced and compiled at startup
+INFERENCE_BATCH_BUCKETS = tuple(
+    sorted(
+        {
+            int(size)
+            for size in os.environ.get("INFERENCE_BATCH_BUCKETS", "1,4,8,16").split(",")
+            if size.strip()
+        }
+    )
+)
+# XLA-compile the bucket functions. Off by default: on CPU, XLA's
+# convolutions were an order of magnitude slower than the oneDNN kernels TF
+# uses otherwise, but it can pay off on accelerators.
+INFERENCE_JIT_COMPILE = os.environ.get("INFERENCE_JIT_COMPILE", "false") == "true"
+
+
+class BackendUnavailable(ValueError):
+    """Raised when a request asks for an inference backend that is not active"""
+
+
+def bucket_for(batch_size, buckets=INFERENCE_BATCH_BUCKETS):
+    """Return the smallest bucket that fits ``batch_size`` (or the largest one)"""
+    for bucket in buckets:
+        if bucket >= batch_size:
+            return bucket
+    return buckets[-1]
+
+
+def run_in_buckets(fn, images, buckets=INFERENCE_BATCH_BUCKETS):
+    """Run ``fn(padded_images, bucket)`` over a batch in bucket-sized pieces
+
+    Batches larger than the largest bucket are split, and each piece is
+    padded with zeros up to its bucket. ``fn`` returns a tuple of arrays
+    whose first axis is the batch; the padding rows are dropped and the
+    pieces joined again.
+    """
+    images = np.asarray(images, dtype=np.float32)
+    largest = buckets[-1]
+    parts = []
+    for start in range(0, len(images), largest):
+        chunk = images[start : start + largest]
+        count = len(chunk)
+        bucket = bucket_for(count, buckets)
+        if bucket > count:
+            padding = np.zeros((bucket - count,) + chunk.shape[1:], np.float32)
+            chunk = np.concatenate([chunk, padding])
+        parts.append(tuple(output[:count] for output in fn(chunk, bucket)))
+    return tuple(np.concatenate(outputs) for outputs in zip(*parts))
+
+
+def file_version(path):
+    """Return a short content hash identifying a model file"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+class LoadedModel:
+    """A loaded Keras model together with the metadata that identifies it
+
+    Approved TFLite variants of the same model are attached in ``variants``
+    so that they are published and retired together with it.
+    """
+
+    backend = "keras"
+
+    def __init__(
+        self,
+        model,
+        path,
+        version,
+        gradcam_layer=GRADCAM_LAYER,
+        batch_buckets=INFERENCE_BATCH_BUCKETS,
+        jit_compile=INFERENCE_JIT_COMPILE,
+    ):
+        self.model = model
+        self.path = path
+        self.version = version
+        self.gradcam_layer = gradcam_layer
+        self.loaded_at = datetime.datetime.utcnow()
+        self.variants = {}
+        self.default_backend = "keras"
+
+        # Any batch size; used for export, where the shape must stay dynamic
+        signature = [tf.TensorSpec((None,) + MODEL_INPUT_SHAPE, tf.float32)]
+        self._predict_graph = self._predict
+        self._gradcam_graph = self._build_gradcam_fn()
+        self._predict_fn = tf.function(self._predict_graph, input_signature=signature)
+        self._gradcam_fn = tf.function(self._gradcam_graph, input_signature=signature)
+
+        # One fixed-shape, XLA-compiled concrete function per batch bucket,
+        # built on first use (warm_up builds them all)
+        self.batch_buckets = batch_buckets
+        self.jit_compile = jit_compile
+        self._bucket_fns = {}
+        self._bucket_lock = threading.Lock()
+
+    @property
+    def base_model(self):
+        """The EfficientNet backbone wrapped by the classifier"""
+        return self.model.layers[0]
+
+    def _predict(self, images):
+        return self.model(images, training=False)[:, 0]
+
+    def _build_gradcam_fn(self):
+        """Build the Grad-CAM sub-model once and return the function using it
+
+        The backbone is split at the Grad-CAM layer so that a single forward
+        pass yields both the conv activations and the backbone features, which
+        the classifier head turns into the prediction. As in the original
+        per-image make_gradcam_heatmap, the heatmap comes from the gradient of
+        the summed backbone features, not of the prediction.
+        """
+        base_model = self.base_model
+        conv_model = tf.keras.models.Model(
+            base_model.inputs,
+            [base_model.get_layer(self.gradcam_layer).output, base_model.output],
+        )
+        head_layers = self.model.layers[1:]
+
+        def predict_with_gradcam(images):
+            with tf.GradientTape() as tape:
+                # Watch the input so the path through the backbone is recorded
+                # even when its weights are frozen.
+                tape.watch(images)
+                conv_output, features = conv_model(images, training=False)
+                target = tf.reduce_sum(features)
+
+            # Samples don't interact in inference mode, so the gradient of the
+            # batch sum gives each sample's own gradient.
+            grads = tape.gradient(target, conv_output)
+            pooled_grads = tf.reduce_mean(grads, axis=(1, 2))
+            heatmaps = tf.einsum("bhwc,bc->bhw", conv_output, pooled_grads)
+            heatmaps = tf.maximum(heatmaps, 0)
+            heatmaps = heatmaps / (
+                tf.reduce_max(heatmaps, axis=(1, 2), keepdims=True) + 1e-8
+            )
+
+            preds = features
+            for layer in head_layers:
+                preds = layer(preds, training=False)
+            # The head has a single sigmoid output. A reshape rather than
+            # preds[:, 0] keeps the graph to ops that TFLite supports natively
+            # (see tflite_backend.py).
+            scores = tf.reshape(preds, [-1])
+            return scores, heatmaps
+
+        return predict_with_gradcam
+
+    def _bucket_fn(self, kind, bucket):
+        key = (kind, bucket)
+        fn = self._bucket_fns.get(key)
+        if fn is None:
+            with self._bucket_lock:
+                fn = self._bucket_fns.get(key)
+                if fn is None:
+                    graph = (
+                        self._predict_graph
+                        if kind == "predict"
+                        else self._gradcam_graph
+                    )
+                    fn = tf.function(
+                        graph,
+                        input_signature=[
+                            tf.TensorSpec((bucket,) + MODEL_INPUT_SHAPE, tf.float32)
+                        ],
+                        jit_compile=self.jit_compile,
+                    ).get_concrete_function()
+                    self._bucket_fns[key] = fn
+        return fn
+
+    def _run_bucket(self, kind, images, bucket):
+        outputs = self._bucket_fn(kind, bucket)(tf.constant(images))
+        if kind == "predict":
+            return (outputs.numpy(),)
+        return tuple(output.numpy() for output in outputs)
+
+    def predict(self, images):
+        """Return the pneumonia probability for each image in a batch"""
+        (scores,) = run_in_buckets(
+            lambda chunk, bucket: self._run_bucket("predict", chunk, bucket),
+            images,
+            self.batch_buckets,
+        )
+        return scores
+
+    def predict_with_gradcam(self, images):
+        """Return the probabilities and Grad-CAM heatmaps from one pass"""
+        return run_in_buckets(
+            lambda chunk, bucket: self._run_bucket("gradcam", chunk, bucket),
+            images,
+            self.batch_buckets,
+        )
+
+    def warm_up(self):
+        """Trace and compile every bucket so no request pays for it"""
+        for bucket in self.batch_buckets:
+            dummy = np.zeros((bucket,) + MODEL_INPUT_SHAPE, dtype=np.float32)
+            self.predict(dummy)
+            self.predict_with_gradcam(dummy)
+
+    def backends(self):
+        return ["keras"] + sorted(self.variants)
+
+    def for_backend(self, backend=None):
+        """Return the model serving ``backend`` (the default one if None)"""
+        backend = backend or self.default_backend
+        if backend == "keras":
+            return self
+        if backend not in self.variants:
+            raise BackendUnavailable(
+                f"Backend '{backend}' is not available; "
+                f"choose one of {', '.join(self.backends())}"
+            )
+        return self.variants[backend]
+
+    def info(self):
+        return {
+            "version": self.version,
+            "path": self.path,
+            "loaded_at": self.loaded_at.isoformat(),
+            "batch_buckets": list(self.batch_buckets),
+            "jit_compile": self.jit_compile,
+            "backend": self.default_backend,
+            "backends": {
+                name: variant.info() for name, variant in self.variants.items()
+            },
+        }
+
+
+class ModelRegistry:
+    """Loads the model once per process and hot-swaps it when the file changes
+
+    Callers take a reference with ``get()`` at the start of a request and use
+    that object until they are done, so a reload never affects a request that
+    is already running: the new model is only published once it is fully
+    loaded and warmed up.
+    """
+
+    def __init__(
+        self,
+        path=MODEL_PATH,
+        reload_interval=MODEL_RELOAD_INTERVAL,
+        backend=INFERENCE_BACKEND,
+    ):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.backend = backend
+        self._current = None
+        self._load_lock = threading.Lock()
+        self._loaded_stat = None
+        self._pending_stat = None
+        self._watcher = None
+        self._stop = threading.Event()
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def load(self):
+        """Load, warm up and publish the model currently on disk"""
+        with self._load_lock:
+            stat = self._stat()
+            if stat is None:
+                raise FileNotFoundError(f"Model file not found: {self.path}")
+
+            version = file_version(self.path)
+            print(f"Loading model {self.path} (version {version})...")
+            model = tf.keras.models.load_model(self.path)
+            loaded = LoadedModel(model, self.path, version)
+            loaded.warm_up()
+            self._attach_variants(loaded)
+
+            # A single reference assignment, so readers see either the old or
+            # the new model, never a partially initialized one.
+            self._current = loaded
+            self._loaded_stat = stat
+            self._pending_stat = None
+            print(f"Model version {version} is active")
+            return loaded
+
+    def _attach_variants(self, loaded):
+        """Activate the exported TFLite variants that pass the parity gate"""
+        from tflite_backend import (
+            TFLITE_DIR,
+            TFLITE_VARIANTS,
+            TFLITE_VERIFY_ON_LOAD,
+            VariantRejected,
+            backend_name,
+            load_reference_images,
+            load_variant,
+            variant_paths,
+        )
+
+        exported = [
+            variant
+            for variant in TFLITE_VARIANTS
+            if os.path.exists(
+                variant_paths(TFLITE_DIR, loaded.version, variant)["manifest"]
+            )
+        ]
+        images = None
+        if exported and TFLITE_VERIFY_ON_LOAD:
+            images = load_reference_images()
+            if not len(images):
+                print(
+                    "No reference images, TFLite variants are checked by manifest only"
+                )
+
+        for variant in exported:
+            try:
+                loaded.variants[backend_name(variant)] = load_variant(
+                    loaded, variant, images=images
+                )
+                print(f"TFLite {variant} variant of {loaded.version} is active")
+            except VariantRejected as e:
+                print(f"Refusing TFLite {variant} variant: {str(e)}")
+            except Exception as e:
+                print(f"Could not load TFLite {variant} variant: {str(e)}")
+                traceback.print_exc()
+
+        if self.backend in loaded.backends():
+            loaded.default_backend = self.backend
+        else:
+            print(f"Backend '{self.backend}' is not available, serving with Keras")
+
+    def get(self):
+        """Return the active model, loading it on first use"""
+        current = self._current
+        if current is None:
+            current = self.load()
+        return current
+
+    @property
+    def version(self):
+        current = self._current
+        return current.version if current is not None else None
+
+    def info(self):
+        current = self._current
+        if current is None:
+            return {"loaded": False, "path": self.path}
+        return dict(current.info(), loaded=True)
+
+    def check_for_update(self):
+        """Reload the model if the file changed and has stopped changing"""
+        stat = self._stat()
+        if stat is None or stat == self._loaded_stat:
+            self._pending_stat = None
+            return False
+
+        # Wait for the file to be stable for one interval so that a model
+        # which is still being copied into place is not picked up half-written.
+        if stat != self._pending_stat:
+            self._pending_stat = stat
+            return False
+
+        try:
+            self.load()
+            return True
+        except Exception as e:
+            print(f"Model reload failed, keeping version {self.version}: {str(e)}")
+            traceback.print_exc()
+            # Don't retry until the file changes again
+            self._loaded_stat = stat
+            return False
+
+    def _watch(self):
+        while not self._stop.wait(self.reload_interval):
+            self.check_for_update()
+
+    def start_watcher(self):
+        """Start a daemon thread that hot-reloads the model file"""
+        if self.reload_interval <= 0 or self._watcher is not None:
+            return
+        self._watcher = threading.Thread(
+            target=self._watch, name="model-reloader", daemon=True
+        )
+        self._watcher.start()
+
+    def stop_watcher(self):
+        self._stop.set()
@@ -0,0 +1,246 @@
+import collections
+import hashlib
+import hmac
+import os
+import threading
+import time
+import traceback
+
+import cv2
+import numpy as np
+from bson import Binary
+
+# ----------------------------
+# Overlay Settings
+# ----------------------------
+OVERLAY_CACHE_FOLDER = os.environ.get("OVERLAY_CACHE_FOLDER", "cache/overlays")
+# Longest edges overlays are rendered at; requested sizes are rounded up to
+# one of these so each result has only a few cached variants
+OVERLAY_SIZES = tuple(
+    sorted(
+        int(size)
+        for size in os.environ.get("OVERLAY_SIZES", "128,384,1024,2048").split(",")
+    )
+)
+OVERLAY_DEFAULT_SIZE = int(os.environ.get("OVERLAY_DEFAULT_SIZE", "1024"))
+# Rendered overlays on disk beyond this are evicted, least recently used first
+OVERLAY_CACHE_MAX_BYTES = int(
+    os.environ.get("OVERLAY_CACHE_MAX_BYTES", str(512 * 1024 * 1024))
+)
+OVERLAY_CACHE_MAX_AGE = int(os.environ.get("OVERLAY_CACHE_MAX_AGE", "86400"))
+# Seconds a signed overlay URL stays valid, at least; see sign_result_id
+OVERLAY_URL_TTL = int(os.environ.get("OVERLAY_URL_TTL", "86400"))
+
+# format name -> (file extension, MIME type, cv2.imencode parameters)
+OVERLAY_FORMATS = {
+    "jpeg": (".jpg", "image/jpeg", [cv2.IMWRITE_JPEG_QUALITY, 90]),
+    "webp": (".webp", "image/webp", [cv2.IMWRITE_WEBP_QUALITY, 85]),
+    "png": (".png", "image/png", [cv2.IMWRITE_PNG_COMPRESSION, 3]),
+}
+OVERLAY_FORMAT_ALIASES = {"jpg": "jpeg"}
+
+
+def pack_heatmap(heatmap):
+    """Store a low-resolution Grad-CAM heatmap compactly as float16 bytes"""
+    heatmap = np.asarray(heatmap, dtype=np.float16)
+    return {
+        "shape": list(heatmap.shape),
+        "dtype": "float16",
+        "data": Binary(heatmap.tobytes()),
+    }
+
+
+def unpack_heatmap(packed):
+    """Restore a heatmap stored with pack_heatmap as float32"""
+    heatmap = np.frombuffer(bytes(packed["data"]), dtype=packed.get("dtype", "float16"))
+    return heatmap.reshape(packed["shape"]).astype(np.float32)
+
+
+def overlay_heatmap_on_image(heatmap, original_img):
+    heatmap = cv2.resize(heatmap, (original_img.shape[1], original_img.shape[0]))
+    heatmap_uint8 = np.uint8(255 * heatmap)
+    heatmap_colored = cv2.applyColorMap(heatmap_uint8, cv2.COLORMAP_JET)
+    superimposed_img = cv2.addWeighted(original_img, 0.6, heatmap_colored, 0.4, 0)
+    return superimposed_img
+
+
+def parse_overlay_request(args):
+    """Validate the size and format query parameters of an overlay request"""
+    fmt = args.get("format", "jpeg").lower()
+    fmt = OVERLAY_FORMAT_ALIASES.get(fmt, fmt)
+    if fmt not in OVERLAY_FORMATS:
+        raise ValueError(f"'format' must be one of {', '.join(OVERLAY_FORMATS)}")
+
+    try:
+        size = int(args.get("size", OVERLAY_DEFAULT_SIZE))
+    except ValueError:
+        raise ValueError("'size' must be an integer")
+    if size < 1:
+        raise ValueError("'size' must be positive")
+    # The smallest rendered size that is at least as large, or the largest
+    size = next((s for s in OVERLAY_SIZES if s >= size), OVERLAY_SIZES[-1])
+    return size, fmt
+
+
+def render_overlay(heatmap, image_rgb, size, fmt):
+    """Render the overlay with its longest edge at most ``size`` pixels"""
+    height, width = image_rgb.shape[:2]
+    scale = min(1.0, size / max(height, width))
+    if scale < 1.0:
+        image_rgb = cv2.resize(
+            image_rgb,
+            (max(1, round(width * scale)), max(1, round(height * scale))),
+            interpolation=cv2.INTER_AREA,
+        )
+    extension, _, params = OVERLAY_FORMATS[fmt]
+    ok, buffer = cv2.imencode(
+        extension, overlay_heatmap_on_image(heatmap, image_rgb), params
+    )
+    if not ok:
+        raise ValueError(f"Could not encode overlay as {fmt}")
+    return buffer.tobytes()
+
+
+def overlay_etag(result_id, packed, size, fmt):
+    """Strong validator for one rendered variant of a result's overlay"""
+    digest = hashlib.sha1()
+    digest.update(str(result_id).encode("ascii"))
+    digest.update(bytes(packed["data"]))
+    digest.update(f"{size}:{fmt}".encode("ascii"))
+    return digest.hexdigest()
+
+
+def _result_signature(key, result_id, expires):
+    payload = f"{result_id}:{expires}".encode("ascii")
+    return hmac.new(key, payload, hashlib.sha256).hexdigest()[:32]
+
+
+def sign_result_id(secret_key, result_id, ttl=OVERLAY_URL_TTL, now=None):
+    """Sign a result id so its overlay URL works without a session cookie
+
+    The signature expires between ``ttl`` and twice ``ttl`` seconds from
+    now. Expiry is rounded to a whole number of ``ttl`` periods so URLs
+    signed in the same period are identical and stay cacheable.
+    """
+    key = secret_key.encode("utf-8") if isinstance(secret_key, str) else secret_key
+    now = time.time() if now is None else now
+    expires = (int(now) // ttl + 2) * ttl
+    return f"{expires}.{_result_signature(key, result_id, expires)}"
+
+
+def verify_result_signature(secret_key, result_id, signature, now=None):
+    if not signature:
+        return False
+    expires, _, digest = signature.partition(".")
+    try:
+        expires = int(expires)
+    except ValueError:
+        return False
+    if expires <= (time.time() if now is None else now):
+        return False
+    key = secret_key.encode("utf-8") if isinstance(secret_key, str) else secret_key
+    return hmac.compare_digest(_result_signature(key, result_id, expires), digest)
+
+
+class OverlayCache:
+    """On-disk cache of rendered overlay variants
+
+    Bounded to ``max_bytes`` in total; the least recently used files are
+    deleted first. Files left by a previous run are picked up in order of
+    their modification time.
+    """
+
+    def __init__(self, folder=OVERLAY_CACHE_FOLDER, max_bytes=OVERLAY_CACHE_MAX_BYTES):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        # path -> size, least recently used first
+        self._files = collections.OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self._load()
+
+    def _load(self):
+        found = []
+        for root, _, names in os.walk(self.folder):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    info = os.stat(path)
+                except OSError:
+                    continue
+                found.append((info.st_mtime, path, info.st_size))
+        for _, path, size in sorted(found):
+            if path.endswith(".tmp"):
+                # Left behind by a crash during put()
+                self._remove(path)
+                continue
+            self._files[path] = size
+            self._bytes += size
+        self._evict()
+
+    def _path(self, result_id, etag, fmt):
+        extension = OVERLAY_FORMATS[fmt][0]
+        return os.path.join(self.folder, str(result_id), f"{etag}{extension}")
+
+    def get(self, result_id, etag, fmt):
+        path = self._path(result_id, etag, fmt)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        with self._lock:
+            if path in self._files:
+                self._files.move_to_end(path)
+            else:
+                # Written by another worker process
+                self._files[path] = len(data)
+                self._bytes += len(data)
+                self._evict()
+        return data
+
+    def put(self, result_id, etag, fmt, data):
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(result_id, etag, fmt)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error caching overlay {path}: {str(e)}")
+            traceback.print_exc()
+            return
+        with self._lock:
+            self._bytes -= self._files.pop(path, 0)
+            self._files[path] = len(data)
+            self._bytes += len(data)
+            self._evict()
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and self._files:
+            path, size = self._files.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+            self._remove(path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+            # Drop the result's directory once its last variant is gone
+            os.rmdir(os.path.dirname(path))
+        except OSError:
+            pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                "files": len(self._files),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+            }
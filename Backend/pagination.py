@@ -0,0 +1,98 @@
+import base64
+import datetime
+import json
+import os
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+# ----------------------------
+# Pagination Settings
+# ----------------------------
+RESULTS_PAGE_SIZE = int(os.environ.get("RESULTS_PAGE_SIZE", "50"))
+RESULTS_MAX_PAGE_SIZE = int(os.environ.get("RESULTS_MAX_PAGE_SIZE", "500"))
+RESULT_CLASSES = ("NORMAL", "PNEUMONIA")
+
+# Results are always returned newest first, with _id breaking ties so that
+# the (created_at, _id) position of the last document identifies the page.
+RESULTS_SORT = [("created_at", -1), ("_id", -1)]
+
+
+class InvalidQuery(ValueError):
+    """Raised for malformed pagination or filter parameters"""
+
+
+def encode_cursor(doc):
+    """Return an opaque token pointing just past the given result document"""
+    payload = {"t": doc["created_at"].isoformat(), "id": str(doc["_id"])}
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token):
+    """Decode a token from encode_cursor into (created_at, _id)"""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        payload = json.loads(raw)
+        return datetime.datetime.fromisoformat(payload["t"]), ObjectId(payload["id"])
+    except (ValueError, KeyError, TypeError, InvalidId):
+        raise InvalidQuery("Invalid pagination token")
+
+
+def parse_datetime(value, name):
+    try:
+        parsed = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise InvalidQuery(f"'{name}' must be an ISO 8601 date or datetime")
+    # created_at is stored as naive UTC
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def parse_limit(value):
+    if value is None:
+        return RESULTS_PAGE_SIZE
+    try:
+        limit = int(value)
+    except ValueError:
+        raise InvalidQuery("'limit' must be an integer")
+    if limit < 1:
+        raise InvalidQuery("'limit' must be at least 1")
+    return min(limit, RESULTS_MAX_PAGE_SIZE)
+
+
+def build_results_query(user_id, args):
+    """Build the MongoDB filter and page size for a /api/results request
+
+    Supported arguments are ``limit``, ``next`` (a token from a previous
+    page), ``class`` (NORMAL or PNEUMONIA) and ``from``/``to`` bounds on
+    ``created_at``. Every filter is expressed in the query itself so that
+    MongoDB can answer it from the (user_id, created_at, _id) index.
+    """
+    query = {"user_id": user_id}
+
+    predicted_class = args.get("class")
+    if predicted_class:
+        predicted_class = predicted_class.upper()
+        if predicted_class not in RESULT_CLASSES:
+            raise InvalidQuery(f"'class' must be one of {', '.join(RESULT_CLASSES)}")
+        query["predicted_class"] = predicted_class
+
+    created_at = {}
+    if args.get("from"):
+        created_at["$gte"] = parse_datetime(args["from"], "from")
+    if args.get("to"):
+        created_at["$lte"] = parse_datetime(args["to"], "to")
+    if created_at:
+        query["created_at"] = created_at
+
+    token = args.get("next")
+    if token:
+        last_created_at, last_id = decode_cursor(token)
+        query["$or"] = [
+            {"created_at": {"$lt": last_created_at}},
+            {"created_at": last_created_at, "_id": {"$lt": last_id}},
+        ]
+
+    return query, parse_limit(args.get("limit"))
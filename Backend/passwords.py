@@ -0,0 +1,205 @@
+import os
+import re
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+# ----------------------------
+# Password Hashing Settings
+# ----------------------------
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(
+    os.environ.get("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1)))
+)
+# Requests beyond workers + this many waiting are turned away instead of
+# tying up a request thread
+PASSWORD_HASH_MAX_PENDING = int(os.environ.get("PASSWORD_HASH_MAX_PENDING", "64"))
+PASSWORD_HASH_TIMEOUT = float(os.environ.get("PASSWORD_HASH_TIMEOUT", "10"))
+BCRYPT_TARGET_MS = float(os.environ.get("BCRYPT_TARGET_MS", "250"))
+
+BCRYPT_HASH_PATTERN = re.compile(rb"^\$2[abxy]?\$(\d{2})\$")
+
+
+class PasswordQueueFull(Exception):
+    """Raised when too many password operations are already waiting"""
+
+
+def _to_bytes(value):
+    return value.encode("utf-8") if isinstance(value, str) else value
+
+
+def hash_password(password, rounds=BCRYPT_ROUNDS):
+    """Hash a password using bcrypt"""
+    return bcrypt.hashpw(_to_bytes(password), bcrypt.gensalt(rounds))
+
+
+def check_password(password, hashed_password):
+    """Verify a password against a hash"""
+    if isinstance(hashed_password, bytes):
+        return bcrypt.checkpw(_to_bytes(password), hashed_password)
+    return False
+
+
+def hash_rounds(hashed_password):
+    """Return the cost factor of a bcrypt hash, or None if it is not one"""
+    if not isinstance(hashed_password, bytes):
+        return None
+    match = BCRYPT_HASH_PATTERN.match(hashed_password)
+    return int(match.group(1)) if match else None
+
+
+def needs_rehash(hashed_password, rounds=BCRYPT_ROUNDS):
+    return hash_rounds(hashed_password) not in (None, rounds)
+
+
+class PasswordHasher:
+    """Runs bcrypt on a dedicated, bounded pool of worker threads
+
+    bcrypt releases the GIL, so hashing on these threads does not hold up
+    other requests; the pool size caps how many cores logins can take at
+    once, and the pending limit makes a login burst fail fast with
+    PasswordQueueFull rather than pile up behind uploads.
+    """
+
+    def __init__(
+        self,
+        max_workers=PASSWORD_HASH_WORKERS,
+        max_pending=PASSWORD_HASH_MAX_PENDING,
+        timeout=PASSWORD_HASH_TIMEOUT,
+        rounds=BCRYPT_ROUNDS,
+    ):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.rounds = rounds
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="bcrypt"
+        )
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.rehashed = 0
+        self.running = 0
+        self.max_queue_depth = 0
+        self.queue_wait_total = 0.0
+        self.run_time_total = 0.0
+
+    def _submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise PasswordQueueFull("Too many password operations in progress")
+
+        submitted_at = time.perf_counter()
+        with self._lock:
+            self.submitted += 1
+            depth = self.submitted - self.completed - self.running
+            self.max_queue_depth = max(self.max_queue_depth, depth)
+
+        def run():
+            started_at = time.perf_counter()
+            with self._lock:
+                self.running += 1
+                self.queue_wait_total += started_at - submitted_at
+            try:
+                return fn(*args)
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self.completed += 1
+                    self.run_time_total += time.perf_counter() - started_at
+                self._slots.release()
+
+        return self._executor.submit(run)
+
+    def hash(self, password):
+        """Hash a password on the pool and wait for the result"""
+        return self._submit(hash_password, password, self.rounds).result(self.timeout)
+
+    def check(self, password, hashed_password):
+        """Verify a password on the pool and wait for the result"""
+        return self._submit(check_password, password, hashed_password).result(
+            self.timeout
+        )
+
+    def rehash_in_background(self, password, hashed_password, store):
+        """Re-hash at the configured cost if the stored hash uses another one
+
+        ``store(old_hash, new_hash)`` is called on the pool once the new hash
+        is ready, so the login that triggered it does not wait for it. When
+        the pool is saturated the upgrade is skipped and retried on the next
+        login.
+        """
+        if not needs_rehash(hashed_password, self.rounds):
+            return None
+
+        def upgrade():
+            new_hash = hash_password(password, self.rounds)
+            try:
+                store(hashed_password, new_hash)
+                with self._lock:
+                    self.rehashed += 1
+            except Exception as e:
+                print(f"Error storing upgraded password hash: {str(e)}")
+                traceback.print_exc()
+
+        try:
+            return self._submit(upgrade)
+        except PasswordQueueFull:
+            return None
+
+    def stats(self):
+        with self._lock:
+            started = self.completed + self.running
+            return {
+                "rounds": self.rounds,
+                "workers": self.max_workers,
+                "max_pending": self.max_pending,
+                "running": self.running,
+                "queue_depth": self.submitted - started,
+                "max_queue_depth": self.max_queue_depth,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "rehashed": self.rehashed,
+                "average_queue_wait_ms": (
+                    self.queue_wait_total / started * 1000.0 if started else 0.0
+                ),
+                "average_run_ms": (
+                    self.run_time_total / self.completed * 1000.0
+                    if self.completed
+                    else 0.0
+                ),
+            }
+
+
+def time_rounds(rounds, samples=3):
+    """Return the median time in milliseconds of one bcrypt hash at ``rounds``"""
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        bcrypt.hashpw(b"calibration-password", bcrypt.gensalt(rounds))
+        timings.append((time.perf_counter() - started) * 1000.0)
+    return sorted(timings)[len(timings) // 2]
+
+
+def calibrate_rounds(target_ms=BCRYPT_TARGET_MS, min_rounds=10, max_rounds=16):
+    """Pick the highest cost factor whose hash time stays within ``target_ms``
+
+    Each extra round doubles the work, so timing stops as soon as the target
+    is exceeded. Returns (rounds, {rounds: milliseconds}); never goes below
+    ``min_rounds`` even on slow hardware.
+    """
+    timings = {}
+    best = min_rounds
+    for rounds in range(min_rounds, max_rounds + 1):
+        timings[rounds] = time_rounds(rounds)
+        if timings[rounds] > target_ms:
+            break
+        best = rounds
+    return best, timings
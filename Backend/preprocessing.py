@@ -0,0 +1,104 @@
+import threading
+
+import cv2
+import numpy as np
+from tensorflow.keras.applications.efficientnet import (
+    preprocess_input as efficientnet_preprocess,
+)
+
+# ----------------------------
+# Preprocessing Settings
+# ----------------------------
+TARGET_SIZE = (224, 224)
+GAMMA = 0.7
+CLAHE_CLIP_LIMIT = 0.03
+CLAHE_TILE_GRID_SIZE = (8, 8)
+
+# Gamma correction on uint8 data only ever sees 256 distinct values, so it is
+# computed once with the same float32 arithmetic the per-pixel version used.
+GAMMA_LUT = (np.power(np.arange(256, dtype=np.float32) / 255.0, GAMMA) * 255).astype(
+    np.uint8
+)
+
+# CLAHE objects keep internal buffers, so each thread gets its own instance
+# and reuses it for every image it processes.
+_thread_state = threading.local()
+
+
+def get_clahe():
+    """Return this thread's CLAHE instance, creating it on first use"""
+    clahe = getattr(_thread_state, "clahe", None)
+    if clahe is None:
+        clahe = cv2.createCLAHE(
+            clipLimit=CLAHE_CLIP_LIMIT, tileGridSize=CLAHE_TILE_GRID_SIZE
+        )
+        _thread_state.clahe = clahe
+    return clahe
+
+
+def to_grayscale(image):
+    """Convert an RGB or single-channel image to a 2-D grayscale array"""
+    if image.ndim == 3 and image.shape[2] == 3:
+        return cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    if image.ndim == 3:
+        return image[:, :, 0]
+    return image
+
+
+def normalize_to_uint8(image_gray):
+    """Min-max stretch a grayscale image to the full uint8 range"""
+    if image_gray.dtype == np.uint8:
+        min_val, max_val, _, _ = cv2.minMaxLoc(image_gray)
+        min_val = np.float32(min_val)
+        max_val = np.float32(max_val)
+        lut = (
+            (np.arange(256, dtype=np.float32) - min_val)
+            / (max_val - min_val + 1e-8)
+            * 255
+        )
+        # Entries outside [min, max] never occur in the image
+        lut = np.clip(lut, 0, 255).astype(np.uint8)
+        return cv2.LUT(image_gray, lut)
+
+    # 16-bit and float inputs have too many levels for a table
+    image_norm = image_gray.astype("float32")
+    min_val = np.min(image_norm)
+    max_val = np.max(image_norm)
+    image_norm = (image_norm - min_val) / (max_val - min_val + 1e-8)
+    return (image_norm * 255).astype("uint8")
+
+
+def enhance_chest_xray(image):
+    """Denoise, equalize and gamma-correct one image, returning 224x224 uint8"""
+    image_uint8 = normalize_to_uint8(to_grayscale(image))
+
+    denoised = cv2.GaussianBlur(image_uint8, (3, 3), 0)
+    denoised = cv2.medianBlur(denoised, 3)
+    contrast_enhanced = get_clahe().apply(denoised)
+    final_image = cv2.LUT(contrast_enhanced, GAMMA_LUT)
+
+    # Resizing is per channel, so shrinking the single channel first gives the
+    # same result as resizing the stacked 3-channel image at a fraction of
+    # the cost.
+    return cv2.resize(final_image, TARGET_SIZE)
+
+
+def preprocess_chest_xray_batch(images):
+    """Preprocess a list of images into one EfficientNet-ready batch
+
+    Returns a float32 array of shape (N, 224, 224, 3) and the list of
+    224x224 RGB uint8 images that went into it.
+    """
+    batch = np.empty((len(images),) + TARGET_SIZE[::-1] + (3,), dtype=np.float32)
+    display_images = []
+    for i, image in enumerate(images):
+        enhanced = enhance_chest_xray(image)
+        batch[i] = enhanced[:, :, np.newaxis]
+        display_images.append(cv2.merge((enhanced, enhanced, enhanced)))
+    return efficientnet_preprocess(batch), display_images
+
+
+def preprocess_chest_xray_for_efficientnet(image):
+    """Preprocess a single image; see preprocess_chest_xray_batch"""
+    batch, display_images = preprocess_chest_xray_batch([image])
+    return batch[0], display_images[0]
@@ -0,0 +1,195 @@
+import cProfile
+import datetime
+import os
+import re
+import shutil
+import tempfile
+import threading
+import traceback
+
+# ----------------------------
+# Request Profiling Settings
+# ----------------------------
+SERVER_TIMING_ENABLED = os.environ.get("SERVER_TIMING_ENABLED", "true") == "true"
+# Profile one in every N /api/* requests; 0 disables sampling
+PROFILE_SAMPLE_RATE = int(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+# Keep the profile of any request slower than this; 0 disables. While set,
+# every request runs under the profiler whenever it is not already busy.
+PROFILE_SLOW_MS = float(os.environ.get("PROFILE_SLOW_MS", "0"))
+# "cprofile" for the Python call graph of the request thread, "tensorflow" for
+# a TensorFlow profiler trace (viewable in TensorBoard) of the whole process
+PROFILE_MODE = os.environ.get("PROFILE_MODE", "cprofile")
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+PROFILE_MAX_FILES = int(os.environ.get("PROFILE_MAX_FILES", "50"))
+
+PROFILE_MODES = ("cprofile", "tensorflow")
+
+_UNSAFE_CHARS = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+class RequestTimings:
+    """Stage durations of one request, rendered as a Server-Timing header"""
+
+    __slots__ = ("stages",)
+
+    def __init__(self):
+        self.stages = {}
+
+    def add(self, name, seconds):
+        # A stage that runs more than once (e.g. per batch file) is summed
+        total, count = self.stages.get(name, (0.0, 0))
+        self.stages[name] = (total + seconds, count + 1)
+
+    def header(self, total_seconds=None):
+        entries = []
+        for name, (seconds, count) in self.stages.items():
+            entry = f"{_UNSAFE_CHARS.sub('_', name)};dur={seconds * 1000.0:.2f}"
+            if count > 1:
+                entry += f';desc="x{count}"'
+            entries.append(entry)
+        if total_seconds is not None:
+            entries.append(f"total;dur={total_seconds * 1000.0:.2f}")
+        return ", ".join(entries)
+
+
+class _Capture:
+    __slots__ = ("profiler", "trace_dir", "sampled")
+
+    def __init__(self, profiler, trace_dir, sampled):
+        self.profiler = profiler
+        self.trace_dir = trace_dir
+        self.sampled = sampled
+
+
+class SamplingProfiler:
+    """Profiles 1-in-N requests, or keeps the profiles of slow requests
+
+    Only one request is profiled at a time: neither cProfile nor the
+    TensorFlow profiler can run twice at once, and it bounds the overhead.
+    Requests arriving while a capture is in progress are not profiled.
+    The newest ``max_files`` captures are kept in ``directory``.
+    """
+
+    def __init__(
+        self,
+        sample_rate=PROFILE_SAMPLE_RATE,
+        slow_ms=PROFILE_SLOW_MS,
+        mode=PROFILE_MODE,
+        directory=PROFILE_DIR,
+        max_files=PROFILE_MAX_FILES,
+    ):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"PROFILE_MODE must be one of {', '.join(PROFILE_MODES)}")
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.mode = mode
+        self.directory = directory
+        self.max_files = max_files
+        self.enabled = sample_rate > 0 or slow_ms > 0
+        self._busy = threading.Lock()
+        self._lock = threading.Lock()
+        self._requests = 0
+        self.captured = 0
+        self.saved = 0
+        self.skipped_busy = 0
+
+    def start(self):
+        """Start profiling the current request if it is selected
+
+        Returns a capture to pass to ``finish``, or None.
+        """
+        with self._lock:
+            self._requests += 1
+            sampled = self.sample_rate > 0 and self._requests % self.sample_rate == 0
+        if not sampled and self.slow_ms <= 0:
+            return None
+        if not self._busy.acquire(blocking=False):
+            with self._lock:
+                self.skipped_busy += 1
+            return None
+
+        try:
+            if self.mode == "tensorflow":
+                import tensorflow as tf
+
+                trace_dir = tempfile.mkdtemp(prefix="trace-")
+                tf.profiler.experimental.start(trace_dir)
+                capture = _Capture(None, trace_dir, sampled)
+            else:
+                profiler = cProfile.Profile()
+                profiler.enable()
+                capture = _Capture(profiler, None, sampled)
+        except Exception as e:
+            self._busy.release()
+            print(f"Error starting profiler: {str(e)}")
+            return None
+        with self._lock:
+            self.captured += 1
+        return capture
+
+    def finish(self, capture, elapsed_seconds, label):
+        """Stop a capture and save it if it was sampled or the request was slow
+
+        Returns the saved path, or None.
+        """
+        try:
+            if capture.profiler is not None:
+                capture.profiler.disable()
+            else:
+                import tensorflow as tf
+
+                tf.profiler.experimental.stop()
+
+            elapsed_ms = elapsed_seconds * 1000.0
+            slow = self.slow_ms > 0 and elapsed_ms >= self.slow_ms
+            if not (capture.sampled or slow):
+                return None
+            return self._save(capture, elapsed_ms, label)
+        except Exception as e:
+            print(f"Error saving profile: {str(e)}")
+            traceback.print_exc()
+            return None
+        finally:
+            if capture.trace_dir is not None and os.path.isdir(capture.trace_dir):
+                shutil.rmtree(capture.trace_dir, ignore_errors=True)
+            self._busy.release()
+
+    def _save(self, capture, elapsed_ms, label):
+        os.makedirs(self.directory, exist_ok=True)
+        timestamp = datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+        slug = _UNSAFE_CHARS.sub("_", label).strip("_")[:80]
+        name = f"{timestamp}-{slug}-{elapsed_ms:.0f}ms"
+        if capture.profiler is not None:
+            path = os.path.join(self.directory, f"{name}.prof")
+            capture.profiler.dump_stats(path)
+        else:
+            path = os.path.join(self.directory, name)
+            shutil.move(capture.trace_dir, path)
+        with self._lock:
+            self.saved += 1
+        self._rotate()
+        return path
+
+    def _rotate(self):
+        """Delete the oldest captures beyond ``max_files``"""
+        entries = sorted(os.listdir(self.directory))
+        for name in entries[: max(0, len(entries) - self.max_files)]:
+            path = os.path.join(self.directory, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "mode": self.mode,
+                "sample_rate": self.sample_rate,
+                "slow_ms": self.slow_ms,
+                "directory": self.directory,
+                "requests": self._requests,
+                "captured": self.captured,
+                "saved": self.saved,
+                "skipped_busy": self.skipped_busy,
+            }
@@ -0,0 +1,210 @@
+import collections
+import datetime
+import hashlib
+import os
+import re
+import threading
+import traceback
+
+# ----------------------------
+# Result Cache Settings
+# ----------------------------
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get("RESULT_CACHE_MAX_ENTRIES", "2048"))
+RESULT_CACHE_MAX_BYTES = int(
+    os.environ.get("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024))
+)
+RESULT_CACHE_COLLECTION = os.environ.get("RESULT_CACHE_COLLECTION", "result_cache")
+
+
+def content_hash(data):
+    """Return the SHA-256 hex digest identifying an uploaded file"""
+    return hashlib.sha256(data).hexdigest()
+
+
+class LRUCache:
+    """A thread-safe LRU bounded by both entry count and total size in bytes"""
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = collections.OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            self._entries.move_to_end(key)
+            return item[0]
+
+    def put(self, key, value, size):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+            }
+
+
+class ResultCache:
+    """Two-tier cache of analysis results keyed by image hash and model version
+
+    Heatmaps are kept in the compact form produced by overlays.pack_heatmap.
+    The first tier is an in-process LRU, the second a MongoDB collection
+    shared by every worker. Entries are only valid for the model version
+    that produced them; when a new version shows up the in-process tier is
+    cleared and entries for older versions are removed from MongoDB.
+    Variants of one model ("<version>+tflite-int8") are cached separately
+    but belong to the same generation, so switching between them doesn't
+    purge anything.
+    """
+
+    def __init__(
+        self,
+        get_db,
+        max_entries=RESULT_CACHE_MAX_ENTRIES,
+        max_bytes=RESULT_CACHE_MAX_BYTES,
+        collection_name=RESULT_CACHE_COLLECTION,
+    ):
+        self.get_db = get_db
+        self.collection_name = collection_name
+        self.memory = LRUCache(max_entries, max_bytes)
+        self._model_version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def _collection(self):
+        return self.get_db()[self.collection_name]
+
+    def _check_model_version(self, model_version):
+        generation = model_version.split("+", 1)[0]
+        with self._lock:
+            if generation == self._model_version:
+                return
+            previous = self._model_version
+            self._model_version = generation
+        self.memory.clear()
+        if previous is not None:
+            try:
+                self._collection().delete_many(
+                    {
+                        "model_version": {
+                            "$not": re.compile(rf"^{re.escape(generation)}(\+|$)")
+                        }
+                    }
+                )
+            except Exception as e:
+                print(f"Error purging result cache: {str(e)}")
+
+    def get(self, image_hash, model_version, with_gradcam=False):
+        """Return the cached entry, or None if it is missing or lacks Grad-CAM"""
+        if model_version is None:
+            return None
+        self._check_model_version(model_version)
+        key = (image_hash, model_version)
+
+        entry = self.memory.get(key)
+        if entry is None:
+            try:
+                doc = self._collection().find_one(
+                    {"_id": f"{image_hash}:{model_version}"}
+                )
+            except Exception as e:
+                print(f"Error reading result cache: {str(e)}")
+                doc = None
+            if doc is not None:
+                entry = {
+                    "prediction": doc["prediction"],
+                    "predicted_class": doc["predicted_class"],
+                    "heatmap": doc.get("heatmap"),
+                }
+                self.memory.put(key, entry, self._entry_size(entry))
+                if not with_gradcam or entry["heatmap"] is not None:
+                    self.db_hits += 1
+
+        if entry is None or (with_gradcam and entry["heatmap"] is None):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def put(self, image_hash, model_version, prediction, predicted_class, heatmap=None):
+        """Store a result in both tiers"""
+        if model_version is None:
+            return
+        self._check_model_version(model_version)
+        key = (image_hash, model_version)
+
+        # Don't lose a heatmap computed earlier when the new result has none
+        existing = self.memory.get(key)
+        if heatmap is None and existing is not None:
+            heatmap = existing["heatmap"]
+
+        entry = {
+            "prediction": prediction,
+            "predicted_class": predicted_class,
+            "heatmap": heatmap,
+        }
+        self.memory.put(key, entry, self._entry_size(entry))
+
+        fields = {
+            "image_hash": image_hash,
+            "model_version": model_version,
+            "prediction": prediction,
+            "predicted_class": predicted_class,
+            "updated_at": datetime.datetime.utcnow(),
+        }
+        if heatmap is not None:
+            fields["heatmap"] = heatmap
+        try:
+            self._collection().update_one(
+                {"_id": f"{image_hash}:{model_version}"},
+                {"$set": fields},
+                upsert=True,
+            )
+        except Exception as e:
+            print(f"Error writing result cache: {str(e)}")
+            traceback.print_exc()
+
+    @staticmethod
+    def _entry_size(entry):
+        # Fixed overhead for the dicts and floats plus the heatmap bytes
+        heatmap = entry["heatmap"]
+        return 256 + (len(heatmap["data"]) if heatmap is not None else 0)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "model_version": self._model_version,
+            "memory": self.memory.stats(),
+        }
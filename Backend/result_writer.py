@@ -0,0 +1,326 @@
+import atexit
+import collections
+import os
+import threading
+import time
+import traceback
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, ConnectionFailure, PyMongoError
+
+from metrics import metrics
+
+# ----------------------------
+# Result Writer Settings
+# ----------------------------
+RESULT_WRITE_BATCH_SIZE = int(os.environ.get("RESULT_WRITE_BATCH_SIZE", "100"))
+# Longest a result waits for its batch to fill before it is written anyway
+RESULT_WRITE_INTERVAL_MS = float(os.environ.get("RESULT_WRITE_INTERVAL_MS", "50"))
+# Results not yet in MongoDB; beyond this, requests wait for room (up to the
+# enqueue timeout) so a slow database slows uploads down instead of
+# growing memory without bound
+RESULT_WRITE_MAX_PENDING = int(os.environ.get("RESULT_WRITE_MAX_PENDING", "10000"))
+RESULT_WRITE_ENQUEUE_TIMEOUT = float(
+    os.environ.get("RESULT_WRITE_ENQUEUE_TIMEOUT", "5")
+)
+RESULT_WRITE_RETRY_DELAY = float(os.environ.get("RESULT_WRITE_RETRY_DELAY", "0.2"))
+RESULT_WRITE_RETRY_MAX_DELAY = float(
+    os.environ.get("RESULT_WRITE_RETRY_MAX_DELAY", "5")
+)
+RESULT_WRITE_DRAIN_TIMEOUT = float(os.environ.get("RESULT_WRITE_DRAIN_TIMEOUT", "30"))
+# How long a result history request waits for the user's queued results
+RESULT_WRITE_READ_WAIT = float(os.environ.get("RESULT_WRITE_READ_WAIT", "1"))
+
+DUPLICATE_KEY_ERROR = 11000
+
+RESULT_WRITE_LAG_SECONDS = metrics.histogram(
+    "result_write_lag_seconds", "Time from a result being queued to it being stored"
+)
+RESULT_WRITE_BATCH_SECONDS = metrics.histogram(
+    "result_write_batch_seconds", "Duration of one insert_many of queued results"
+)
+
+
+class ResultQueueFull(Exception):
+    """Raised when results can't be queued because MongoDB is falling behind"""
+
+
+def is_transient(error):
+    """Whether a failed write is worth retrying as is"""
+    if isinstance(error, ConnectionFailure):
+        return True
+    return isinstance(error, PyMongoError) and error.has_error_label(
+        "RetryableWriteError"
+    )
+
+
+class ResultWriter:
+    """Stores analysis results in MongoDB from a background thread
+
+    Results get their ObjectId up front, so requests can return the id
+    without waiting for the database. Queued results are written with
+    ``insert_many`` once a batch is full or its oldest result has waited
+    ``interval_ms``. Transient errors are retried with backoff; since the
+    ids are fixed, documents that did get stored before a failure show up
+    as duplicate keys on the retry and are not written twice. Until it is
+    stored a result is served from ``get()``.
+    """
+
+    def __init__(
+        self,
+        get_db,
+        batch_size=RESULT_WRITE_BATCH_SIZE,
+        interval_ms=RESULT_WRITE_INTERVAL_MS,
+        max_pending=RESULT_WRITE_MAX_PENDING,
+        enqueue_timeout=RESULT_WRITE_ENQUEUE_TIMEOUT,
+        retry_delay=RESULT_WRITE_RETRY_DELAY,
+        retry_max_delay=RESULT_WRITE_RETRY_MAX_DELAY,
+        drain_timeout=RESULT_WRITE_DRAIN_TIMEOUT,
+    ):
+        self._get_db = get_db
+        self.batch_size = batch_size
+        self.interval = interval_ms / 1000.0
+        self.max_pending = max_pending
+        self.enqueue_timeout = enqueue_timeout
+        self.retry_delay = retry_delay
+        self.retry_max_delay = retry_max_delay
+        self.drain_timeout = drain_timeout
+
+        self._cond = threading.Condition()
+        # (queued_at, document) waiting for a batch, oldest first
+        self._queue = collections.deque()
+        # Every result not yet stored, queued or being written, by _id
+        self._pending = {}
+        self._queued_at = {}
+        self._pending_by_user = collections.Counter()
+        self._thread = None
+        self._closing = False
+        self._drain_deadline = None
+
+        self.queued = 0
+        self.written = 0
+        self.batches = 0
+        self.retries = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.max_queue_depth = 0
+        self.lag_total = 0.0
+        self.max_lag = 0.0
+        atexit.register(self.close)
+
+    def _ensure_started(self):
+        # Started on first use, so each forked worker gets its own thread
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name="result-writer", daemon=True
+            )
+            self._thread.start()
+
+    def write(self, document):
+        """Queue one result and return its _id"""
+        return self.write_many([document])[0]
+
+    def write_many(self, documents):
+        """Queue results, assigning any missing _id, and return their ids
+
+        Waits for room when too many results are pending and raises
+        ResultQueueFull if none frees up within the enqueue timeout.
+        """
+        for document in documents:
+            document.setdefault("_id", ObjectId())
+
+        with self._cond:
+            if self._closing:
+                raise ResultQueueFull("Result writer is shutting down")
+            deadline = time.monotonic() + self.enqueue_timeout
+            while len(self._pending) + len(documents) > max(
+                self.max_pending, len(documents)
+            ):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._closing:
+                    self.rejected += len(documents)
+                    raise ResultQueueFull("Too many results waiting to be stored")
+                self._cond.wait(remaining)
+
+            now = time.monotonic()
+            for document in documents:
+                self._pending[document["_id"]] = document
+                self._queued_at[document["_id"]] = now
+                self._pending_by_user[document.get("user_id")] += 1
+                self._queue.append((now, document))
+            self.queued += len(documents)
+            self.max_queue_depth = max(self.max_queue_depth, len(self._pending))
+            self._ensure_started()
+            self._cond.notify_all()
+        return [document["_id"] for document in documents]
+
+    def get(self, result_id):
+        """Return a result that is still waiting to be stored, or None"""
+        with self._cond:
+            return self._pending.get(result_id)
+
+    def update_pending(self, result_id, fields):
+        """Apply ``fields`` to a result that is not stored yet
+
+        Returns False when the result is not pending. A result already being
+        inserted may be stored without the update, so callers also update
+        the database copy.
+        """
+        with self._cond:
+            document = self._pending.get(result_id)
+            if document is None:
+                return False
+            document.update(fields)
+            return True
+
+    def wait_for_user(self, user_id, timeout):
+        """Wait until a user's queued results are stored; False on timeout
+
+        Lets a user's history include the scan they just uploaded.
+        """
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: not self._pending_by_user.get(user_id), timeout
+            )
+
+    def _next_batch(self):
+        """Block until a batch is due and take it off the queue, or return None"""
+        with self._cond:
+            while not self._queue:
+                if self._closing:
+                    return None
+                self._cond.wait()
+            # Give the batch until its oldest result's deadline to fill up
+            deadline = self._queue[0][0] + self.interval
+            while len(self._queue) < self.batch_size and not self._closing:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            count = min(self.batch_size, len(self._queue))
+            return [self._queue.popleft()[1] for _ in range(count)]
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            try:
+                self._store(batch)
+            except Exception as e:
+                print(f"Error storing results: {str(e)}")
+                traceback.print_exc()
+                self._finish(batch, stored=False)
+
+    def _store(self, batch):
+        attempt = 0
+        while True:
+            try:
+                with RESULT_WRITE_BATCH_SECONDS.time():
+                    self._get_db().results.insert_many(batch, ordered=False)
+                self._finish(batch, stored=True)
+                return
+            except BulkWriteError as e:
+                # Duplicates were stored by an earlier attempt; anything else
+                # will fail the same way again
+                failed_ids = {
+                    batch[error["index"]]["_id"]
+                    for error in e.details.get("writeErrors", [])
+                    if error.get("code") != DUPLICATE_KEY_ERROR
+                }
+                if failed_ids:
+                    print(f"Could not store {len(failed_ids)} results: {str(e)}")
+                self._finish(
+                    [doc for doc in batch if doc["_id"] not in failed_ids], stored=True
+                )
+                self._finish(
+                    [doc for doc in batch if doc["_id"] in failed_ids], stored=False
+                )
+                return
+            except PyMongoError as e:
+                draining_too_long = (
+                    self._drain_deadline is not None
+                    and time.monotonic() >= self._drain_deadline
+                )
+                if not is_transient(e) or draining_too_long:
+                    print(f"Giving up on {len(batch)} results: {str(e)}")
+                    self._finish(batch, stored=False)
+                    return
+                attempt += 1
+                delay = min(self.retry_max_delay, self.retry_delay * 2 ** (attempt - 1))
+                with self._cond:
+                    self.retries += 1
+                print(
+                    f"Storing {len(batch)} results failed ({str(e)}), "
+                    f"retry {attempt} in {delay:.1f}s"
+                )
+                time.sleep(delay)
+
+    def _finish(self, batch, stored):
+        now = time.monotonic()
+        with self._cond:
+            for document in batch:
+                result_id = document["_id"]
+                self._pending.pop(result_id, None)
+                queued_at = self._queued_at.pop(result_id, now)
+                user_id = document.get("user_id")
+                self._pending_by_user[user_id] -= 1
+                if self._pending_by_user[user_id] <= 0:
+                    del self._pending_by_user[user_id]
+                if stored:
+                    lag = now - queued_at
+                    self.lag_total += lag
+                    self.max_lag = max(self.max_lag, lag)
+                    RESULT_WRITE_LAG_SECONDS.observe(lag)
+            if stored:
+                self.written += len(batch)
+                self.batches += 1 if batch else 0
+            else:
+                self.dropped += len(batch)
+            self._cond.notify_all()
+
+    def pending_count(self):
+        with self._cond:
+            return len(self._pending)
+
+    def close(self, timeout=None):
+        """Stop taking results and wait for the queued ones to be stored"""
+        timeout = self.drain_timeout if timeout is None else timeout
+        with self._cond:
+            if self._closing:
+                return
+            self._closing = True
+            self._drain_deadline = time.monotonic() + timeout
+            self._cond.notify_all()
+            pending = len(self._pending)
+        if self._thread is not None and self._thread.is_alive():
+            if pending:
+                print(f"Storing {pending} queued results before exiting...")
+            self._thread.join(timeout)
+        remaining = self.pending_count()
+        if remaining:
+            print(f"WARNING: {remaining} results were not stored")
+
+    def stats(self):
+        now = time.monotonic()
+        with self._cond:
+            oldest = min(self._queued_at.values(), default=None)
+            return {
+                "queue_depth": len(self._pending),
+                "max_queue_depth": self.max_queue_depth,
+                "max_pending": self.max_pending,
+                "oldest_pending_ms": (now - oldest) * 1000.0 if oldest else 0.0,
+                "queued": self.queued,
+                "written": self.written,
+                "batches": self.batches,
+                "average_batch_size": (
+                    self.written / self.batches if self.batches else 0.0
+                ),
+                "retries": self.retries,
+                "dropped": self.dropped,
+                "rejected": self.rejected,
+                "average_lag_ms": (
+                    self.lag_total / self.written * 1000.0 if self.written else 0.0
+                ),
+                "max_lag_ms": self.max_lag * 1000.0,
+            }
@@ -0,0 +1,97 @@
+import argparse
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Make the Backend modules importable when run as `python scripts/<name>.py`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from uploads import (  # noqa: E402
+    THUMBNAIL_SIZES,
+    UploadRejected,
+    UploadStore,
+    UploadWriter,
+    decode_file,
+)
+
+UPLOAD_FOLDER = "static/uploads"
+
+# Originals are <sha256>.<ext>; thumbnails add the size before ".webp"
+ORIGINAL_PATTERN = re.compile(r"^[0-9a-f]{64}\.[a-z]+$")
+
+
+def iter_stored_uploads(upload_dir):
+    """Yield the storage keys of the originals in the sharded layout"""
+    for directory, subdirs, names in os.walk(upload_dir):
+        subdirs.sort()
+        relative = os.path.relpath(directory, upload_dir)
+        if relative == ".":
+            # Files directly in upload_dir still use the flat layout
+            continue
+        for name in sorted(names):
+            if ORIGINAL_PATTERN.match(name):
+                yield "/".join(relative.split(os.sep) + [name])
+
+
+def backfill_thumbnails(
+    upload_dir=UPLOAD_FOLDER, sizes=THUMBNAIL_SIZES, workers=None, force=False
+):
+    """Create missing WebP thumbnails for every stored upload
+
+    Works from the files on disk, so it covers every result whose upload is
+    in the sharded layout; run scripts/migrate_uploads.py first for older
+    flat uploads.
+    """
+    writer = UploadWriter()
+    store = UploadStore(upload_dir, writer, thumbnail_sizes=sizes)
+    workers = workers or os.cpu_count() or 1
+    counts = {"uploads": 0, "created": 0, "failed": 0}
+
+    def process(key):
+        missing = sizes if force else store.missing_thumbnails(key)
+        if not missing:
+            return 0
+        image = decode_file(store.path(key), target_size=max(missing), grayscale=True)
+        store.put_thumbnails(key, image, missing)
+        return len(missing)
+
+    print(f"Creating {', '.join(map(str, sizes))}px thumbnails in {upload_dir}")
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        keys = list(iter_stored_uploads(upload_dir))
+        futures = {key: pool.submit(process, key) for key in keys}
+        for key, future in futures.items():
+            counts["uploads"] += 1
+            try:
+                counts["created"] += future.result()
+            except (OSError, UploadRejected, ValueError) as e:
+                counts["failed"] += 1
+                print(f"  {key}: {str(e)}")
+            if counts["uploads"] % 500 == 0:
+                print(f"  {counts['uploads']}/{len(keys)} uploads checked")
+    writer.flush()
+
+    elapsed = time.perf_counter() - started
+    print("\nBackfill complete:")
+    print(f"  - {counts['uploads']} uploads checked in {elapsed:.1f}s")
+    print(f"  - {counts['created']} thumbnails created")
+    print(f"  - {counts['failed']} uploads could not be read")
+    return counts["failed"] == 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Create missing WebP thumbnails for stored uploads"
+    )
+    parser.add_argument("--upload-dir", default=UPLOAD_FOLDER)
+    parser.add_argument("--sizes", type=int, nargs="+", default=THUMBNAIL_SIZES)
+    parser.add_argument("--workers", type=int, help="Default: all cores")
+    parser.add_argument(
+        "--force", action="store_true", help="Recreate existing thumbnails too"
+    )
+    args = parser.parse_args()
+
+    ok = backfill_thumbnails(args.upload_dir, args.sizes, args.workers, args.force)
+    sys.exit(0 if ok else 1)
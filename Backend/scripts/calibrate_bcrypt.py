@@ -0,0 +1,41 @@
+import argparse
+import os
+import sys
+
+# Make the Backend modules importable when run as `python scripts/<name>.py`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from passwords import BCRYPT_ROUNDS, BCRYPT_TARGET_MS, calibrate_rounds  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Pick the bcrypt cost factor that fits a target hash latency "
+        "on this machine"
+    )
+    parser.add_argument(
+        "--target-ms",
+        type=float,
+        default=BCRYPT_TARGET_MS,
+        help="Longest acceptable time for one hash (default: %(default)s)",
+    )
+    parser.add_argument("--min-rounds", type=int, default=10)
+    parser.add_argument("--max-rounds", type=int, default=16)
+    args = parser.parse_args()
+
+    rounds, timings = calibrate_rounds(args.target_ms, args.min_rounds, args.max_rounds)
+    for cost, ms in timings.items():
+        print(f"  rounds={cost:2d}  {ms:8.1f} ms")
+
+    print(f"Recommended: BCRYPT_ROUNDS={rounds} (target {args.target_ms:.0f} ms)")
+    if timings[rounds] > args.target_ms:
+        print("WARNING: even the minimum cost factor exceeds the target here")
+    if rounds != BCRYPT_ROUNDS:
+        print(
+            f"Currently configured: BCRYPT_ROUNDS={BCRYPT_ROUNDS}. Existing hashes "
+            "are upgraded on each user's next login."
+        )
+
+
+if __name__ == "__main__":
+    main()
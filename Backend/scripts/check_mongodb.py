@@ -1,18 +1,23 @@
-from pymongo import MongoClient
 import os
 import sys
 import datetime
 
-# MongoDB connection settings
-MONGO_URI = os.environ.get("MONGO_URI", "mongodb://localhost:27017/")
-DATABASE_NAME = os.environ.get("DATABASE_NAME", "mediscan")
+# Make the Backend modules importable when run as `python scripts/<name>.py`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import (  # noqa: E402
+    DATABASE_NAME,
+    MONGO_URI,
+    close_client,
+    get_client,
+    get_db,
+    verify_index_usage,
+)
 
 
 def get_db_connection():
-    """Get a connection to the MongoDB database"""
-    client = MongoClient(MONGO_URI)
-    db = client[DATABASE_NAME]
-    return db, client
+    """Get the MongoDB database and the shared client it belongs to"""
+    return get_db(), get_client()
 
 
 def check_db():
@@ -65,8 +70,6 @@ def check_db():
         else:
             print("Results collection does not exist")
 
-        client.close()
-
     except Exception as e:
         print(f"Error checking database: {str(e)}")
         return False
@@ -74,6 +77,25 @@ def check_db():
     return True
 
 
+def check_indexes():
+    """Check that the hot-path queries are served by indexes"""
+    try:
+        db, client = get_db_connection()
+        report = verify_index_usage(db)
+
+        for query, check in report.items():
+            status = "OK" if check["ok"] else "NOT INDEX-BACKED"
+            print(f"{query}: {status}")
+            print(f"  Plan stages: {check['stages']}")
+            print(f"  Indexes used: {check['indexes']}")
+
+        return all(check["ok"] for check in report.values())
+
+    except Exception as e:
+        print(f"Error checking indexes: {str(e)}")
+        return False
+
+
 def create_test_user():
     """Create a test user in the database"""
     try:
@@ -98,7 +120,6 @@ def create_test_user():
 
             print(f"Created test user with ID: {result.inserted_id}")
 
-        client.close()
         return True
 
     except Exception as e:
@@ -108,14 +129,23 @@ def create_test_user():
 
 if __name__ == "__main__":
     # Simple command line interface
-    if len(sys.argv) > 1:
-        command = sys.argv[1]
-        if command == "check":
-            check_db()
-        elif command == "create-test-user":
-            create_test_user()
+    try:
+        if len(sys.argv) > 1:
+            command = sys.argv[1]
+            if command == "check":
+                check_db()
+            elif command == "check-indexes":
+                if not check_indexes():
+                    sys.exit(1)
+            elif command == "create-test-user":
+                create_test_user()
+            else:
+                print(
+                    "Unknown command. Available commands: "
+                    "check, check-indexes, create-test-user"
+                )
         else:
-            print("Unknown command. Available commands: check, create-test-user")
-    else:
-        # Default: check db
-        check_db()
+            # Default: check db
+            check_db()
+    finally:
+        close_client()
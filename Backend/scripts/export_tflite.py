@@ -0,0 +1,89 @@
+import argparse
+import os
+import sys
+
+# Make the Backend modules importable when run as `python scripts/<name>.py`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tensorflow as tf  # noqa: E402
+
+from model_registry import MODEL_PATH, LoadedModel, file_version  # noqa: E402
+from tflite_backend import (  # noqa: E402
+    TFLITE_DIR,
+    TFLITE_MAX_HEATMAP_DIFF,
+    TFLITE_MAX_SCORE_DIFF,
+    TFLITE_REFERENCE_DIR,
+    TFLITE_REFERENCE_LIMIT,
+    TFLITE_VARIANTS,
+    backend_name,
+    export_variant,
+    load_reference_images,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Export float16 / dynamic-int8 TFLite variants of the model "
+        "and its Grad-CAM graph, gated on parity with the Keras model"
+    )
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument(
+        "--variants", nargs="+", choices=TFLITE_VARIANTS, default=TFLITE_VARIANTS
+    )
+    parser.add_argument("--out-dir", default=TFLITE_DIR)
+    parser.add_argument(
+        "--reference-dir",
+        default=TFLITE_REFERENCE_DIR,
+        help="Chest X-rays the variants are compared on",
+    )
+    parser.add_argument("--limit", type=int, default=TFLITE_REFERENCE_LIMIT)
+    parser.add_argument("--max-score-diff", type=float, default=TFLITE_MAX_SCORE_DIFF)
+    parser.add_argument(
+        "--max-heatmap-diff", type=float, default=TFLITE_MAX_HEATMAP_DIFF
+    )
+    args = parser.parse_args()
+
+    images = load_reference_images(args.reference_dir, args.limit)
+    if not len(images):
+        print(f"No reference images found in {args.reference_dir}")
+        sys.exit(1)
+
+    version = file_version(args.model)
+    print(f"Loading model {args.model} (version {version})...")
+    loaded = LoadedModel(tf.keras.models.load_model(args.model), args.model, version)
+
+    refused = []
+    for variant in args.variants:
+        print(f"Exporting {variant} variant, checking on {len(images)} images...")
+        manifest = export_variant(
+            loaded,
+            variant,
+            images,
+            directory=args.out_dir,
+            max_score_diff=args.max_score_diff,
+            max_heatmap_diff=args.max_heatmap_diff,
+        )
+        parity = manifest["parity"]
+        sizes = ", ".join(f"{k} {v / 1e6:.1f} MB" for k, v in manifest["sizes"].items())
+        print(f"  {sizes}")
+        print(
+            f"  score diff max {parity['max_score_diff']:.4f} "
+            f"(limit {parity['max_score_diff_allowed']}), "
+            f"heatmap diff max {parity['max_heatmap_diff']:.4f} "
+            f"(limit {parity['max_heatmap_diff_allowed']}), "
+            f"class agreement {parity['class_agreement']:.1%}"
+        )
+        if manifest["approved"]:
+            print(
+                f"  APPROVED: set INFERENCE_BACKEND={backend_name(variant)} to use it"
+            )
+        else:
+            print("  REFUSED: the server will not activate this variant")
+            refused.append(variant)
+
+    if refused:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
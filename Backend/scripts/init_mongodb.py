@@ -1,18 +1,24 @@
-from pymongo import MongoClient, ASCENDING
 import os
+import sys
 import datetime
 import traceback
 
-# MongoDB connection settings
-MONGO_URI = os.environ.get("MONGO_URI", "mongodb://localhost:27017/")
-DATABASE_NAME = os.environ.get("DATABASE_NAME", "mediscan")
+# Make the Backend modules importable when run as `python scripts/<name>.py`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import (  # noqa: E402
+    MONGO_URI,
+    close_client,
+    ensure_indexes,
+    get_client,
+    get_db,
+    verify_index_usage,
+)
 
 
 def get_db_connection():
-    """Get a connection to the MongoDB database"""
-    client = MongoClient(MONGO_URI)
-    db = client[DATABASE_NAME]
-    return db, client
+    """Get the MongoDB database and the shared client it belongs to"""
+    return get_db(), get_client()
 
 
 def init_database():
@@ -28,10 +34,6 @@ def init_database():
         else:
             print("Users collection already exists")
 
-        # Create indexes for users collection
-        print("Creating indexes for users collection...")
-        db.users.create_index([("email", ASCENDING)], unique=True)
-
         # Create results collection if it doesn't exist
         if "results" not in db.list_collection_names():
             print("Creating results collection...")
@@ -39,10 +41,12 @@ def init_database():
         else:
             print("Results collection already exists")
 
-        # Create indexes for results collection
-        print("Creating indexes for results collection...")
-        db.results.create_index([("user_id", ASCENDING)])
-        db.results.create_index([("created_at", ASCENDING)])
+        # Create the indexes the application relies on
+        print("Creating indexes...")
+        ensure_indexes(db)
+        for query, check in verify_index_usage(db).items():
+            status = "OK" if check["ok"] else "NOT INDEX-BACKED"
+            print(f"  {query}: {status} {check['stages']}")
 
         # Check if test user exists
         test_user = db.users.find_one({"email": "test@gmail.com"})
@@ -66,7 +70,6 @@ def init_database():
         users = db.users.find({}, {"_id": 0, "email": 1, "name": 1})
         print(f"Users in database: {[user for user in users]}")
 
-        client.close()
         print("Database initialization complete!")
         return True
 
@@ -98,7 +101,6 @@ def reset_database():
         # Reinitialize the database
         init_database()
 
-        client.close()
         print("Database reset complete!")
         return True
 
@@ -109,9 +111,10 @@ def reset_database():
 
 
 if __name__ == "__main__":
-    import sys
-
-    if len(sys.argv) > 1 and sys.argv[1] == "reset":
-        reset_database()
-    else:
-        init_database()
+    try:
+        if len(sys.argv) > 1 and sys.argv[1] == "reset":
+            reset_database()
+        else:
+            init_database()
+    finally:
+        close_client()
@@ -1,111 +1,239 @@
-import bcrypt
-from pymongo import MongoClient
+import argparse
+import json
 import os
 import sys
-from dotenv import load_dotenv
 import time
+from concurrent.futures import ProcessPoolExecutor
+
+from bson import ObjectId
+from dotenv import load_dotenv
+from pymongo import ASCENDING, UpdateOne
 
 # Load environment variables from .env file
 load_dotenv()
 
-# MongoDB connection settings
-MONGO_URI = os.environ.get("MONGO_URI", "mongodb://localhost:27017/")
-DATABASE_NAME = os.environ.get("DATABASE_NAME", "mediscan")
+# Make the Backend modules importable when run as `python scripts/<name>.py`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+from database import MONGO_URI  # noqa: E402
+from passwords import BCRYPT_ROUNDS, hash_password  # noqa: E402
+
+MIGRATION_PAGE_SIZE = int(os.environ.get("MIGRATION_PAGE_SIZE", "1000"))
+MIGRATION_CHECKPOINT = os.environ.get(
+    "MIGRATION_CHECKPOINT", "migrate_passwords.checkpoint.json"
+)
+
+# Only string passwords can still be plain text; bcrypt hashes are bytes.
+# Empty passwords are left alone, as the original script did: hashing ""
+# would make a blank password a valid login.
+CANDIDATE_FILTER = {"password": {"$type": "string", "$ne": ""}}
+NO_PASSWORD_FILTER = {"password": {"$in": ["", None]}}
 
 
 def get_db():
-    """Get a connection to the MongoDB database"""
-    client = MongoClient(MONGO_URI)
-    db = client[DATABASE_NAME]
-    return db, client
+    """Get the MongoDB database and the shared client it belongs to"""
+    return database.get_db(), database.get_client()
 
 
-def hash_password(password):
-    """Hash a password using bcrypt"""
-    if isinstance(password, str):
-        password = password.encode("utf-8")
-    return bcrypt.hashpw(password, bcrypt.gensalt())
+def is_hashed(password):
+    """Whether a stored password is already a bcrypt hash"""
+    return isinstance(password, bytes) or password.startswith("$2")
 
 
-def migrate_passwords():
-    """Migrate plain text passwords to bcrypt hashes"""
+def load_checkpoint(path):
+    try:
+        with open(path) as f:
+            checkpoint = json.load(f)
+    except FileNotFoundError:
+        return None
+    checkpoint["last_id"] = ObjectId(checkpoint["last_id"])
+    return checkpoint
+
+
+def save_checkpoint(path, last_id, counts):
+    """Atomically record the last _id whose page has been written"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(dict(counts, last_id=str(last_id)), f)
+    os.replace(tmp_path, path)
+
+
+def iter_pages(db, after_id, page_size):
+    """Yield pages of candidate users in _id order, fetching only what we need
+
+    Each page is a fresh query that starts after the last _id seen, so no
+    cursor is held open across a long-running page and an interrupted run
+    can pick up from the checkpoint.
+    """
+    while True:
+        query = dict(CANDIDATE_FILTER)
+        if after_id is not None:
+            query["_id"] = {"$gt": after_id}
+        page = list(
+            db.users.find(query, {"_id": 1, "password": 1})
+            .sort("_id", ASCENDING)
+            .limit(page_size)
+        )
+        if not page:
+            return
+        yield page
+        after_id = page[-1]["_id"]
+
+
+def migrate_passwords(
+    dry_run=False,
+    workers=None,
+    page_size=MIGRATION_PAGE_SIZE,
+    checkpoint_path=MIGRATION_CHECKPOINT,
+    restart=False,
+    assume_yes=False,
+):
+    """Migrate plain text passwords to bcrypt hashes
+
+    Users are streamed page by page, hashed on a process pool using every
+    core, and written back with one unordered bulk_write per page. After
+    each page the last _id is checkpointed, so rerunning the command
+    resumes an interrupted migration. With ``dry_run`` passwords are hashed
+    but nothing is written, which measures the achievable throughput.
+    """
     print("Starting password migration...")
     print(f"Connecting to MongoDB at {MONGO_URI}")
 
     try:
         db, client = get_db()
-
-        # Get all users
-        users = list(db.users.find())
-        print(f"Found {len(users)} users")
-
-        # Ask for confirmation
-        if not users:
+        workers = workers or os.cpu_count() or 1
+
+        checkpoint = None if restart or dry_run else load_checkpoint(checkpoint_path)
+        counts = {"migrated": 0, "already_hashed": 0}
+        after_id = None
+        if checkpoint:
+            after_id = checkpoint.pop("last_id")
+            counts.update(checkpoint)
+            print(f"Resuming after user {after_id} ({counts['migrated']} done)")
+
+        remaining_filter = dict(CANDIDATE_FILTER)
+        if after_id is not None:
+            remaining_filter["_id"] = {"$gt": after_id}
+        remaining = db.users.count_documents(remaining_filter)
+        no_password = db.users.count_documents(NO_PASSWORD_FILTER)
+        print(f"Found {remaining} users with string passwords to check")
+        if no_password:
+            print(f"Skipping {no_password} users without a password")
+
+        if not remaining:
             print("No users found. Nothing to migrate.")
-            return
-
-        confirm = input(
-            f"Are you sure you want to hash the passwords for {len(users)} users? (yes/no): "
+            return True
+
+        if not dry_run and not assume_yes:
+            confirm = input(
+                f"Are you sure you want to hash the passwords for {remaining} users? (yes/no): "
+            )
+            if confirm.lower() != "yes":
+                print("Migration cancelled.")
+                return False
+
+        mode = "Dry run" if dry_run else "Migrating"
+        print(
+            f"{mode} with {workers} processes, {page_size} users per page, "
+            f"bcrypt rounds={BCRYPT_ROUNDS}"
         )
-        if confirm.lower() != "yes":
-            print("Migration cancelled.")
-            return
-
-        migrated = 0
-        already_hashed = 0
-        errors = 0
-
-        for user in users:
-            try:
-                email = user.get("email", "Unknown")
-                password = user.get("password")
-
-                print(f"Processing user: {email}...", end=" ")
-
-                # Skip if no password
-                if not password:
-                    print("No password found.")
-                    continue
-
-                # Check if password is already hashed (bcrypt hashes start with $2b$)
-                if isinstance(password, bytes) or (
-                    isinstance(password, str) and password.startswith("$2")
-                ):
-                    print("Already hashed.")
-                    already_hashed += 1
-                    continue
 
-                # Hash the password
-                hashed_password = hash_password(password)
-
-                # Update the user
-                db.users.update_one(
-                    {"_id": user["_id"]}, {"$set": {"password": hashed_password}}
+        started = time.perf_counter()
+        processed = 0
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for page in iter_pages(db, after_id, page_size):
+                pending = [u for u in page if not is_hashed(u["password"])]
+                counts["already_hashed"] += len(page) - len(pending)
+
+                hashes = pool.map(
+                    hash_password,
+                    [u["password"] for u in pending],
+                    chunksize=max(1, len(pending) // (workers * 4)),
+                )
+                # The old password is part of the filter so a password
+                # changed while the migration runs is left alone
+                operations = [
+                    UpdateOne(
+                        {"_id": user["_id"], "password": user["password"]},
+                        {"$set": {"password": hashed}},
+                    )
+                    for user, hashed in zip(pending, hashes)
+                ]
+
+                if operations and not dry_run:
+                    try:
+                        result = db.users.bulk_write(operations, ordered=False)
+                    except Exception as e:
+                        # The checkpoint still points before this page, and
+                        # rewriting it is harmless, so a rerun retries it
+                        print(f"Error writing page ending at {page[-1]['_id']}: {e}")
+                        print("Run the command again to resume from here.")
+                        return False
+                    counts["migrated"] += result.modified_count
+                else:
+                    counts["migrated"] += len(operations)
+
+                if not dry_run:
+                    save_checkpoint(checkpoint_path, page[-1]["_id"], counts)
+
+                processed += len(page)
+                elapsed = time.perf_counter() - started
+                print(
+                    f"  {processed}/{remaining} users, "
+                    f"{processed / elapsed:.1f} users/s"
                 )
 
-                print("Successfully hashed.")
-                migrated += 1
-
-                # Small delay to avoid overwhelming the database
-                time.sleep(0.1)
-
-            except Exception as e:
-                print(f"Error: {str(e)}")
-                errors += 1
-
-        print("\nMigration complete:")
-        print(f"  - {migrated} passwords hashed")
-        print(f"  - {already_hashed} passwords already hashed")
-        print(f"  - {errors} errors")
+        elapsed = time.perf_counter() - started
+        verb = "would be hashed" if dry_run else "hashed"
+        print("\nMigration complete:" if not dry_run else "\nDry run complete:")
+        print(f"  - {counts['migrated']} passwords {verb}")
+        print(f"  - {counts['already_hashed']} passwords already hashed")
+        print(f"  - {no_password} users skipped without a password")
+        print(
+            f"  - {processed} users in {elapsed:.1f}s "
+            f"({processed / elapsed if elapsed else 0.0:.1f} users/s)"
+        )
 
-        client.close()
+        # A finished run starts from scratch next time
+        if not dry_run and os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
 
     except Exception as e:
         print(f"Migration error: {str(e)}")
         return False
+    finally:
+        database.close_client()
 
     return True
 
 
 if __name__ == "__main__":
-    migrate_passwords()
+    parser = argparse.ArgumentParser(
+        description="Hash plain text user passwords with bcrypt"
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Hash passwords without writing them and report throughput",
+    )
+    parser.add_argument(
+        "--workers", type=int, help="Hashing processes (default: all cores)"
+    )
+    parser.add_argument("--page-size", type=int, default=MIGRATION_PAGE_SIZE)
+    parser.add_argument("--checkpoint", default=MIGRATION_CHECKPOINT)
+    parser.add_argument(
+        "--restart", action="store_true", help="Ignore an existing checkpoint"
+    )
+    parser.add_argument("--yes", action="store_true", help="Don't ask to confirm")
+    args = parser.parse_args()
+
+    ok = migrate_passwords(
+        dry_run=args.dry_run,
+        workers=args.workers,
+        page_size=args.page_size,
+        checkpoint_path=args.checkpoint,
+        restart=args.restart,
+        assume_yes=args.yes,
+    )
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,173 @@
+import argparse
+import os
+import re
+import sys
+
+from dotenv import load_dotenv
+from pymongo import UpdateOne
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Make the Backend modules importable when run as `python scripts/<name>.py`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+from database import MONGO_URI  # noqa: E402
+from result_cache import content_hash  # noqa: E402
+from uploads import UPLOAD_SHARD_LEVELS, storage_key  # noqa: E402
+
+UPLOAD_FOLDER = "static/uploads"
+
+
+def link_or_copy(source, target):
+    """Make ``target`` hold the bytes of ``source`` without removing it"""
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    try:
+        os.link(source, target)
+    except FileExistsError:
+        pass
+    except OSError:
+        # No hard links on this filesystem; copy to a temporary file first
+        # so the target never exists half-written
+        tmp_path = f"{target}.{os.getpid()}.tmp"
+        with open(source, "rb") as src, open(tmp_path, "wb") as dst:
+            dst.write(src.read())
+        os.replace(tmp_path, target)
+
+
+def flat_results_query(name):
+    """Results not yet migrated that refer to the flat file ``name``
+
+    Results stored before uploads had a filename field only know the file
+    through the end of their image_path URL.
+    """
+    return {
+        "storage_key": {"$exists": False},
+        "$or": [
+            {"filename": name},
+            {"image_path": {"$regex": re.escape(f"/uploads/{name}") + "$"}},
+        ],
+    }
+
+
+def migrated_url(image_path, key):
+    """Point an image_path URL at the file's new location"""
+    if not image_path or "/uploads/" not in image_path:
+        return image_path
+    return image_path.rsplit("/uploads/", 1)[0] + f"/uploads/{key}"
+
+
+def migrate_uploads(
+    upload_dir=UPLOAD_FOLDER, levels=UPLOAD_SHARD_LEVELS, dry_run=False
+):
+    """Move flat uploads into the content-addressed layout
+
+    Each file is first linked into its new place, then the results that
+    refer to it get its storage key and new image URL, and only then is the
+    flat file removed, so the image stays reachable throughout and an
+    interrupted run can simply be repeated. A flat file that some result
+    still points to after the update is kept. Files with identical bytes
+    end up as one stored file.
+    """
+    print(f"Migrating uploads in {upload_dir}")
+    print(f"Connecting to MongoDB at {MONGO_URI}")
+
+    counts = {"files": 0, "deduplicated": 0, "results": 0, "kept": 0}
+    seen = set()
+    try:
+        db = database.get_db()
+        names = sorted(
+            name
+            for name in os.listdir(upload_dir)
+            if os.path.isfile(os.path.join(upload_dir, name))
+            and not name.endswith(".tmp")
+        )
+        print(f"Found {len(names)} files in the flat layout")
+
+        for name in names:
+            source = os.path.join(upload_dir, name)
+            with open(source, "rb") as f:
+                data = f.read()
+            key = storage_key(content_hash(data), data, levels)
+            target = os.path.join(upload_dir, *key.split("/"))
+
+            # A dry run moves nothing, so duplicates are also tracked here
+            already_stored = os.path.exists(target) or key in seen
+            seen.add(key)
+            if already_stored:
+                counts["deduplicated"] += 1
+            counts["files"] += 1
+
+            # Results stored before the migration only know the flat name
+            query = flat_results_query(name)
+            results = list(db.results.find(query, {"image_path": 1}))
+            print(
+                f"  {name} -> {key}"
+                f"{' (duplicate)' if already_stored else ''}, "
+                f"{len(results)} results"
+            )
+            if dry_run:
+                counts["results"] += len(results)
+                continue
+
+            if not already_stored:
+                link_or_copy(source, target)
+            if results:
+                operations = [
+                    UpdateOne(
+                        {"_id": result["_id"], "storage_key": {"$exists": False}},
+                        {
+                            "$set": {
+                                "storage_key": key,
+                                "image_path": migrated_url(
+                                    result.get("image_path"), key
+                                ),
+                            }
+                        },
+                    )
+                    for result in results
+                ]
+                counts["results"] += db.results.bulk_write(
+                    operations, ordered=False
+                ).modified_count
+            remaining = db.results.count_documents(query)
+            if remaining:
+                counts["kept"] += 1
+                print(f"    kept {name}: {remaining} results still refer to it")
+                continue
+            os.remove(source)
+
+        verb = "would be" if dry_run else "were"
+        print("\nDry run complete:" if dry_run else "\nMigration complete:")
+        print(f"  - {counts['files']} files {verb} moved")
+        print(f"  - {counts['deduplicated']} of them duplicated a stored file")
+        print(f"  - {counts['results']} results {verb} updated")
+        if counts["kept"]:
+            print(
+                f"  - {counts['kept']} flat files were kept because results "
+                "still refer to them; run the command again"
+            )
+    except Exception as e:
+        print(f"Migration error: {str(e)}")
+        print("Run the command again to continue where it stopped.")
+        return False
+    finally:
+        database.close_client()
+
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Move flat static/uploads files into the hash-sharded layout"
+    )
+    parser.add_argument("--upload-dir", default=UPLOAD_FOLDER)
+    parser.add_argument("--levels", type=int, default=UPLOAD_SHARD_LEVELS)
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Report what would be moved"
+    )
+    args = parser.parse_args()
+
+    ok = migrate_uploads(args.upload_dir, args.levels, args.dry_run)
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,56 @@
+import importlib.util
+import os
+import sys
+
+import mongomock
+import pymongo
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+def load_script(name, folder="scripts"):
+    """Import <folder>/<name>.py; scripts and benchmarks are not packages"""
+    path = os.path.join(BACKEND_DIR, folder, f"{name}.py")
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def mongo_db():
+    return mongomock.MongoClient().mediscan
+
+
+@pytest.fixture(scope="session")
+def app_module(tmp_path_factory):
+    """The Flask app on an in-memory MongoDB, run in a scratch directory
+
+    Needs the trained model, at MODEL_PATH or in the Backend directory.
+    """
+    model_path = os.path.abspath(
+        os.environ.get(
+            "MODEL_PATH", os.path.join(BACKEND_DIR, "pneumonia_detection.keras")
+        )
+    )
+    if not os.path.exists(model_path):
+        pytest.skip(f"No model at {model_path}")
+    os.environ["MODEL_PATH"] = model_path
+    os.environ["MODEL_RELOAD_INTERVAL"] = "0"
+
+    import database
+
+    client = mongomock.MongoClient()
+    pymongo.MongoClient = database.MongoClient = lambda *args, **kwargs: client
+    os.chdir(tmp_path_factory.mktemp("app"))
+    import app
+
+    return app
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
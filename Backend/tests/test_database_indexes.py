@@ -0,0 +1,46 @@
+from pymongo import ASCENDING, DESCENDING
+
+from database import ensure_indexes
+
+
+def create_original_indexes(db):
+    """The indexes the original scripts/init_mongodb.py created"""
+    db.users.create_index([("email", ASCENDING)], unique=True)
+    db.results.create_index([("user_id", ASCENDING)])
+    db.results.create_index([("created_at", ASCENDING)])
+
+
+def test_fresh_database_gets_the_application_indexes(mongo_db):
+    ensure_indexes(mongo_db)
+
+    assert set(mongo_db.users.index_information()) == {"_id_", "email_unique"}
+    assert set(mongo_db.results.index_information()) == {
+        "_id_",
+        "user_id_created_at_id",
+    }
+
+
+def test_original_single_field_indexes_are_dropped(mongo_db):
+    create_original_indexes(mongo_db)
+    mongo_db.results.create_index(
+        [("user_id", ASCENDING), ("created_at", DESCENDING)],
+        name="user_id_created_at",
+    )
+
+    ensure_indexes(mongo_db)
+
+    assert set(mongo_db.results.index_information()) == {
+        "_id_",
+        "user_id_created_at_id",
+    }
+
+
+def test_original_unique_email_index_is_kept(mongo_db):
+    create_original_indexes(mongo_db)
+
+    ensure_indexes(mongo_db)
+    ensure_indexes(mongo_db)
+
+    indexes = mongo_db.users.index_information()
+    assert set(indexes) == {"_id_", "email_1"}
+    assert indexes["email_1"]["unique"]
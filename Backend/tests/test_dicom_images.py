@@ -0,0 +1,102 @@
+import datetime
+import io
+import os
+
+import numpy as np
+import pytest
+
+pydicom = pytest.importorskip("pydicom")
+from pydicom.dataset import Dataset, FileMetaDataset  # noqa: E402
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid  # noqa: E402
+
+from result_cache import content_hash  # noqa: E402
+from uploads import UploadRejected, decode_file, decode_image, storage_key  # noqa: E402
+
+
+def make_dicom(rows=300, columns=240):
+    """An uncompressed 12-bit MONOCHROME2 radiograph with a window"""
+    ds = Dataset()
+    ds.file_meta = FileMetaDataset()
+    ds.file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    ds.file_meta.MediaStorageSOPClassUID = "1.2.840.10008.5.1.4.1.1.1.1"
+    ds.file_meta.MediaStorageSOPInstanceUID = generate_uid()
+    ds.SOPClassUID = ds.file_meta.MediaStorageSOPClassUID
+    ds.SOPInstanceUID = ds.file_meta.MediaStorageSOPInstanceUID
+    ds.Modality = "DX"
+    ds.Rows, ds.Columns = rows, columns
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = "MONOCHROME2"
+    ds.BitsAllocated, ds.BitsStored, ds.HighBit = 16, 12, 11
+    ds.PixelRepresentation = 0
+    ds.WindowCenter, ds.WindowWidth = 2048, 4096
+    pixels = np.tile(np.linspace(0, 4095, columns, dtype=np.uint16), (rows, 1))
+    ds.PixelData = pixels.tobytes()
+    buffer = io.BytesIO()
+    ds.save_as(buffer, enforce_file_format=True)
+    return buffer.getvalue()
+
+
+def test_stored_file_is_decoded_like_upload_bytes(tmp_path):
+    data = make_dicom()
+    path = tmp_path / "scan.dcm"
+    path.write_bytes(data)
+
+    from_file = decode_file(str(path), target_size=128, grayscale=True)
+
+    assert from_file.shape == (128, 102)
+    assert np.array_equal(
+        from_file, decode_image(data, target_size=128, grayscale=True)
+    )
+
+
+def test_truncated_stored_file_is_rejected(tmp_path):
+    path = tmp_path / "scan.dcm"
+    path.write_bytes(make_dicom()[:-1000])
+
+    with pytest.raises(UploadRejected, match="truncated"):
+        decode_file(str(path), target_size=128, grayscale=True)
+
+
+@pytest.mark.parametrize("rows, columns", [(1, 4096), (4096, 3), (2, 2)])
+def test_narrow_frames_are_decoded(tmp_path, rows, columns):
+    data = make_dicom(rows, columns)
+    path = tmp_path / "scan.dcm"
+    path.write_bytes(data)
+
+    from_bytes = decode_image(data, target_size=512, grayscale=True)
+    from_file = decode_file(str(path), target_size=512, grayscale=True)
+
+    assert max(from_bytes.shape) == min(512, max(rows, columns))
+    assert min(from_bytes.shape) >= 1
+    assert np.array_equal(from_file, from_bytes)
+
+
+def test_frame_without_pixels_is_rejected():
+    with pytest.raises(UploadRejected, match="empty"):
+        decode_image(make_dicom(0, 240), target_size=512, grayscale=True)
+
+
+def test_overlay_of_truncated_stored_dicom_is_not_a_server_error(app_module, client):
+    data = make_dicom()
+    key = storage_key(content_hash(data), data)
+    path = app_module.upload_store.path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data[:-1000])
+    db = app_module.get_db_connection()
+    result_id = db.results.insert_one(
+        {
+            "user_id": None,
+            "prediction": 0.2,
+            "predicted_class": "NORMAL",
+            "storage_key": key,
+            "created_at": datetime.datetime.utcnow(),
+        }
+    ).inserted_id
+
+    signature = app_module.sign_result_id(app_module.app.secret_key, result_id)
+
+    response = client.get(f"/api/results/{result_id}/overlay?sig={signature}")
+
+    assert response.status_code == 404
+    assert response.get_json()["message"] == "Original image not available"
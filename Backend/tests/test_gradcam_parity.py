@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from conftest import load_script
+
+
+@pytest.fixture(scope="module")
+def micro_benchmark():
+    return load_script("micro_benchmark", folder="benchmarks")
+
+
+def test_fused_gradcam_matches_the_legacy_helper(app_module, micro_benchmark):
+    from preprocessing import preprocess_chest_xray_for_efficientnet
+
+    loaded = app_module.model_registry.get()
+    images = np.stack(
+        [
+            preprocess_chest_xray_for_efficientnet(
+                micro_benchmark.synthetic_radiograph(512, seed)
+            )[0]
+            for seed in (0, 1)
+        ]
+    )
+
+    scores, heatmaps = loaded.predict_with_gradcam(images)
+
+    for image, score, heatmap in zip(images, scores, heatmaps):
+        legacy = micro_benchmark.make_gradcam_heatmap(
+            image[np.newaxis], loaded.base_model, loaded.gradcam_layer
+        )
+        assert heatmap.shape == legacy.shape
+        np.testing.assert_allclose(heatmap, legacy, atol=1e-3)
+        assert score == pytest.approx(loaded.predict(image[np.newaxis])[0], abs=1e-5)
@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+
+from inference import InferenceBatcher
+
+
+class FakeModel:
+    """Scores an image by its mean; its Grad-CAM is the first channel"""
+
+    backend = "keras"
+    version = "v1"
+
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+
+    def for_backend(self, backend):
+        if backend not in (None, "keras"):
+            raise ValueError(f"Backend {backend} is not available")
+        return self
+
+    def predict(self, images):
+        self.calls.append(("predict", len(images)))
+        if self.fail:
+            raise RuntimeError("model failed")
+        return images.mean(axis=(1, 2, 3))
+
+    def predict_with_gradcam(self, images):
+        self.calls.append(("gradcam", len(images)))
+        return images.mean(axis=(1, 2, 3)), images[..., 0]
+
+
+class FakeRegistry:
+    def __init__(self, model):
+        self.model = model
+
+    def get(self):
+        return self.model
+
+
+def image(value):
+    return np.full((4, 4, 3), value, dtype=np.float32)
+
+
+def test_concurrent_requests_are_grouped_and_each_gets_its_own_row():
+    model = FakeModel()
+    batcher = InferenceBatcher(FakeRegistry(model), max_batch_size=4, max_wait_ms=500)
+
+    futures = [
+        batcher.submit(image(0.1), with_gradcam=True),
+        batcher.submit(image(0.2)),
+        batcher.submit(image(0.3), with_gradcam=True),
+        batcher.submit(image(0.4)),
+    ]
+    results = [future.result(timeout=5) for future in futures]
+
+    # One batch, run as one model call per kind
+    assert sorted(model.calls) == [("gradcam", 2), ("predict", 2)]
+    assert batcher.stats()["batch_sizes"] == {"4": 1}
+    for value, result in zip((0.1, 0.2, 0.3, 0.4), results):
+        assert result.prediction == pytest.approx(value)
+        assert result.model_version == "v1"
+    assert np.allclose(results[0].heatmap, 0.1)
+    assert np.allclose(results[2].heatmap, 0.3)
+    assert results[1].heatmap is None and results[3].heatmap is None
+
+
+def test_batches_are_capped_at_the_maximum_size():
+    model = FakeModel()
+    batcher = InferenceBatcher(FakeRegistry(model), max_batch_size=2, max_wait_ms=500)
+
+    futures = [batcher.submit(image(i)) for i in range(5)]
+    for future in futures:
+        future.result(timeout=5)
+
+    assert all(size <= 2 for _, size in model.calls)
+    assert batcher.stats()["requests"] == 5
+
+
+def test_unavailable_backend_only_fails_its_own_requests():
+    batcher = InferenceBatcher(
+        FakeRegistry(FakeModel()), max_batch_size=2, max_wait_ms=500
+    )
+
+    bad = batcher.submit(image(0.5), backend="tflite-int8")
+    good = batcher.submit(image(0.6))
+
+    with pytest.raises(ValueError, match="tflite-int8"):
+        bad.result(timeout=5)
+    assert good.result(timeout=5).prediction == pytest.approx(0.6)
+
+
+def test_model_error_reaches_every_caller_and_the_scheduler_survives():
+    model = FakeModel(fail=True)
+    batcher = InferenceBatcher(FakeRegistry(model), max_batch_size=2, max_wait_ms=500)
+
+    futures = [batcher.submit(image(0.1)), batcher.submit(image(0.2))]
+    for future in futures:
+        with pytest.raises(RuntimeError, match="model failed"):
+            future.result(timeout=5)
+
+    model.fail = False
+    assert batcher.predict(image(0.7), timeout=5).prediction == pytest.approx(0.7)
@@ -0,0 +1,40 @@
+import bcrypt
+import pytest
+
+from conftest import load_script
+
+migrate = load_script("migrate_passwords")
+
+
+@pytest.fixture
+def db(mongo_db, monkeypatch):
+    monkeypatch.setattr(migrate.database, "get_db", lambda: mongo_db)
+    monkeypatch.setattr(migrate.database, "get_client", lambda: None)
+    monkeypatch.setattr(migrate.database, "close_client", lambda: None)
+    return mongo_db
+
+
+def test_plain_passwords_are_hashed_and_blank_ones_skipped(db, tmp_path, capsys):
+    hashed = bcrypt.hashpw(b"kept", bcrypt.gensalt(4))
+    db.users.insert_many(
+        [
+            {"email": "plain@example.com", "password": "secret"},
+            {"email": "blank@example.com", "password": ""},
+            {"email": "none@example.com"},
+            {"email": "hashed@example.com", "password": hashed},
+        ]
+    )
+
+    assert migrate.migrate_passwords(
+        workers=1, checkpoint_path=str(tmp_path / "checkpoint"), assume_yes=True
+    )
+
+    users = {user["email"]: user for user in db.users.find()}
+    assert bcrypt.checkpw(b"secret", users["plain@example.com"]["password"])
+    # A hashed blank password would let anyone log in with an empty one
+    assert users["blank@example.com"]["password"] == ""
+    assert "password" not in users["none@example.com"]
+    assert users["hashed@example.com"]["password"] == hashed
+    output = capsys.readouterr().out
+    assert "1 passwords hashed" in output
+    assert "2 users skipped without a password" in output
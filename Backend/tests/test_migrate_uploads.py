@@ -0,0 +1,78 @@
+import datetime
+
+import pytest
+from pymongo import UpdateOne
+
+from conftest import load_script
+from result_cache import content_hash
+from uploads import storage_key
+
+migrate = load_script("migrate_uploads")
+
+JPEG_BYTES = b"\xff\xd8\xff\xe0" + b"\x00" * 64
+
+
+@pytest.fixture
+def db(mongo_db, monkeypatch):
+    monkeypatch.setattr(migrate.database, "get_db", lambda: mongo_db)
+    monkeypatch.setattr(migrate.database, "close_client", lambda: None)
+    return mongo_db
+
+
+def pre_series_result(name):
+    """A result as stored before uploads had filename or storage_key fields"""
+    return {
+        "user_id": None,
+        "prediction": 0.91,
+        "predicted_class": "PNEUMONIA",
+        "image_path": f"http://localhost:5000/static/uploads/{name}",
+        "created_at": datetime.datetime(2024, 1, 1),
+    }
+
+
+def test_migrates_results_that_only_have_an_image_path(db, tmp_path):
+    (tmp_path / "scan.jpg").write_bytes(JPEG_BYTES)
+    result_id = db.results.insert_one(pre_series_result("scan.jpg")).inserted_id
+
+    assert migrate.migrate_uploads(str(tmp_path))
+
+    key = storage_key(content_hash(JPEG_BYTES), JPEG_BYTES)
+    result = db.results.find_one({"_id": result_id})
+    assert result["storage_key"] == key
+    assert result["image_path"] == f"http://localhost:5000/static/uploads/{key}"
+    assert tmp_path.joinpath(*key.split("/")).read_bytes() == JPEG_BYTES
+    assert not (tmp_path / "scan.jpg").exists()
+
+
+def test_keeps_flat_file_while_a_result_still_refers_to_it(db, tmp_path, monkeypatch):
+    (tmp_path / "scan.jpg").write_bytes(JPEG_BYTES)
+    db.results.insert_one(pre_series_result("scan.jpg"))
+    # An update that matches nothing, as if the result was not re-pointed
+    monkeypatch.setattr(
+        migrate, "UpdateOne", lambda query, update: UpdateOne({"_id": None}, update)
+    )
+
+    assert migrate.migrate_uploads(str(tmp_path))
+
+    assert (tmp_path / "scan.jpg").read_bytes() == JPEG_BYTES
+    assert "storage_key" not in db.results.find_one()
+
+
+def test_only_matches_the_exact_file_name(db, tmp_path):
+    (tmp_path / "scan.jpg").write_bytes(JPEG_BYTES)
+    other_id = db.results.insert_one(pre_series_result("old-scan.jpg")).inserted_id
+
+    assert migrate.migrate_uploads(str(tmp_path))
+
+    assert "storage_key" not in db.results.find_one({"_id": other_id})
+
+
+def test_dry_run_changes_nothing(db, tmp_path):
+    (tmp_path / "scan.jpg").write_bytes(JPEG_BYTES)
+    db.results.insert_one(pre_series_result("scan.jpg"))
+
+    assert migrate.migrate_uploads(str(tmp_path), dry_run=True)
+
+    assert (tmp_path / "scan.jpg").exists()
+    assert "storage_key" not in db.results.find_one()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["scan.jpg"]
@@ -0,0 +1,95 @@
+import os
+
+import pytest
+
+from overlays import (
+    OVERLAY_SIZES,
+    OverlayCache,
+    parse_overlay_request,
+    sign_result_id,
+    verify_result_signature,
+)
+
+SECRET = "test-secret"
+RESULT_ID = "65a1b2c3d4e5f60718293a4b"
+
+
+@pytest.mark.parametrize(
+    "requested, rendered",
+    [("1", 128), ("128", 128), ("129", 384), ("1000", 1024), ("100000", 2048)],
+)
+def test_overlay_sizes_are_rounded_to_a_fixed_set(requested, rendered):
+    size, fmt = parse_overlay_request({"size": requested, "format": "jpg"})
+
+    assert (size, fmt) == (rendered, "jpeg")
+    assert size in OVERLAY_SIZES
+
+
+@pytest.mark.parametrize("requested", ["0", "-5", "big"])
+def test_invalid_overlay_size_is_rejected(requested):
+    with pytest.raises(ValueError):
+        parse_overlay_request({"size": requested})
+
+
+def test_cache_evicts_least_recently_used_overlays(tmp_path):
+    cache = OverlayCache(str(tmp_path), max_bytes=250)
+    cache.put("a", "etag", "png", b"a" * 100)
+    cache.put("b", "etag", "png", b"b" * 100)
+    assert cache.get("a", "etag", "png") is not None
+
+    cache.put("c", "etag", "png", b"c" * 100)
+
+    assert cache.get("b", "etag", "png") is None
+    assert cache.get("a", "etag", "png") == b"a" * 100
+    assert cache.get("c", "etag", "png") == b"c" * 100
+    assert cache.stats()["bytes"] == 200
+    # The evicted result's directory goes with its last file
+    assert not os.path.exists(tmp_path / "b")
+
+
+def test_cache_bound_applies_to_files_left_by_a_previous_run(tmp_path):
+    first = OverlayCache(str(tmp_path), max_bytes=1000)
+    for name in ("a", "b", "c"):
+        first.put(name, "etag", "webp", name.encode() * 100)
+        os.utime(tmp_path / name / "etag.webp", (1, ord(name)))
+
+    second = OverlayCache(str(tmp_path), max_bytes=250)
+
+    assert second.stats() == {
+        "files": 2,
+        "bytes": 200,
+        "max_bytes": 250,
+        "evictions": 1,
+    }
+    assert second.get("a", "etag", "webp") is None
+
+
+def test_signature_is_valid_until_it_expires():
+    signature = sign_result_id(SECRET, RESULT_ID, ttl=60, now=1000)
+
+    assert verify_result_signature(SECRET, RESULT_ID, signature, now=1000)
+    assert verify_result_signature(SECRET, RESULT_ID, signature, now=1000 + 59)
+    assert not verify_result_signature(SECRET, RESULT_ID, signature, now=1000 + 120)
+
+
+def test_urls_signed_in_one_period_are_identical():
+    assert sign_result_id(SECRET, RESULT_ID, ttl=60, now=1201) == sign_result_id(
+        SECRET, RESULT_ID, ttl=60, now=1259
+    )
+
+
+@pytest.mark.parametrize(
+    "tamper",
+    [
+        lambda sig: sig.replace(sig.split(".")[0], "99999999999"),
+        lambda sig: sig.split(".")[1],
+        lambda sig: "",
+    ],
+)
+def test_tampered_signature_is_refused(tamper):
+    signature = sign_result_id(SECRET, RESULT_ID, ttl=60, now=1000)
+
+    assert not verify_result_signature(SECRET, RESULT_ID, tamper(signature), now=1000)
+    assert not verify_result_signature(
+        SECRET, "65a1b2c3d4e5f60718293a4c", signature, now=1000
+    )
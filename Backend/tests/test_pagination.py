@@ -0,0 +1,90 @@
+import datetime
+
+import pytest
+from bson import ObjectId
+
+from pagination import (
+    RESULTS_MAX_PAGE_SIZE,
+    RESULTS_SORT,
+    InvalidQuery,
+    build_results_query,
+    encode_cursor,
+)
+
+USER_ID = ObjectId()
+T0 = datetime.datetime(2025, 3, 1, 12, 0, 0)
+
+
+@pytest.fixture
+def results(mongo_db):
+    """Nine results in three bursts that share a created_at"""
+    docs = []
+    for minute in range(3):
+        for n in range(3):
+            docs.append(
+                {
+                    "_id": ObjectId(),
+                    "user_id": USER_ID,
+                    "predicted_class": "PNEUMONIA" if n % 2 else "NORMAL",
+                    "created_at": T0 + datetime.timedelta(minutes=minute),
+                }
+            )
+    # Another user's results must never show up
+    docs.append({"user_id": ObjectId(), "predicted_class": "NORMAL", "created_at": T0})
+    mongo_db.results.insert_many(docs)
+    return mongo_db.results
+
+
+def fetch_all(collection, args, limit):
+    """Follow next tokens the way /api/results does"""
+    pages = []
+    args = dict(args, limit=str(limit))
+    while True:
+        query, page_limit = build_results_query(USER_ID, args)
+        page = list(collection.find(query).sort(RESULTS_SORT).limit(page_limit + 1))
+        pages.append(page[:page_limit])
+        if len(page) <= page_limit:
+            return pages
+        args["next"] = encode_cursor(page[page_limit - 1])
+
+
+@pytest.mark.parametrize("limit", [1, 2, 4, 9])
+def test_pages_split_ties_on_created_at_without_gaps_or_repeats(results, limit):
+    pages = fetch_all(results, {}, limit)
+
+    seen = [doc["_id"] for page in pages for doc in page]
+    expected = [
+        doc["_id"] for doc in results.find({"user_id": USER_ID}).sort(RESULTS_SORT)
+    ]
+    assert seen == expected
+    assert len(seen) == 9
+    assert all(len(page) == limit for page in pages[:-1])
+
+
+def test_cursor_combines_with_filters(results):
+    pages = fetch_all(results, {"class": "pneumonia", "from": T0.isoformat()}, 1)
+
+    seen = [doc for page in pages for doc in page]
+    assert len(seen) == 3
+    assert all(doc["predicted_class"] == "PNEUMONIA" for doc in seen)
+
+
+def test_timezone_aware_bounds_are_compared_as_utc():
+    query, _ = build_results_query(USER_ID, {"to": "2025-03-01T14:00:00+02:00"})
+
+    assert query["created_at"] == {"$lte": T0}
+
+
+@pytest.mark.parametrize(
+    "args",
+    [{"next": "not-a-token"}, {"limit": "0"}, {"limit": "x"}, {"class": "OTHER"}],
+)
+def test_invalid_arguments_are_rejected(args):
+    with pytest.raises(InvalidQuery):
+        build_results_query(USER_ID, args)
+
+
+def test_page_size_is_capped():
+    _, limit = build_results_query(USER_ID, {"limit": "100000"})
+
+    assert limit == RESULTS_MAX_PAGE_SIZE
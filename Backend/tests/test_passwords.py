@@ -0,0 +1,105 @@
+import threading
+import time
+
+import bcrypt
+import pytest
+
+import passwords
+from passwords import PasswordHasher, PasswordQueueFull, hash_rounds
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_checks_beyond_the_pending_limit_are_rejected(monkeypatch):
+    hasher = PasswordHasher(max_workers=1, max_pending=1, timeout=5, rounds=4)
+    release = threading.Event()
+    monkeypatch.setattr(passwords, "check_password", lambda *args: release.wait(5))
+    hashed = bcrypt.hashpw(b"secret", bcrypt.gensalt(5))
+
+    # One check running and one waiting fill the pool
+    callers = [
+        threading.Thread(target=hasher.check, args=("secret", hashed)) for _ in range(2)
+    ]
+    for caller in callers:
+        caller.start()
+    wait_for(lambda: hasher.stats()["submitted"] == 2)
+
+    with pytest.raises(PasswordQueueFull):
+        hasher.check("secret", hashed)
+    # A saturated pool skips the upgrade rather than waiting for a slot
+    assert hasher.rehash_in_background("secret", hashed, lambda *args: None) is None
+    assert hasher.stats()["rejected"] == 2
+
+    release.set()
+    for caller in callers:
+        caller.join(5)
+    assert hasher.check("secret", hashed)
+    assert hasher.stats()["completed"] == 3
+
+
+def test_hash_at_the_configured_cost_is_not_rehashed():
+    hasher = PasswordHasher(max_workers=1, max_pending=1, rounds=4)
+    hashed = bcrypt.hashpw(b"secret", bcrypt.gensalt(4))
+
+    assert hasher.rehash_in_background("secret", hashed, lambda *args: None) is None
+    assert hasher.stats()["submitted"] == 0
+
+
+def create_user(app_module, email, password, rounds):
+    db = app_module.get_db_connection()
+    hashed = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds))
+    db.users.insert_one({"email": email, "name": "Test", "password": hashed})
+    return db, hashed
+
+
+def login(client, email, password):
+    return client.post("/api/login", json={"email": email, "password": password})
+
+
+def test_login_upgrades_a_hash_with_an_old_cost(app_module, client):
+    rounds = app_module.password_hasher.rounds
+    db, _ = create_user(app_module, "old-cost@example.com", "secret", rounds - 1)
+
+    assert login(client, "old-cost@example.com", "secret").status_code == 200
+
+    wait_for(
+        lambda: hash_rounds(
+            db.users.find_one({"email": "old-cost@example.com"})["password"]
+        )
+        == rounds
+    )
+    assert login(client, "old-cost@example.com", "secret").status_code == 200
+
+
+def test_rehash_does_not_overwrite_a_concurrent_password_change(
+    app_module, client, monkeypatch
+):
+    rounds = app_module.password_hasher.rounds
+    db, _ = create_user(app_module, "changed@example.com", "secret", rounds - 1)
+    hash_password = passwords.hash_password
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_hash(*args):
+        started.set()
+        release.wait(5)
+        return hash_password(*args)
+
+    monkeypatch.setattr(passwords, "hash_password", slow_hash)
+    rehashed = app_module.password_hasher.stats()["rehashed"]
+
+    assert login(client, "changed@example.com", "secret").status_code == 200
+    assert started.wait(5)
+    changed = bcrypt.hashpw(b"new-secret", bcrypt.gensalt(4))
+    db.users.update_one(
+        {"email": "changed@example.com"}, {"$set": {"password": changed}}
+    )
+    release.set()
+
+    wait_for(lambda: app_module.password_hasher.stats()["rehashed"] == rehashed + 1)
+    assert db.users.find_one({"email": "changed@example.com"})["password"] == changed
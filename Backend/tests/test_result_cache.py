@@ -0,0 +1,92 @@
+import numpy as np
+
+from overlays import pack_heatmap
+from result_cache import LRUCache, ResultCache
+
+
+def test_lru_is_bounded_by_total_bytes_and_keeps_recent_entries():
+    cache = LRUCache(max_entries=100, max_bytes=300)
+    cache.put("a", "A", 100)
+    cache.put("b", "B", 100)
+    cache.put("c", "C", 100)
+    assert cache.get("a") == "A"
+
+    cache.put("d", "D", 100)
+
+    assert cache.get("b") is None
+    assert [cache.get(key) for key in "acd"] == ["A", "C", "D"]
+    assert cache.stats()["bytes"] == 300
+    assert cache.stats()["evictions"] == 1
+
+
+def test_lru_replacing_an_entry_updates_its_size():
+    cache = LRUCache(max_entries=100, max_bytes=300)
+    cache.put("a", "A", 200)
+    cache.put("a", "A2", 50)
+    cache.put("b", "B", 200)
+
+    assert cache.get("a") == "A2"
+    assert cache.stats()["bytes"] == 250
+
+
+def test_lru_skips_entries_larger_than_the_bound():
+    cache = LRUCache(max_entries=100, max_bytes=300)
+    cache.put("a", "A", 100)
+
+    cache.put("huge", "H", 301)
+
+    assert cache.get("huge") is None
+    assert cache.get("a") == "A"
+
+
+def test_lru_is_bounded_by_entry_count():
+    cache = LRUCache(max_entries=2, max_bytes=10_000)
+    for key in "abc":
+        cache.put(key, key.upper(), 1)
+
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 2
+
+
+def test_results_are_shared_between_workers_through_mongodb(mongo_db):
+    heatmap = pack_heatmap(np.ones((7, 7)))
+    ResultCache(lambda: mongo_db).put("hash", "v1", 0.9, "PNEUMONIA", heatmap)
+
+    other_worker = ResultCache(lambda: mongo_db)
+    entry = other_worker.get("hash", "v1", with_gradcam=True)
+
+    assert entry["prediction"] == 0.9
+    assert entry["heatmap"] == heatmap
+    assert other_worker.stats()["db_hits"] == 1
+
+
+def test_result_without_heatmap_keeps_the_one_stored_earlier(mongo_db):
+    cache = ResultCache(lambda: mongo_db)
+    heatmap = pack_heatmap(np.ones((7, 7)))
+    cache.put("hash", "v1", 0.9, "PNEUMONIA", heatmap)
+
+    cache.put("hash", "v1", 0.9, "PNEUMONIA")
+
+    assert cache.get("hash", "v1", with_gradcam=True)["heatmap"] == heatmap
+    assert mongo_db.result_cache.find_one()["heatmap"] == heatmap
+
+
+def test_new_model_generation_purges_older_entries(mongo_db):
+    cache = ResultCache(lambda: mongo_db)
+    cache.put("a", "v1", 0.9, "PNEUMONIA")
+    cache.put("b", "v1+tflite-int8", 0.8, "PNEUMONIA")
+    # A variant of the same model belongs to the same generation
+    assert cache.get("a", "v1") is not None
+
+    cache.put("c", "v2", 0.1, "NORMAL")
+
+    assert cache.memory.stats()["entries"] == 1
+    assert [doc["_id"] for doc in mongo_db.result_cache.find()] == ["c:v2"]
+
+
+def test_lookup_with_gradcam_misses_an_entry_without_heatmap(mongo_db):
+    cache = ResultCache(lambda: mongo_db)
+    cache.put("hash", "v1", 0.2, "NORMAL")
+
+    assert cache.get("hash", "v1", with_gradcam=True) is None
+    assert cache.get("hash", "v1")["predicted_class"] == "NORMAL"
@@ -0,0 +1,104 @@
+import datetime
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+
+def write_flat_upload(app_module, name):
+    """Store an X-ray the way uploads were stored before the series"""
+    gradient = np.tile(np.linspace(0, 255, 256, dtype=np.uint8), (256, 1))
+    ok, buffer = cv2.imencode(".jpg", gradient)
+    with open(os.path.join(app_module.UPLOAD_FOLDER, name), "wb") as f:
+        f.write(buffer.tobytes())
+
+
+def pre_series_result(name):
+    """A result with no filename, storage_key or stored heatmap"""
+    return {
+        "user_id": None,
+        "prediction": 0.91,
+        "predicted_class": "PNEUMONIA",
+        "image_path": f"http://localhost:5000/static/uploads/{name}",
+        "created_at": datetime.datetime(2024, 1, 1),
+    }
+
+
+@pytest.fixture
+def old_result(app_module):
+    write_flat_upload(app_module, "old-scan.jpg")
+    db = app_module.get_db_connection()
+    return db.results.insert_one(pre_series_result("old-scan.jpg")).inserted_id
+
+
+def test_image_path_name_locates_pre_series_upload(app_module):
+    path = app_module.result_image_path(pre_series_result("old-scan.jpg"))
+    assert path == os.path.join(app_module.UPLOAD_FOLDER, "old-scan.jpg")
+
+
+@pytest.mark.parametrize(
+    "image_path",
+    [
+        "http://localhost:5000/static/uploads/..",
+        "http://localhost:5000/static/uploads/..%2F..%2Fapp.py",
+        "http://localhost:5000/static/uploads/",
+    ],
+)
+def test_image_path_cannot_leave_upload_folder(app_module, image_path):
+    assert app_module.result_image_path({"image_path": image_path}) is None
+
+
+def test_gradcam_for_pre_series_result(app_module, client, old_result):
+    signature = app_module.sign_result_id(app_module.app.secret_key, old_result)
+
+    response = client.get(f"/api/results/{old_result}/gradcam?sig={signature}")
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["success"] is True
+    assert body["gradcam_image"]
+
+
+def test_signed_overlay_for_pre_series_result(app_module, client, old_result):
+    db = app_module.get_db_connection()
+    db.results.update_one({"_id": old_result}, {"$set": {"user_id": "someone"}})
+    signature = app_module.sign_result_id(app_module.app.secret_key, old_result)
+
+    response = client.get(
+        f"/api/results/{old_result}/overlay?size=128&format=png&sig={signature}"
+    )
+
+    assert response.status_code == 200
+    assert response.mimetype == "image/png"
+    overlay = cv2.imdecode(np.frombuffer(response.data, np.uint8), cv2.IMREAD_COLOR)
+    assert max(overlay.shape[:2]) == 128
+    # The heatmap computed on demand is stored for the next request
+    assert db.results.find_one({"_id": old_result})["gradcam_heatmap"] is not None
+
+
+def test_overlay_without_signature_is_refused(app_module, client, old_result):
+    db = app_module.get_db_connection()
+    db.results.update_one({"_id": old_result}, {"$set": {"user_id": "someone"}})
+
+    response = client.get(f"/api/results/{old_result}/overlay")
+
+    assert response.status_code == 401
+
+
+@pytest.mark.parametrize("endpoint", ["gradcam", "overlay"])
+def test_result_without_owner_needs_a_signature(client, old_result, endpoint):
+    response = client.get(f"/api/results/{old_result}/{endpoint}")
+
+    # Indistinguishable from an id that doesn't exist
+    assert response.status_code == 404
+
+
+def test_expired_signature_is_refused(app_module, client, old_result):
+    signature = app_module.sign_result_id(
+        app_module.app.secret_key, old_result, ttl=60, now=0
+    )
+
+    response = client.get(f"/api/results/{old_result}/overlay?sig={signature}")
+
+    assert response.status_code == 404
@@ -0,0 +1,140 @@
+import time
+import types
+
+import pytest
+from pymongo.errors import AutoReconnect, OperationFailure
+
+import result_writer
+from result_writer import ResultQueueFull, ResultWriter
+
+
+class FlakyResults:
+    """A results collection whose first ``failures`` inserts raise ``error``
+
+    With ``store_first`` the failing inserts still store the documents, as
+    when the connection drops after the server has applied the write.
+    """
+
+    def __init__(self, collection, failures, error=None, store_first=False):
+        self.collection = collection
+        self.failures = failures
+        self.error = error or AutoReconnect("connection reset")
+        self.store_first = store_first
+        self.attempts = 0
+
+    def insert_many(self, documents, ordered=True):
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            if self.store_first:
+                self.collection.insert_many(documents, ordered=ordered)
+            raise self.error
+        return self.collection.insert_many(documents, ordered=ordered)
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Record retry delays instead of sleeping through them"""
+    delays = []
+    monkeypatch.setattr(
+        result_writer,
+        "time",
+        types.SimpleNamespace(monotonic=time.monotonic, sleep=delays.append),
+    )
+    return delays
+
+
+def make_writer(results, **kwargs):
+    db = types.SimpleNamespace(results=results)
+    kwargs.setdefault("interval_ms", 1)
+    return ResultWriter(
+        lambda: db, retry_delay=0.1, retry_max_delay=0.3, drain_timeout=5, **kwargs
+    )
+
+
+def results(count, user_id="user"):
+    return [{"user_id": user_id, "n": n} for n in range(count)]
+
+
+def test_transient_errors_are_retried_with_capped_backoff(mongo_db, sleeps):
+    flaky = FlakyResults(mongo_db.results, failures=4)
+    writer = make_writer(flaky)
+
+    ids = writer.write_many(results(3))
+    assert writer.wait_for_user("user", 5)
+
+    assert sleeps == [0.1, 0.2, 0.3, 0.3]
+    assert sorted(doc["_id"] for doc in mongo_db.results.find()) == sorted(ids)
+    stats = writer.stats()
+    assert stats["retries"] == 4
+    assert stats["written"] == 3
+    assert stats["dropped"] == 0
+    writer.close()
+
+
+def test_retry_after_a_partly_applied_write_stores_each_result_once(mongo_db, sleeps):
+    flaky = FlakyResults(mongo_db.results, failures=1, store_first=True)
+    writer = make_writer(flaky)
+
+    writer.write_many(results(3))
+    assert writer.wait_for_user("user", 5)
+
+    assert mongo_db.results.count_documents({}) == 3
+    assert writer.stats()["written"] == 3
+    assert writer.stats()["dropped"] == 0
+    writer.close()
+
+
+def test_permanent_errors_are_not_retried(mongo_db, sleeps):
+    flaky = FlakyResults(
+        mongo_db.results, failures=1, error=OperationFailure("not authorized")
+    )
+    writer = make_writer(flaky)
+
+    result_id = writer.write({"user_id": "user"})
+    assert writer.wait_for_user("user", 5)
+
+    assert sleeps == []
+    assert writer.get(result_id) is None
+    assert writer.stats()["dropped"] == 1
+    writer.close()
+
+
+def test_results_are_served_until_stored(mongo_db):
+    writer = make_writer(mongo_db.results, interval_ms=60_000)
+
+    result_id = writer.write({"user_id": "user", "prediction": 0.4})
+
+    assert writer.get(result_id)["prediction"] == 0.4
+    assert mongo_db.results.count_documents({}) == 0
+    writer.close()
+
+
+def test_close_drains_queued_results_without_waiting_for_the_batch(mongo_db):
+    writer = make_writer(mongo_db.results, batch_size=1000, interval_ms=60_000)
+    writer.write_many(results(5))
+
+    started = time.monotonic()
+    writer.close()
+
+    assert time.monotonic() - started < 5
+    assert mongo_db.results.count_documents({}) == 5
+    assert writer.pending_count() == 0
+    with pytest.raises(ResultQueueFull):
+        writer.write({"user_id": "user"})
+
+
+def test_close_gives_up_on_retries_after_the_drain_timeout(mongo_db, monkeypatch):
+    flaky = FlakyResults(mongo_db.results, failures=10**6)
+    writer = make_writer(flaky)
+    monkeypatch.setattr(writer, "retry_delay", 0.01)
+    monkeypatch.setattr(writer, "retry_max_delay", 0.01)
+    writer.write_many(results(2))
+
+    started = time.monotonic()
+    writer.close(timeout=0.2)
+
+    assert time.monotonic() - started < 1
+    # The writer thread gives up at its next retry after the deadline
+    assert writer.wait_for_user("user", 1)
+    assert writer.stats()["dropped"] == 2
+    assert mongo_db.results.count_documents({}) == 0
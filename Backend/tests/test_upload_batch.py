@@ -0,0 +1,74 @@
+import io
+import json
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+def xray_file(name, shade):
+    image = np.full((64, 64), shade, dtype=np.uint8)
+    ok, buffer = cv2.imencode(".png", image)
+    return (io.BytesIO(buffer.tobytes()), name)
+
+
+def post_batch(client, files):
+    return client.post(
+        "/api/upload/batch",
+        data={"xray": files},
+        content_type="multipart/form-data",
+    )
+
+
+def test_batch_with_too_many_files_is_refused(app_module, client, monkeypatch):
+    monkeypatch.setattr(app_module, "BATCH_UPLOAD_MAX_FILES", 2)
+
+    response = post_batch(client, [xray_file(f"{i}.png", i) for i in range(3)])
+
+    assert response.status_code == 413
+
+
+def test_oversized_batch_is_refused_before_parsing(app_module, client, monkeypatch):
+    monkeypatch.setattr(app_module, "BATCH_UPLOAD_MAX_BYTES", 256)
+    parsed = []
+    monkeypatch.setattr(app_module, "read_upload", parsed.append)
+
+    response = post_batch(client, [xray_file("big.png", 7)])
+
+    assert response.status_code == 413
+    assert parsed == []
+
+
+def test_batch_files_are_read_as_slots_free_up(app_module, client, monkeypatch):
+    monkeypatch.setattr(app_module, "BATCH_UPLOAD_IN_FLIGHT", 2)
+    read_upload = app_module.read_upload
+    process_batch_file = app_module.process_batch_file
+    lock = threading.Lock()
+    held = []
+
+    def counting_read(file):
+        with lock:
+            held.append(1)
+            # Uploads read but not yet analysed
+            assert len(held) <= 2
+        return read_upload(file)
+
+    def slow_process(*args, **kwargs):
+        time.sleep(0.05)
+        try:
+            return process_batch_file(*args, **kwargs)
+        finally:
+            with lock:
+                held.pop()
+
+    monkeypatch.setattr(app_module, "read_upload", counting_read)
+    monkeypatch.setattr(app_module, "process_batch_file", slow_process)
+
+    response = post_batch(client, [xray_file(f"{i}.png", 40 + i) for i in range(5)])
+
+    lines = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert response.status_code == 200
+    assert sorted(line["index"] for line in lines[:-1]) == [0, 1, 2, 3, 4]
+    assert all(line["success"] for line in lines[:-1])
+    assert lines[-1]["succeeded"] == 5
@@ -0,0 +1,331 @@
+import datetime
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+import tensorflow as tf
+
+from model_registry import INFERENCE_BATCH_BUCKETS, run_in_buckets
+
+# tf.lite.Interpreter is being replaced by LiteRT; use it when installed
+try:
+    from ai_edge_litert.interpreter import Interpreter
+except ImportError:
+    Interpreter = tf.lite.Interpreter
+
+# ----------------------------
+# TFLite Backend Settings
+# ----------------------------
+TFLITE_DIR = os.environ.get("TFLITE_DIR", "models/tflite")
+TFLITE_VARIANTS = ("float16", "int8")
+TFLITE_NUM_THREADS = int(os.environ.get("TFLITE_NUM_THREADS", str(os.cpu_count() or 1)))
+TFLITE_REFERENCE_DIR = os.environ.get("TFLITE_REFERENCE_DIR", "reference_images")
+TFLITE_REFERENCE_LIMIT = int(os.environ.get("TFLITE_REFERENCE_LIMIT", "64"))
+# A variant is refused if any reference image's score moves by more than
+# this, or if its heatmap differs by more than the heatmap limit on average
+TFLITE_MAX_SCORE_DIFF = float(os.environ.get("TFLITE_MAX_SCORE_DIFF", "0.02"))
+TFLITE_MAX_HEATMAP_DIFF = float(os.environ.get("TFLITE_MAX_HEATMAP_DIFF", "0.15"))
+# Re-run the parity check on this machine before activating a variant
+TFLITE_VERIFY_ON_LOAD = os.environ.get("TFLITE_VERIFY_ON_LOAD", "true") == "true"
+
+REFERENCE_IMAGE_EXTENSIONS = (
+    ".png",
+    ".jpg",
+    ".jpeg",
+    ".bmp",
+    ".tif",
+    ".tiff",
+    ".dcm",
+)
+
+
+class VariantRejected(Exception):
+    """Raised when a TFLite variant is missing, stale or failed its parity check"""
+
+
+def backend_name(variant):
+    return f"tflite-{variant}"
+
+
+def variant_paths(directory, model_version, variant):
+    """Files of one exported variant; names carry the Keras model version"""
+    prefix = os.path.join(directory, f"{model_version}.{variant}")
+    return {
+        "predict": f"{prefix}.predict.tflite",
+        "gradcam": f"{prefix}.gradcam.tflite",
+        "manifest": f"{prefix}.json",
+    }
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def convert_variant(loaded_model, variant):
+    """Convert the prediction and Grad-CAM functions of a LoadedModel
+
+    ``float16`` stores weights as float16; ``int8`` uses dynamic-range
+    quantization (int8 weights, float activations), which needs no
+    calibration data. Returns {"predict": bytes, "gradcam": bytes}.
+    """
+    if variant not in TFLITE_VARIANTS:
+        raise ValueError(f"Unknown TFLite variant: {variant}")
+
+    # The converter freezes the variables of this object into the flatbuffer;
+    # Keras 3 variables have to be passed as the tf.Variables they wrap.
+    weights = tf.Module()
+    weights.variables_ = [getattr(v, "value", v) for v in loaded_model.model.variables]
+
+    converted = {}
+    for kind, fn in (
+        ("predict", loaded_model._predict_fn),
+        ("gradcam", loaded_model._gradcam_fn),
+    ):
+        converter = tf.lite.TFLiteConverter.from_concrete_functions(
+            [fn.get_concrete_function()], weights
+        )
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        if variant == "float16":
+            converter.target_spec.supported_types = [tf.float16]
+        converted[kind] = converter.convert()
+    return converted
+
+
+class TFLiteModel:
+    """A TFLite variant with the same inference interface as LoadedModel
+
+    Like the Keras model, batches are padded to the configured buckets, with
+    one interpreter per bucket since resizing the input means re-allocating
+    every tensor. Interpreters are not thread-safe, so calls are serialized;
+    the inference batcher only uses one thread anyway.
+    """
+
+    def __init__(
+        self,
+        paths,
+        base_version,
+        variant,
+        num_threads=TFLITE_NUM_THREADS,
+        batch_buckets=INFERENCE_BATCH_BUCKETS,
+    ):
+        self.paths = paths
+        self.variant = variant
+        self.backend = backend_name(variant)
+        self.base_version = base_version
+        # Results from a variant must not be served from cache as if they came
+        # from the Keras model
+        self.version = f"{base_version}+{self.backend}"
+        self.num_threads = num_threads
+        self.batch_buckets = batch_buckets
+        self.loaded_at = datetime.datetime.utcnow()
+        self._interpreters = {}
+        self._lock = threading.Lock()
+
+    def _interpreter(self, kind, batch_size):
+        key = (kind, batch_size)
+        interpreter = self._interpreters.get(key)
+        if interpreter is None:
+            interpreter = Interpreter(
+                model_path=self.paths[kind], num_threads=self.num_threads
+            )
+            input_detail = interpreter.get_input_details()[0]
+            interpreter.resize_tensor_input(
+                input_detail["index"],
+                [batch_size] + list(input_detail["shape_signature"][1:]),
+            )
+            interpreter.allocate_tensors()
+            self._interpreters[key] = interpreter
+        return interpreter
+
+    def _run_bucket(self, kind, images, bucket):
+        images = np.ascontiguousarray(images, dtype=np.float32)
+        with self._lock:
+            interpreter = self._interpreter(kind, bucket)
+            interpreter.set_tensor(interpreter.get_input_details()[0]["index"], images)
+            interpreter.invoke()
+            # Output order is not guaranteed; scores are 1-D, heatmaps 3-D
+            outputs = {}
+            for detail in interpreter.get_output_details():
+                tensor = interpreter.get_tensor(detail["index"])
+                outputs[tensor.ndim] = tensor.copy()
+        if kind == "predict":
+            return (outputs[1],)
+        return outputs[1], outputs[3]
+
+    def predict(self, images):
+        """Return the pneumonia probability for each image in a batch"""
+        (scores,) = run_in_buckets(
+            lambda chunk, bucket: self._run_bucket("predict", chunk, bucket),
+            images,
+            self.batch_buckets,
+        )
+        return scores
+
+    def predict_with_gradcam(self, images):
+        """Return the probabilities and Grad-CAM heatmaps from one pass"""
+        return run_in_buckets(
+            lambda chunk, bucket: self._run_bucket("gradcam", chunk, bucket),
+            images,
+            self.batch_buckets,
+        )
+
+    def warm_up(self):
+        """Allocate an interpreter for every bucket"""
+        input_shape = Interpreter(model_path=self.paths["predict"]).get_input_details()[
+            0
+        ]["shape_signature"][1:]
+        for bucket in self.batch_buckets:
+            dummy = np.zeros([bucket] + list(input_shape), dtype=np.float32)
+            self.predict(dummy)
+            self.predict_with_gradcam(dummy)
+
+    def info(self):
+        return {
+            "version": self.version,
+            "backend": self.backend,
+            "path": self.paths["predict"],
+            "loaded_at": self.loaded_at.isoformat(),
+        }
+
+
+def load_reference_images(directory=TFLITE_REFERENCE_DIR, limit=TFLITE_REFERENCE_LIMIT):
+    """Return the preprocessed reference set used for parity checks"""
+    from preprocessing import preprocess_chest_xray_batch
+    from uploads import ANALYSIS_DECODE_SIZE, decode_file
+
+    if not os.path.isdir(directory):
+        return np.zeros((0,), dtype=np.float32)
+    names = sorted(
+        name
+        for name in os.listdir(directory)
+        if name.lower().endswith(REFERENCE_IMAGE_EXTENSIONS)
+    )[:limit]
+    images = []
+    for name in names:
+        images.append(
+            decode_file(
+                os.path.join(directory, name),
+                target_size=ANALYSIS_DECODE_SIZE,
+                grayscale=True,
+            )
+        )
+    if not images:
+        return np.zeros((0,), dtype=np.float32)
+    batch, _ = preprocess_chest_xray_batch(images)
+    return batch
+
+
+def check_parity(
+    reference_model,
+    candidate,
+    images,
+    max_score_diff=TFLITE_MAX_SCORE_DIFF,
+    max_heatmap_diff=TFLITE_MAX_HEATMAP_DIFF,
+    batch_size=8,
+):
+    """Compare a candidate's predictions and heatmaps with the reference model
+
+    Returns a report with the largest score difference, the worst per-image
+    mean absolute heatmap difference, the fraction of images whose class
+    agrees, and whether the candidate passed.
+    """
+    if len(images) == 0:
+        raise VariantRejected("No reference images for the parity check")
+
+    score_diffs, heatmap_diffs, agreements = [], [], []
+    for start in range(0, len(images), batch_size):
+        batch = images[start : start + batch_size]
+        ref_scores, ref_heatmaps = reference_model.predict_with_gradcam(batch)
+        scores, heatmaps = candidate.predict_with_gradcam(batch)
+        score_diffs.extend(np.abs(scores - ref_scores))
+        heatmap_diffs.extend(np.abs(heatmaps - ref_heatmaps).mean(axis=(1, 2)))
+        agreements.extend((scores > 0.5) == (ref_scores > 0.5))
+
+    report = {
+        "images": int(len(images)),
+        "max_score_diff": float(np.max(score_diffs)),
+        "mean_score_diff": float(np.mean(score_diffs)),
+        "max_heatmap_diff": float(np.max(heatmap_diffs)),
+        "mean_heatmap_diff": float(np.mean(heatmap_diffs)),
+        "class_agreement": float(np.mean(agreements)),
+        "max_score_diff_allowed": max_score_diff,
+        "max_heatmap_diff_allowed": max_heatmap_diff,
+    }
+    report["passed"] = bool(
+        np.all(np.isfinite(score_diffs))
+        and report["max_score_diff"] <= max_score_diff
+        and report["max_heatmap_diff"] <= max_heatmap_diff
+        and report["class_agreement"] == 1.0
+    )
+    return report
+
+
+def export_variant(loaded_model, variant, images, directory=TFLITE_DIR, **thresholds):
+    """Convert, parity-check and write one variant next to its manifest
+
+    The files are written even when the check fails so the drift can be
+    inspected, but the manifest then marks the variant as not approved and
+    the registry will not activate it.
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = variant_paths(directory, loaded_model.version, variant)
+    converted = convert_variant(loaded_model, variant)
+    for kind, data in converted.items():
+        tmp_path = f"{paths[kind]}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, paths[kind])
+
+    candidate = TFLiteModel(paths, loaded_model.version, variant)
+    report = check_parity(loaded_model, candidate, images, **thresholds)
+    manifest = {
+        "model_version": loaded_model.version,
+        "variant": variant,
+        "approved": report["passed"],
+        "parity": report,
+        "files": {kind: _sha256(paths[kind]) for kind in converted},
+        "sizes": {kind: len(data) for kind, data in converted.items()},
+        "exported_at": datetime.datetime.utcnow().isoformat(),
+    }
+    with open(paths["manifest"], "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def load_variant(loaded_model, variant, directory=TFLITE_DIR, images=None):
+    """Return an activated TFLiteModel for a LoadedModel, or raise VariantRejected
+
+    The variant must have been exported from this exact model version,
+    approved by the export-time parity check and left unmodified since.
+    When reference images are given the check is repeated on this machine.
+    """
+    paths = variant_paths(directory, loaded_model.version, variant)
+    try:
+        with open(paths["manifest"]) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        raise VariantRejected(
+            f"No {variant} export for model version {loaded_model.version}"
+        )
+
+    if not manifest.get("approved"):
+        raise VariantRejected(
+            f"{variant} variant failed its parity check: {manifest.get('parity')}"
+        )
+    for kind, expected in manifest["files"].items():
+        if not os.path.exists(paths[kind]) or _sha256(paths[kind]) != expected:
+            raise VariantRejected(f"{paths[kind]} is missing or was modified")
+
+    candidate = TFLiteModel(paths, loaded_model.version, variant)
+    candidate.warm_up()
+    if images is not None and len(images):
+        report = check_parity(loaded_model, candidate, images)
+        if not report["passed"]:
+            raise VariantRejected(f"{variant} variant drifted on this host: {report}")
+    return candidate
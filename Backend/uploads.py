@@ -0,0 +1,417 @@
+import atexit
+import io
+import os
+import queue
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from dicom_images import (
+    DICOM_SUPPORTED,
+    DicomError,
+    decode_dicom,
+    dicom_metadata,
+    is_dicom,
+    read_header,
+)
+from metrics import metrics
+
+# ----------------------------
+# Upload Settings
+# ----------------------------
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+MAX_IMAGE_DIMENSION = int(os.environ.get("MAX_IMAGE_DIMENSION", "8192"))
+# Uploads are analysed with their longest side shrunk to this many pixels (the
+# model itself sees 224x224), so decoding and preprocessing cost the same
+# whatever the resolution of the upload
+ANALYSIS_DECODE_SIZE = int(os.environ.get("ANALYSIS_DECODE_SIZE", "512"))
+# Uploads are stored as <hash[0:2]>/<hash[2:4]>/<hash>.<ext>; each level of
+# two hex digits splits the files over 256 directories
+UPLOAD_SHARD_LEVELS = int(os.environ.get("UPLOAD_SHARD_LEVELS", "2"))
+# Longest side in pixels of the WebP previews stored next to each upload
+THUMBNAIL_SIZES = tuple(
+    int(size) for size in os.environ.get("THUMBNAIL_SIZES", "128,384").split(",")
+)
+THUMBNAIL_QUALITY = int(os.environ.get("THUMBNAIL_QUALITY", "80"))
+
+# Leading bytes of the formats we accept, mapped to the stored extension
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"BM", ".bmp"),
+    (b"II*\x00", ".tif"),
+    (b"MM\x00*", ".tif"),
+    (b"GIF8", ".gif"),
+)
+
+# libjpeg can decode straight to 1/2, 1/4 or 1/8 scale; (factor, grayscale
+# flag, color flag), largest first
+JPEG_REDUCED_MODES = (
+    (8, cv2.IMREAD_REDUCED_GRAYSCALE_8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_GRAYSCALE_4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_GRAYSCALE_2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+
+UPLOAD_DISK_WRITE_SECONDS = metrics.histogram(
+    "upload_disk_write_seconds", "Time the background writer took to store one upload"
+)
+UPLOAD_DISK_WRITE_ERRORS = metrics.counter(
+    "upload_disk_write_errors", "Uploads the background writer failed to store"
+)
+
+
+class UploadRejected(Exception):
+    """Raised when an upload is not an image we are willing to decode"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+def read_upload(file, max_bytes=MAX_UPLOAD_BYTES):
+    """Read an uploaded file into memory, refusing anything over max_bytes"""
+    data = file.read(max_bytes + 1)
+    if not data:
+        raise UploadRejected("Uploaded file is empty")
+    if len(data) > max_bytes:
+        raise UploadRejected(
+            f"File is larger than {max_bytes // (1024 * 1024)} MB", status_code=413
+        )
+    return data
+
+
+def read_image_size(data):
+    """Return (width, height) from the image header without decoding pixels"""
+    if is_dicom(data):
+        if not DICOM_SUPPORTED:
+            raise UploadRejected(
+                "DICOM uploads are not supported by this server", status_code=415
+            )
+        try:
+            header, _ = read_header(data)
+            return header.Columns, header.Rows
+        except (DicomError, AttributeError):
+            raise UploadRejected("File is not a supported image")
+    try:
+        with Image.open(io.BytesIO(data)) as header:
+            return header.size
+    except Exception:
+        raise UploadRejected("File is not a supported image")
+
+
+def decode_flags(data, width, height, target_size, grayscale):
+    """cv2.imdecode flags for decoding at no less than ``target_size``
+
+    Only JPEGs use the reduced modes: they scale while decoding the DCT
+    blocks, whereas for other formats OpenCV decodes at full size and then
+    shrinks with a linear resize that aliases.
+    """
+    if target_size and data.startswith(b"\xff\xd8\xff"):
+        for factor, gray_flag, color_flag in JPEG_REDUCED_MODES:
+            if max(width, height) // factor >= target_size:
+                return gray_flag if grayscale else color_flag
+    return cv2.IMREAD_GRAYSCALE if grayscale else cv2.IMREAD_COLOR
+
+
+def shrink_to_fit(image, size):
+    """Resize so the longest side is at most ``size``, never enlarging"""
+    height, width = image.shape[:2]
+    scale = size / max(height, width)
+    if scale >= 1.0:
+        return image
+    return cv2.resize(
+        image,
+        (max(1, round(width * scale)), max(1, round(height * scale))),
+        interpolation=cv2.INTER_AREA,
+    )
+
+
+def upload_metadata(data):
+    """Header fields of a DICOM upload (see dicom_metadata), None otherwise"""
+    if not is_dicom(data) or not DICOM_SUPPORTED:
+        return None
+    try:
+        return dicom_metadata(data)
+    except DicomError as e:
+        raise UploadRejected(str(e))
+
+
+def check_image_size(width, height, max_dimension):
+    if width > max_dimension or height > max_dimension:
+        raise UploadRejected(
+            f"Image is {width}x{height}, the maximum is "
+            f"{max_dimension}x{max_dimension}",
+            status_code=413,
+        )
+
+
+def decode_image(
+    data, max_dimension=MAX_IMAGE_DIMENSION, target_size=None, grayscale=False
+):
+    """Validate and decode uploaded bytes into a uint8 image
+
+    Returns RGB, or a 2-D array with ``grayscale``. With ``target_size`` the
+    longest side is shrunk to at most that many pixels, decoding JPEGs at a
+    reduced scale chosen from the header so a large upload is never held at
+    full resolution.
+    """
+    width, height = read_image_size(data)
+    check_image_size(width, height, max_dimension)
+
+    if is_dicom(data):
+        image = _decode_dicom(data, target_size, grayscale)
+    else:
+        flags = decode_flags(data, width, height, target_size, grayscale)
+        image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flags)
+        if image is None:
+            raise UploadRejected("File is not a readable image")
+        if not grayscale:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    if target_size:
+        image = shrink_to_fit(image, target_size)
+    return image
+
+
+def _decode_dicom(source, target_size, grayscale):
+    try:
+        return decode_dicom(source, target_size=target_size, grayscale=grayscale)
+    except DicomError as e:
+        raise UploadRejected(str(e))
+
+
+def decode_file(
+    path, max_dimension=MAX_IMAGE_DIMENSION, target_size=None, grayscale=False
+):
+    """decode_image for a stored file; DICOM pixel data is memory-mapped"""
+    with open(path, "rb") as f:
+        preamble = f.read(132)
+        if not is_dicom(preamble):
+            return decode_image(
+                preamble + f.read(), max_dimension, target_size, grayscale
+            )
+    try:
+        header, _ = read_header(path)
+    except DicomError as e:
+        raise UploadRejected(str(e))
+    check_image_size(header.get("Columns", 0), header.get("Rows", 0), max_dimension)
+    image = _decode_dicom(path, target_size, grayscale)
+    return shrink_to_fit(image, target_size) if target_size else image
+
+
+class UploadWriter:
+    """Writes uploaded bytes to disk from a background thread
+
+    Requests hand over the bytes they already hold in memory and return
+    without waiting on the disk. Until a file has been written, ``read()``
+    serves it from the pending copy so it is never missing for readers.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        atexit.register(self.flush)
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="upload-writer", daemon=True
+                )
+                self._thread.start()
+
+    def write(self, path, data):
+        """Queue bytes to be written to path"""
+        with self._lock:
+            self._pending[path] = data
+        self._ensure_started()
+        self._queue.put((path, data))
+
+    def pending(self, path):
+        """Return the bytes queued for path, or None once they are on disk"""
+        with self._lock:
+            return self._pending.get(path)
+
+    def read(self, path):
+        """Return the bytes for path, whether or not they reached disk yet"""
+        data = self.pending(path)
+        if data is not None:
+            return data
+        with open(path, "rb") as f:
+            return f.read()
+
+    def exists(self, path):
+        """Whether path is on disk or queued to be written"""
+        with self._lock:
+            if path in self._pending:
+                return True
+        return os.path.exists(path)
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    def _run(self):
+        while True:
+            path, data = self._queue.get()
+            try:
+                with UPLOAD_DISK_WRITE_SECONDS.time():
+                    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                    # Write to a temporary file and rename it into place so the
+                    # static file server never serves a half-written upload.
+                    tmp_path = f"{path}.{os.getpid()}.tmp"
+                    with open(tmp_path, "wb") as f:
+                        f.write(data)
+                    os.replace(tmp_path, path)
+            except Exception as e:
+                UPLOAD_DISK_WRITE_ERRORS.inc()
+                print(f"Error writing upload {path}: {str(e)}")
+                traceback.print_exc()
+            finally:
+                with self._lock:
+                    # A newer write to the same path may have replaced it
+                    if self._pending.get(path) is data:
+                        del self._pending[path]
+                self._queue.task_done()
+
+    def flush(self):
+        """Block until every queued file has been written"""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.join()
+
+
+def sniff_extension(data):
+    """Return the file extension matching the image format of ``data``"""
+    for signature, ext in IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return ext
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return ".webp"
+    if is_dicom(data):
+        return ".dcm"
+    return ".bin"
+
+
+def storage_key(image_hash, data, levels=UPLOAD_SHARD_LEVELS):
+    """Relative path of an upload in the content-addressed layout"""
+    shards = [image_hash[i * 2 : i * 2 + 2] for i in range(levels)]
+    return "/".join(shards + [image_hash + sniff_extension(data)])
+
+
+def thumbnail_key(key, size):
+    """Key of a thumbnail, stored next to the original as <hash>.<size>.webp"""
+    return f"{key.rsplit('.', 1)[0]}.{size}.webp"
+
+
+def make_thumbnails(image, sizes, quality=THUMBNAIL_QUALITY):
+    """Encode WebPs whose longest side is at most each size; {size: bytes}
+
+    ``image`` is RGB or 2-D grayscale. Each size is resized from the next
+    larger one, so only the largest thumbnail pays for shrinking the image.
+    """
+    thumbnails = {}
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+    for size in sorted(sizes, reverse=True):
+        image = shrink_to_fit(image, size)
+        ok, buffer = cv2.imencode(".webp", image, [cv2.IMWRITE_WEBP_QUALITY, quality])
+        if not ok:
+            raise ValueError("Could not encode thumbnail")
+        thumbnails[size] = buffer.tobytes()
+    return thumbnails
+
+
+class UploadStore:
+    """Content-addressed upload storage under ``root``
+
+    Files are named after the SHA-256 of their bytes, so two different
+    uploads called image.png can't overwrite each other and identical bytes
+    are stored once. Writes go through an UploadWriter, which writes to a
+    temporary file and renames it into place.
+    """
+
+    def __init__(
+        self,
+        root,
+        writer,
+        levels=UPLOAD_SHARD_LEVELS,
+        thumbnail_sizes=THUMBNAIL_SIZES,
+    ):
+        self.root = root
+        self.writer = writer
+        self.levels = levels
+        self.thumbnail_sizes = thumbnail_sizes
+        self._thumbnail_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="thumbnails"
+        )
+        self._thumbnail_jobs = set()
+        self._lock = threading.Lock()
+        self.deduplicated = 0
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.root, *key.split("/"))
+
+    def put(self, data, image_hash):
+        """Queue ``data`` for storage unless it is already stored; return its key"""
+        key = storage_key(image_hash, data, self.levels)
+        path = self.path(key)
+        if self.writer.exists(path):
+            self.deduplicated += 1
+        else:
+            self.writer.write(path, data)
+        return key
+
+    def read(self, key):
+        return self.writer.read(self.path(key))
+
+    def thumbnail_keys(self, key):
+        """{size: key} of the thumbnails of a stored upload"""
+        return {size: thumbnail_key(key, size) for size in self.thumbnail_sizes}
+
+    def missing_thumbnails(self, key):
+        return [
+            size
+            for size, thumb_key in self.thumbnail_keys(key).items()
+            if not self.writer.exists(self.path(thumb_key))
+        ]
+
+    def put_thumbnails(self, key, image, sizes=None):
+        """Encode and queue the WebP thumbnails of an already decoded upload"""
+        sizes = self.thumbnail_sizes if sizes is None else sizes
+        for size, data in make_thumbnails(image, sizes).items():
+            self.writer.write(self.path(thumbnail_key(key, size)), data)
+
+    def put_thumbnails_async(self, key, image):
+        """Create any missing thumbnails on the thumbnail thread
+
+        The upload's decoded pixels are reused, so no extra decode is
+        needed; WebP encoding takes several milliseconds, which the request
+        doesn't wait for.
+        """
+        sizes = self.missing_thumbnails(key)
+        if not sizes:
+            return None
+        with self._lock:
+            if key in self._thumbnail_jobs:
+                return None
+            self._thumbnail_jobs.add(key)
+
+        def run():
+            try:
+                self.put_thumbnails(key, image, sizes)
+            except Exception as e:
+                print(f"Error creating thumbnails for {key}: {str(e)}")
+                traceback.print_exc()
+            finally:
+                with self._lock:
+                    self._thumbnail_jobs.discard(key)
+
+        return self._thumbnail_executor.submit(run)
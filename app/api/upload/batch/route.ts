@@ -0,0 +1,38 @@
+import { type NextRequest, NextResponse } from "next/server";
+
+export async function POST(request: NextRequest) {
+  try {
+    // Get the form data from the request
+    const formData = await request.formData();
+
+    // Forward the request to the Flask server
+    const startedAt = performance.now();
+    const response = await fetch("http://127.0.0.1:5000/api/upload/batch", {
+      method: "POST",
+      body: formData,
+    });
+    const proxy = `proxy;dur=${(performance.now() - startedAt).toFixed(2)}`;
+    const upstream = response.headers.get("Server-Timing");
+    const headers = { "Server-Timing": upstream ? `${upstream}, ${proxy}` : proxy };
+
+    // Limit and validation errors are JSON, passed on with their status
+    if (!response.ok || !response.body) {
+      const data = await response
+        .json()
+        .catch(() => ({ error: "Error from Flask server" }));
+      return NextResponse.json(data, { status: response.status, headers });
+    }
+
+    // Results are streamed one NDJSON line per file; pass them through as
+    // they arrive instead of buffering the whole batch
+    return new Response(response.body, {
+      headers: { ...headers, "Content-Type": "application/x-ndjson" },
+    });
+  } catch (error) {
+    console.error("API route error:", error);
+    return NextResponse.json(
+      { error: "Flask server is not available" },
+      { status: 502 }
+    );
+  }
+}
@@ -1,11 +1,20 @@
 import { type NextRequest, NextResponse } from "next/server";
 
+// Pass Flask's per-stage Server-Timing entries on to the browser, adding the
+// time this proxy spent waiting for Flask
+function serverTimingHeaders(response: Response, startedAt: number) {
+  const proxy = `proxy;dur=${(performance.now() - startedAt).toFixed(2)}`;
+  const upstream = response.headers.get("Server-Timing");
+  return { "Server-Timing": upstream ? `${upstream}, ${proxy}` : proxy };
+}
+
 export async function POST(request: NextRequest) {
   try {
     // Get the form data from the request
     const formData = await request.formData();
 
     // Forward the request to the Flask server
+    const startedAt = performance.now();
     const response = await fetch("http://127.0.0.1:5000/api/upload", {
       method: "POST",
       body: formData,
@@ -17,13 +26,18 @@ export async function POST(request: NextRequest) {
       console.error("Flask server error:", errorText);
       return NextResponse.json(
         { success: false, message: "Error from Flask server" },
-        { status: response.status }
+        {
+          status: response.status,
+          headers: serverTimingHeaders(response, startedAt),
+        }
       );
     }
 
     // Return the response from the Flask server
     const data = await response.json();
-    return NextResponse.json(data);
+    return NextResponse.json(data, {
+      headers: serverTimingHeaders(response, startedAt),
+    });
   } catch (error) {
     console.error("API route error:", error);
 
@@ -7,11 +7,16 @@ import { FileUp, Loader2, Upload, X, Eye, Check } from "lucide-react"
 import { Button } from "@/components/ui/button"
 import { Card, CardContent, CardDescription, CardFooter, CardHeader, CardTitle } from "@/components/ui/card"
 import { useToast } from "@/components/ui/use-toast"
-import { uploadXRay } from "@/lib/api-service"
+import { uploadXRayBatch } from "@/lib/api-service"
 import { Progress } from "@/components/ui/progress"
 import { Switch } from "@/components/ui/switch"
 import { Label } from "@/components/ui/label"
 import { Tooltip, TooltipContent, TooltipProvider, TooltipTrigger } from "@/components/ui/tooltip"
+import { XRAY_FILE_ACCEPT, isDicomFile, isXRayFile } from "@/lib/utils"
+
+// Files sent per /api/upload/batch request; matches BATCH_UPLOAD_MAX_FILES
+// in the backend
+const BATCH_REQUEST_MAX_FILES = 32
 
 interface BatchResult {
   file: File
@@ -30,12 +35,12 @@ export function BatchUploadPanel() {
 
   const handleFileInput = (e: React.ChangeEvent<HTMLInputElement>) => {
     if (e.target.files && e.target.files.length > 0) {
-      const newFiles = Array.from(e.target.files).filter((file) => file.type.match("image.*"))
+      const newFiles = Array.from(e.target.files).filter(isXRayFile)
 
       if (newFiles.length === 0) {
         toast({
           title: "Invalid file type",
-          description: "Please select image files only (JPEG, PNG, etc.)",
+          description: "Please select image or DICOM files only (JPEG, PNG, DICOM, etc.)",
           variant: "destructive",
         })
         return
@@ -47,7 +52,8 @@ export function BatchUploadPanel() {
       const newResults: BatchResult[] = newFiles.map((file) => {
         return {
           file,
-          preview: URL.createObjectURL(file),
+          // DICOM can't be previewed until the server returns its thumbnail
+          preview: isDicomFile(file) ? "" : URL.createObjectURL(file),
           status: "pending",
         }
       })
@@ -67,56 +73,66 @@ export function BatchUploadPanel() {
     setIsUploading(true)
     setProgress(0)
 
-    let completed = 0
+    // Files analyzed by an earlier run are not sent again
+    const pending = batchResults.flatMap((result, i) => (result.status === "success" ? [] : [i]))
+    let completed = selectedFiles.length - pending.length
+    let succeeded = completed
 
-    // Process files sequentially to avoid overwhelming the server
-    for (let i = 0; i < selectedFiles.length; i++) {
-      if (batchResults[i].status === "success") {
-        completed++
-        continue
-      }
+    setBatchResults((prev) =>
+      prev.map((r, i): BatchResult => (pending.includes(i) ? { ...r, status: "processing" } : r)),
+    )
 
-      // Update status to processing
+    const finish = (i: number, result?: any) => {
       setBatchResults((prev) => {
         const updated = [...prev]
-        updated[i] = { ...updated[i], status: "processing" }
+        updated[i] = result
+          ? {
+              ...updated[i],
+              status: "success",
+              preview: updated[i].preview || result.thumbnails?.["384"] || "",
+              result,
+            }
+          : { ...updated[i], status: "error" }
         return updated
       })
 
-      try {
-        const result = await uploadXRay(selectedFiles[i], useGradcam)
-
-        // Update with result
-        setBatchResults((prev) => {
-          const updated = [...prev]
-          updated[i] = {
-            ...updated[i],
-            status: "success",
-            result,
-          }
-          return updated
-        })
-
+      if (result) {
+        succeeded++
         // Save to report history
-        saveToReportHistory(result, batchResults[i].preview)
-      } catch (error) {
-        // Update with error
-        setBatchResults((prev) => {
-          const updated = [...prev]
-          updated[i] = { ...updated[i], status: "error" }
-          return updated
-        })
+        saveToReportHistory(result, batchResults[i].preview || result.thumbnails?.["384"] || "")
       }
 
       completed++
       setProgress(Math.round((completed / selectedFiles.length) * 100))
     }
 
+    // The server analyzes the files of a request in parallel and streams
+    // each result back as soon as it is ready
+    for (let start = 0; start < pending.length; start += BATCH_REQUEST_MAX_FILES) {
+      const chunk = pending.slice(start, start + BATCH_REQUEST_MAX_FILES)
+      const reported = new Set<number>()
+      try {
+        await uploadXRayBatch(
+          chunk.map((i) => selectedFiles[i]),
+          useGradcam,
+          (line) => {
+            const i = chunk[line.index]
+            reported.add(i)
+            finish(i, line.success ? line : undefined)
+          },
+        )
+      } catch (error) {
+        console.error("Batch upload error:", error)
+      }
+      // Files the server never reported on were lost with the request
+      chunk.filter((i) => !reported.has(i)).forEach((i) => finish(i))
+    }
+
     setIsUploading(false)
 
     toast({
       title: "Batch processing complete",
-      description: `Successfully processed ${batchResults.filter((r) => r.status === "success").length} of ${selectedFiles.length} images`,
+      description: `Successfully processed ${succeeded} of ${selectedFiles.length} images`,
     })
   }
 
@@ -164,7 +180,7 @@ export function BatchUploadPanel() {
               id="batch-file-upload"
               className="hidden"
               onChange={handleFileInput}
-              accept="image/*"
+              accept={XRAY_FILE_ACCEPT}
               multiple
             />
 
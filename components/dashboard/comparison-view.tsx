@@ -30,6 +30,7 @@ import {
   SelectTrigger,
   SelectValue,
 } from "@/components/ui/select";
+import { gradcamSrc } from "@/lib/utils";
 
 interface ComparisonItem {
   id: string;
@@ -64,9 +65,7 @@ export function ComparisonView() {
           id: report.id,
           date: new Date(report.date).toLocaleDateString(),
           image: report.image,
-          gradcamImage: report.results.gradcam_image
-            ? `data:image/jpeg;base64,${report.results.gradcam_image}`
-            : undefined,
+          gradcamImage: gradcamSrc(report.results) ?? undefined,
           results: report.results,
         }));
 
@@ -11,6 +11,7 @@ import { Table, TableBody, TableCell, TableHead, TableHeader, TableRow } from "@
 import { Badge } from "@/components/ui/badge"
 import { DropdownMenu, DropdownMenuContent, DropdownMenuItem, DropdownMenuTrigger } from "@/components/ui/dropdown-menu"
 import { generatePdfReport } from "@/lib/report-generator"
+import { gradcamSrc } from "@/lib/utils"
 
 interface PatientRecord {
   id: string
@@ -101,7 +102,7 @@ export function PatientHistory() {
           confidence: (predictionScore * 100).toFixed(1) + "%",
         },
         imageUrl: record.image,
-        heatmapUrl: record.results.gradcam_image ? `data:image/jpeg;base64,${record.results.gradcam_image}` : null,
+        heatmapUrl: gradcamSrc(record.results),
       })
     } catch (error) {
       console.error("Failed to generate report:", error)
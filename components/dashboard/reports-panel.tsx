@@ -10,6 +10,7 @@ import { Input } from "@/components/ui/input"
 import { Table, TableBody, TableCell, TableHead, TableHeader, TableRow } from "@/components/ui/table"
 import { Badge } from "@/components/ui/badge"
 import { generatePdfReport } from "@/lib/report-generator"
+import { gradcamSrc } from "@/lib/utils"
 import { Modal, ModalContent, ModalHeader, ModalTitle, ModalDescription, ModalFooter } from "@/components/ui/modal"
 import { Label } from "@/components/ui/label"
 import { useToast } from "@/components/ui/use-toast"
@@ -94,7 +95,7 @@ export function ReportsPanel() {
           confidence: (predictionScore * 100).toFixed(1) + "%",
         },
         imageUrl: report.image,
-        heatmapUrl: report.results.gradcam_image ? `data:image/jpeg;base64,${report.results.gradcam_image}` : null,
+        heatmapUrl: gradcamSrc(report.results),
       })
     } catch (error) {
       console.error("Failed to generate report:", error)
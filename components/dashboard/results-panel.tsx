@@ -30,6 +30,7 @@ import { Alert, AlertDescription, AlertTitle } from "@/components/ui/alert";
 import { PredictionGauge } from "@/components/dashboard/clinical-components";
 import { ClinicalInterpretation } from "@/components/dashboard/clinical-components";
 import { generatePdfReport } from "@/lib/report-generator";
+import { gradcamSrc } from "@/lib/utils";
 import {
   Modal,
   ModalContent,
@@ -221,9 +222,7 @@ export function ResultsPanel() {
           confidence: (predictionScore * 100).toFixed(1) + "%",
         },
         imageUrl: uploadedImage,
-        heatmapUrl: results.gradcam_image
-          ? `data:image/jpeg;base64,${results.gradcam_image}`
-          : null,
+        heatmapUrl: gradcamSrc(results),
         aiReport: aiReport,
       });
 
@@ -344,11 +343,11 @@ export function ResultsPanel() {
                 className="max-h-full max-w-full object-contain transition-transform"
                 style={{ transform: `scale(${zoomLevel})` }}
               />
-              {showHeatmap && results && results.gradcam_image && (
+              {showHeatmap && gradcamSrc(results) && (
                 <div
                   className="absolute inset-0 flex items-center justify-center"
                   style={{
-                    backgroundImage: `url(data:image/jpeg;base64,${results.gradcam_image})`,
+                    backgroundImage: `url(${gradcamSrc(results)})`,
                     backgroundPosition: "center",
                     backgroundSize: "contain",
                     backgroundRepeat: "no-repeat",
@@ -12,6 +12,7 @@ import { uploadXRay } from "@/lib/api-service"
 import { Switch } from "@/components/ui/switch"
 import { Label } from "@/components/ui/label"
 import { Tooltip, TooltipContent, TooltipProvider, TooltipTrigger } from "@/components/ui/tooltip"
+import { XRAY_FILE_ACCEPT, isDicomFile, isXRayFile } from "@/lib/utils"
 
 export function UploadPanel() {
   const [isDragging, setIsDragging] = useState(false)
@@ -50,11 +51,11 @@ export function UploadPanel() {
   }
 
   const handleFile = (file: File) => {
-    // Check if file is an image
-    if (!file.type.match("image.*")) {
+    // Check if file is an image or DICOM study
+    if (!isXRayFile(file)) {
       toast({
         title: "Invalid file type",
-        description: "Please select an image file (JPEG, PNG, etc.)",
+        description: "Please select an image or DICOM file (JPEG, PNG, DICOM, etc.)",
         variant: "destructive",
       })
       return
@@ -62,6 +63,13 @@ export function UploadPanel() {
 
     setSelectedFile(file)
 
+    // Browsers can't display DICOM; its preview is the thumbnail the server
+    // returns after the upload
+    if (isDicomFile(file)) {
+      setPreview(null)
+      return
+    }
+
     // Create preview
     const reader = new FileReader()
     reader.onload = () => {
@@ -87,7 +95,7 @@ export function UploadPanel() {
       if (data.success !== false) {
         // Store the results in localStorage for demo purposes
         localStorage.setItem("analysisResults", JSON.stringify(data))
-        localStorage.setItem("uploadedImage", preview || "")
+        localStorage.setItem("uploadedImage", preview || data.thumbnails?.["384"] || "")
 
         // Redirect to results page
         router.push("/dashboard/results")
@@ -125,7 +133,7 @@ export function UploadPanel() {
             onDragLeave={handleDragLeave}
             onDrop={handleDrop}
           >
-            <input type="file" id="file-upload" className="hidden" onChange={handleFileInput} accept="image/*" />
+            <input type="file" id="file-upload" className="hidden" onChange={handleFileInput} accept={XRAY_FILE_ACCEPT} />
 
             <div className="flex flex-col items-center justify-center space-y-4">
               <div className="h-16 w-16 rounded-full bg-primary/20 flex items-center justify-center">
@@ -256,6 +256,54 @@ export async function uploadXRay(file: File, useGradcam = true) {
   }
 }
 
+/**
+ * Analyze several X-rays in one request. The server streams one NDJSON line
+ * per file as it finishes, in completion order; each is passed to onResult
+ * and the closing summary line is returned.
+ */
+export async function uploadXRayBatch(
+  files: File[],
+  useGradcam: boolean,
+  onResult: (result: any) => void
+) {
+  const formData = new FormData();
+  files.forEach((file) => formData.append("xray", file));
+  formData.append("use_gradcam", useGradcam.toString());
+
+  const response = await fetch("/api/upload/batch", {
+    method: "POST",
+    body: formData,
+    credentials: "include",
+  });
+
+  if (!response.ok || !response.body) {
+    const data = await handleApiResponse(response);
+    throw new Error(data.error || data.message || "Batch upload failed");
+  }
+
+  const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+  let buffered = "";
+  let summary = null;
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+
+    buffered += value;
+    const lines = buffered.split("\n");
+    buffered = lines.pop() ?? "";
+    for (const line of lines) {
+      if (!line.trim()) continue;
+      const parsed = JSON.parse(line);
+      if (parsed.summary) {
+        summary = parsed;
+      } else {
+        onResult(parsed);
+      }
+    }
+  }
+  return summary;
+}
+
 export async function requestPasswordReset(email: string) {
   try {
     const response = await fetch("/api/forgot-password", {
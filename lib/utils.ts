@@ -4,3 +4,23 @@ import { twMerge } from "tailwind-merge"
 export function cn(...inputs: ClassValue[]) {
   return twMerge(clsx(inputs))
 }
+
+// Grad-CAM overlay of an analysis result: a URL served by the backend, or
+// the inline base64 JPEG returned by older versions of the API
+export function gradcamSrc(results?: { gradcam_url?: string | null; gradcam_image?: string | null } | null) {
+  if (results?.gradcam_url) return results.gradcam_url
+  if (results?.gradcam_image) return `data:image/jpeg;base64,${results.gradcam_image}`
+  return null
+}
+
+// Browsers report DICOM files as application/dicom or with no type at all
+export function isDicomFile(file: File) {
+  return file.type === "application/dicom" || file.name.toLowerCase().endsWith(".dcm")
+}
+
+export function isXRayFile(file: File) {
+  return file.type.startsWith("image/") || isDicomFile(file)
+}
+
+// File picker filter for the formats the backend analyses
+export const XRAY_FILE_ACCEPT = "image/*,.dcm,application/dicom"